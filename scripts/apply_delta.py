@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Update a build downloaded from the dev portal to another build of the same
+target, downloading only a binary patch.
+
+    apply_delta.py https://dev.lczero.org/artifacts/download/123/ lc0.exe
+
+This asks the portal for a patch from the local file to artifact 123,
+applies it with `zstd --patch-from` (zstd must be on PATH), checks the
+result and replaces the local file. If the portal is still generating the
+patch, this waits for it for up to a few minutes. If the portal has no
+patch for the local file (e.g. a self-built binary), or it isn't ready in
+time, the whole artifact is downloaded instead. Needs only the standard
+library.
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+# How long to wait for the portal to generate a patch.
+PATCH_TIMEOUT = 300
+
+
+class PatchNotReady(Exception):
+    pass
+
+
+def download(url, path):
+    """Download url to path. Returns the response headers."""
+    with urllib.request.urlopen(url) as response, open(path, "wb") as f:
+        shutil.copyfileobj(response, f)
+        return response.headers
+
+
+def download_patch(url, path):
+    """
+    Download the patch at url to path, waiting while the portal generates
+    it. Returns the response headers.
+    """
+    deadline = time.monotonic() + PATCH_TIMEOUT
+    while True:
+        with urllib.request.urlopen(url) as response:
+            if response.status != 202:
+                with open(path, "wb") as f:
+                    shutil.copyfileobj(response, f)
+                return response.headers
+            retry_after = int(response.headers.get("Retry-After", "5"))
+        if time.monotonic() + retry_after > deadline:
+            raise PatchNotReady
+        print("Waiting for the portal to generate the patch")
+        time.sleep(retry_after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("url", help="download URL of the wanted artifact")
+    parser.add_argument("file", help="local build of the same target")
+    parser.add_argument(
+        "-o", "--output", help="where to write the result (default: FILE)"
+    )
+    args = parser.parse_args()
+
+    output = args.output or args.file
+    url = args.url.rstrip("/") + "/"
+    directory = os.path.dirname(os.path.abspath(output))
+    with tempfile.TemporaryDirectory(dir=directory) as temp_dir:
+        patch = os.path.join(temp_dir, "patch.zst")
+        result = os.path.join(temp_dir, "result")
+        try:
+            headers = download_patch(
+                f"{url}delta/{hash_file(args.file)}/", patch
+            )
+        except urllib.error.HTTPError as e:
+            if e.code not in (400, 404):
+                raise
+            headers = None
+        except PatchNotReady:
+            headers = None
+        if headers is None:
+            print("No patch available, downloading the whole file")
+            download(url, result)
+        else:
+            subprocess.run(
+                [
+                    "zstd",
+                    "--quiet",
+                    "--decompress",
+                    "--long=31",
+                    f"--patch-from={args.file}",
+                    patch,
+                    "-o",
+                    result,
+                ],
+                check=True,
+            )
+            expected = headers.get("X-Artifact-SHA256")
+            if expected and hash_file(result) != expected:
+                sys.exit("Patched file does not match, keeping the old one")
+            print(
+                f"Downloaded a {os.path.getsize(patch)} byte patch instead of"
+                f" {os.path.getsize(result)} bytes"
+            )
+
+        if os.path.exists(args.file):
+            shutil.copymode(args.file, result)
+        os.replace(result, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,52 @@
 from django.contrib import admin
+from django.db import transaction
 
-from .models import Artifact, Revision, Target
+from .live import publish_revision_changes
+from .matrix import refresh_artifact_maps
+from .models import (
+    Artifact,
+    Blob,
+    JanitorRun,
+    Revision,
+    Target,
+    UploadSession,
+    UploadSlot,
+)
+from .storage import release_artifact_files
+from .table_cache import invalidate_table_cache
 
 
 @admin.register(Target)
 class TargetAdmin(admin.ModelAdmin):
-    list_display = ["id", "name", "created_at"]
+    list_display = ["id", "name", "precompress", "created_at"]
+    list_editable = ["precompress"]
     search_fields = ["id", "name"]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Target names are in the table header.
+        invalidate_table_cache()
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        # Deleting a target deletes its artifacts.
+        artifacts = list(
+            Artifact.objects.filter(target__in=queryset).values_list(
+                "revision_id", "file_path", "blob_id"
+            )
+        )
+        revision_ids = {revision_id for revision_id, _, _ in artifacts}
+        super().delete_queryset(request, queryset)
+        release_artifact_files(
+            (file_path, blob_id) for _, file_path, blob_id in artifacts
+        )
+        refresh_artifact_maps(revision_ids)
+        publish_revision_changes(revision_ids)
+        invalidate_table_cache()
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Target.objects.filter(pk=obj.pk))
+
 
 @admin.register(Revision)
 class RevisionAdmin(admin.ModelAdmin):
@@ -27,13 +66,140 @@ class RevisionAdmin(admin.ModelAdmin):
         "datetime",
     ]
     search_fields = ["commit_hash", "tag_description"]
-    readonly_fields = ["created_at"]
+    readonly_fields = ["created_at", "expires_at"]
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        publish_revision_changes(obj.refresh_expiry())
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        revisions = list(queryset.values_list("pk", "pr_number"))
+        files = list(
+            Artifact.objects.filter(revision__in=queryset).values_list(
+                "file_path", "blob_id"
+            )
+        )
+        super().delete_queryset(request, queryset)
+        release_artifact_files(files)
+        # Deleting the latest revision of a PR changes the expiry of the
+        # others.
+        others = Revision.objects.filter(
+            pr_number__in={pr for _, pr in revisions if pr}
+        )
+        other_ids = list(others.values_list("pk", flat=True))
+        others.update_expiry()
+        publish_revision_changes([pk for pk, _ in revisions] + other_ids)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Revision.objects.filter(pk=obj.pk))
 
 
 @admin.register(Artifact)
 class ArtifactAdmin(admin.ModelAdmin):
-    list_display = ["filename", "revision", "target", "size", "created_at"]
+    list_display = [
+        "filename",
+        "revision",
+        "target",
+        "size",
+        "download_count",
+        "created_at",
+    ]
     list_filter = ["target", "created_at"]
     search_fields = ["filename", "revision__commit_hash"]
-    readonly_fields = ["file_path", "size", "created_at"]
+    readonly_fields = [
+        "file_path",
+        "size",
+        "blob",
+        "download_count",
+        "created_at",
+    ]
     raw_id_fields = ["revision", "target"]
+
+    def save_model(self, request, obj, form, change):
+        # The artifact may have been moved to another revision.
+        revision_ids = {obj.revision_id}
+        if change:
+            revision_ids.update(
+                Artifact.objects.filter(pk=obj.pk).values_list(
+                    "revision_id", flat=True
+                )
+            )
+        super().save_model(request, obj, form, change)
+        refresh_artifact_maps(revision_ids)
+        publish_revision_changes(revision_ids)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        artifacts = list(
+            queryset.values_list("revision_id", "file_path", "blob_id")
+        )
+        revision_ids = {revision_id for revision_id, _, _ in artifacts}
+        super().delete_queryset(request, queryset)
+        release_artifact_files(
+            (file_path, blob_id) for _, file_path, blob_id in artifacts
+        )
+        refresh_artifact_maps(revision_ids)
+        publish_revision_changes(revision_ids)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Artifact.objects.filter(pk=obj.pk))
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ["sha256", "size", "created_at"]
+    search_fields = ["sha256"]
+    readonly_fields = ["sha256", "size", "created_at"]
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "filename",
+        "commit_hash",
+        "target_id",
+        "size",
+        "created_at",
+        "expires_at",
+    ]
+    search_fields = ["id", "filename", "commit_hash"]
+    readonly_fields = ["created_at"]
+
+
+@admin.register(UploadSlot)
+class UploadSlotAdmin(admin.ModelAdmin):
+    list_display = ["token_key", "size", "acquired_at", "expires_at"]
+    readonly_fields = ["acquired_at"]
+
+
+@admin.register(JanitorRun)
+class JanitorRunAdmin(admin.ModelAdmin):
+    list_display = [
+        "pk",
+        "status",
+        "is_active",
+        "requested_by",
+        "revisions_deleted",
+        "artifacts_deleted",
+        "bytes_freed",
+        "created_at",
+        "finished_at",
+    ]
+    list_filter = ["status"]
+    # Clearing is_active unblocks new runs if a worker lost a run.
+    readonly_fields = [
+        "status",
+        "requested_by",
+        "scanned",
+        "revisions_deleted",
+        "artifacts_deleted",
+        "blobs_deleted",
+        "bytes_freed",
+        "errors",
+        "created_at",
+        "updated_at",
+        "started_at",
+        "finished_at",
+    ]
@@ -0,0 +1,168 @@
+"""
+Admission control for uploads.
+
+Every upload holds an UploadSlot row while it runs, so the number of
+concurrent uploads and the bytes in flight can be limited across all worker
+processes, both globally and per upload token. Uploads over the limit are
+turned away with 429 before the view stores anything, instead of queueing
+for a worker (under WSGI before their body is read; ASGI buffers it first).
+All limits are off by default. Slots expire after
+ARTIFACTS_UPLOAD_SLOT_TIMEOUT seconds, so a killed worker can't leak them.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import UploadSlot
+
+# Arbitrary key for pg_advisory_xact_lock(), shared by all workers.
+ADVISORY_LOCK_KEY = 0x6C63305F75706C64
+
+
+@dataclass
+class UploadLimits:
+    max_uploads: int
+    max_bytes: int
+
+
+class UploadRejected(Exception):
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def get_global_limits() -> UploadLimits:
+    return UploadLimits(
+        max_uploads=getattr(settings, "ARTIFACTS_UPLOAD_MAX_CONCURRENT", 0),
+        max_bytes=getattr(settings, "ARTIFACTS_UPLOAD_MAX_INFLIGHT_BYTES", 0),
+    )
+
+
+def get_token_limits() -> UploadLimits:
+    return UploadLimits(
+        max_uploads=getattr(
+            settings, "ARTIFACTS_UPLOAD_MAX_CONCURRENT_PER_TOKEN", 0
+        ),
+        max_bytes=getattr(
+            settings, "ARTIFACTS_UPLOAD_MAX_INFLIGHT_BYTES_PER_TOKEN", 0
+        ),
+    )
+
+
+def get_token_key(token: str) -> str:
+    """
+    Get the key that slots of an upload token are stored under, so that
+    the token itself never ends up in the database.
+    """
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+def lock_upload_slots() -> None:
+    """
+    Serialize admission decisions until the end of the transaction. SQLite
+    serializes writing transactions by itself.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(%s)", [ADVISORY_LOCK_KEY]
+            )
+
+
+def get_occupancy(token_key: str | None = None) -> dict[str, int]:
+    """
+    Get the number of uploads and bytes in flight, globally and for the
+    given token.
+    """
+    token_filter = Q(token_key=token_key)
+    return UploadSlot.objects.filter(expires_at__gte=timezone.now()).aggregate(
+        uploads=Count("id"),
+        bytes=Coalesce(Sum("size"), 0),
+        token_uploads=Count("id", filter=token_filter),
+        token_bytes=Coalesce(Sum("size", filter=token_filter), 0),
+    )
+
+
+def check_limits(
+    scope: str, uploads: int, in_flight: int, size: int, limits: UploadLimits
+) -> None:
+    retry_after = getattr(settings, "ARTIFACTS_UPLOAD_RETRY_AFTER", 15)
+    if limits.max_uploads and uploads >= limits.max_uploads:
+        raise UploadRejected(
+            f"Too many concurrent uploads ({scope} limit:"
+            f" {limits.max_uploads})",
+            retry_after,
+        )
+    # A single upload larger than the byte limit is still let in once
+    # nothing else is in flight, or it could never be uploaded at all.
+    if limits.max_bytes and uploads and in_flight + size > limits.max_bytes:
+        raise UploadRejected(
+            f"Too many bytes in flight ({scope} limit: {limits.max_bytes})",
+            retry_after,
+        )
+
+
+def acquire_upload_slot(token_key: str, size: int) -> UploadSlot:
+    """
+    Take a slot for an upload of the given size, or raise UploadRejected if
+    that would exceed the limits.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        lock_upload_slots()
+        UploadSlot.objects.filter(expires_at__lt=now).delete()
+
+        occupancy = get_occupancy(token_key)
+        check_limits(
+            "global",
+            occupancy["uploads"],
+            occupancy["bytes"],
+            size,
+            get_global_limits(),
+        )
+        check_limits(
+            "per-token",
+            occupancy["token_uploads"],
+            occupancy["token_bytes"],
+            size,
+            get_token_limits(),
+        )
+
+        timeout = getattr(settings, "ARTIFACTS_UPLOAD_SLOT_TIMEOUT", 3600)
+        return UploadSlot.objects.create(
+            token_key=token_key,
+            size=size,
+            expires_at=now + timedelta(seconds=timeout),
+        )
+
+
+def release_upload_slot(slot: UploadSlot) -> None:
+    UploadSlot.objects.filter(pk=slot.pk).delete()
+
+
+def upload_occupancy_status(token_key: str) -> dict[str, Any]:
+    occupancy = get_occupancy(token_key)
+    global_limits = get_global_limits()
+    token_limits = get_token_limits()
+    return {
+        "global": {
+            "uploads": occupancy["uploads"],
+            "bytes": occupancy["bytes"],
+            "max_uploads": global_limits.max_uploads,
+            "max_bytes": global_limits.max_bytes,
+        },
+        "token": {
+            "uploads": occupancy["token_uploads"],
+            "bytes": occupancy["token_bytes"],
+            "max_uploads": token_limits.max_uploads,
+            "max_bytes": token_limits.max_bytes,
+        },
+    }
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ArtifactsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "artifacts"
+
+    def ready(self) -> None:
+        # Register the job handlers.
+        from . import jobs  # noqa: F401
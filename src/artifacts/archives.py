@@ -0,0 +1,82 @@
+import tarfile
+import zipfile
+from collections.abc import Iterator
+from pathlib import PurePosixPath
+from typing import IO
+
+from django.conf import settings
+
+from .uploadhandler import StagedUploadedFile, stage_stream
+from .uploads import BatchEntry
+
+
+def member_filename(name: str) -> str | None:
+    """
+    Get the artifact filename for an archive member. Directories inside the
+    archive are dropped, so "build/lc0.exe" becomes "lc0.exe".
+    """
+    filename = PurePosixPath(name.replace("\\", "/")).name
+    if filename in {"", ".", ".."}:
+        return None
+    return filename
+
+
+def stage_member(name: str, size: int, stream: IO[bytes]) -> BatchEntry:
+    filename = member_filename(name)
+    if filename is None:
+        return BatchEntry(filename=name, error="Invalid filename")
+    if size > settings.ARTIFACTS_MAX_FILE_SIZE:
+        return BatchEntry(
+            filename=filename,
+            error=(
+                "File too large. Maximum size:"
+                f" {settings.ARTIFACTS_MAX_FILE_SIZE} bytes"
+            ),
+        )
+    return BatchEntry(
+        filename=filename, file=stage_stream(stream, size, filename)
+    )
+
+
+def stage_tar_stream(stream: IO[bytes]) -> Iterator[BatchEntry]:
+    """
+    Unpack a (possibly compressed) tar stream on the fly, staging each
+    regular file as it goes by. The stream is only read forward.
+    """
+    try:
+        with tarfile.open(fileobj=stream, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                member_stream = archive.extractfile(member)
+                assert member_stream is not None
+                yield stage_member(member.name, member.size, member_stream)
+    except (tarfile.TarError, EOFError) as e:
+        raise ValueError(f"Invalid tar archive: {str(e)}") from e
+
+
+def stage_zip_file(archive_file: StagedUploadedFile) -> Iterator[BatchEntry]:
+    try:
+        with zipfile.ZipFile(archive_file.staging_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as member_stream:
+                    yield stage_member(
+                        info.filename,
+                        info.file_size,
+                        member_stream,
+                    )
+    except (zipfile.BadZipFile, EOFError) as e:
+        raise ValueError(f"Invalid zip archive: {str(e)}") from e
+
+
+def stage_archive(archive_file: StagedUploadedFile) -> Iterator[BatchEntry]:
+    """
+    Unpack an uploaded tar or zip archive.
+    """
+    if zipfile.is_zipfile(archive_file.staging_path):
+        yield from stage_zip_file(archive_file)
+    else:
+        with open(archive_file.staging_path, "rb") as stream:
+            yield from stage_tar_stream(stream)
@@ -0,0 +1,360 @@
+"""
+Async views for the endpoints that move large amounts of data.
+
+Under ASGI a slow transfer only holds a coroutine instead of a whole worker.
+Blocking file I/O runs in worker threads via asyncio.to_thread(), lookups
+use the async ORM, and the transactional part of storing an upload is
+handed to sync_to_async() as a whole.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBase,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import aget_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import content_disposition_header, http_date
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+
+from .deltas import deltas_available, get_cached_delta, request_delta
+from .downloads import download_counter
+from .models import Artifact, Revision
+from .serving import (
+    file_response,
+    get_artifact_etag,
+    if_range_matches,
+    is_new_download,
+    iter_in_thread,
+    iter_zip,
+    parse_byte_range,
+    x_accel_redirect_response,
+)
+from .uploadhandler import StreamingArtifactUploadHandler, stage_stream
+from .uploads import acreate_revision_and_target, replace_artifact
+from .utils import get_full_file_path
+from .views import (
+    admission_controlled,
+    artifact_response,
+    authenticate_upload_token,
+    file_too_large_response,
+    parse_revision_parameters,
+    parse_upload_parameters,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds a client should wait before asking for a queued patch again.
+DELTA_RETRY_AFTER = 5
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncUploadView(View):
+    """
+    Async counterpart of views.UploadView, with the same request format.
+    """
+
+    @admission_controlled
+    async def post(self, request: HttpRequest) -> JsonResponse:
+        if not authenticate_upload_token(request):
+            return JsonResponse(
+                {"error": "Invalid or missing authorization token"}, status=401
+            )
+
+        # Must be installed before request.FILES is first accessed.
+        upload_handler = StreamingArtifactUploadHandler(request)
+        request.upload_handlers = [upload_handler]
+
+        # Parsing the multipart body streams the file to disk.
+        files = await asyncio.to_thread(lambda: request.FILES)
+        if "file" not in files:
+            if upload_handler.file_too_large:
+                return file_too_large_response()
+            return JsonResponse({"error": "No file provided"}, status=400)
+
+        file_data = files["file"]
+        if isinstance(file_data, list):
+            return JsonResponse(
+                {"error": "Multiple files not supported"}, status=400
+            )
+        uploaded_file: UploadedFile = file_data
+        if uploaded_file.size > settings.ARTIFACTS_MAX_FILE_SIZE:
+            return file_too_large_response()
+
+        try:
+            params = parse_upload_parameters(request)
+        except (KeyError, ValueError) as e:
+            return JsonResponse(
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
+            )
+        return await self.store_artifact(params)
+
+    @admission_controlled
+    async def put(self, request: HttpRequest) -> JsonResponse:
+        if not authenticate_upload_token(request):
+            return JsonResponse(
+                {"error": "Invalid or missing authorization token"}, status=401
+            )
+
+        try:
+            length = int(request.META["CONTENT_LENGTH"])
+        except (KeyError, ValueError):
+            return JsonResponse(
+                {"error": "Content-Length is required"}, status=411
+            )
+        if length > settings.ARTIFACTS_MAX_FILE_SIZE:
+            return file_too_large_response()
+
+        try:
+            params = {
+                "filename": request.GET["filename"],
+                **parse_revision_parameters(request.GET),
+            }
+            params["file"] = await asyncio.to_thread(
+                stage_stream, request, length, params["filename"]
+            )
+        except (KeyError, ValueError) as e:
+            return JsonResponse(
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
+            )
+
+        try:
+            return await self.store_artifact(params)
+        finally:
+            await asyncio.to_thread(params["file"].close)
+
+    async def store_artifact(self, params: dict[str, Any]) -> JsonResponse:
+        try:
+            revision, target = await acreate_revision_and_target(params)
+            artifact = await sync_to_async(replace_artifact)(
+                revision, target, params["filename"], params["file"]
+            )
+
+            logger.info(
+                f"Uploaded artifact: {params['filename']} for"
+                f" {params['commit_hash']} ({params['target_id']})"
+            )
+
+            return artifact_response(artifact)
+
+        except (KeyError, ValueError) as e:
+            return JsonResponse(
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
+            )
+        except Exception as e:
+            logger.error(f"Upload failed: {str(e)}")
+            return JsonResponse(
+                {"error": f"Upload failed: {str(e)}"}, status=500
+            )
+
+
+def set_validators(
+    response: HttpResponseBase, etag: str, last_modified: int
+) -> None:
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+
+
+async def count_download(artifact_id: int) -> None:
+    if download_counter.add(artifact_id):
+        await sync_to_async(download_counter.flush)()
+
+
+@require_safe
+async def download_view(
+    request: HttpRequest, artifact_id: int
+) -> HttpResponseBase:
+    artifact = await aget_object_or_404(
+        Artifact,
+        pk=artifact_id,
+        revision__is_hidden=False,
+    )
+    etag = get_artifact_etag(artifact)
+    last_modified = int(artifact.created_at.timestamp())
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        set_validators(not_modified, etag, last_modified)
+        return not_modified
+
+    range_header = request.headers.get("Range", "")
+    if not if_range_matches(request, etag, last_modified):
+        range_header = ""
+
+    accel_prefix = getattr(settings, "ARTIFACTS_X_ACCEL_REDIRECT_PREFIX", "")
+    if accel_prefix:
+        # nginx handles the range itself; resumed downloads aren't counted.
+        if is_new_download(request, range_header, artifact.size):
+            await count_download(artifact.pk)
+        return x_accel_redirect_response(
+            artifact.file_path, artifact.filename, accel_prefix
+        )
+
+    try:
+        file = await asyncio.to_thread(
+            open, get_full_file_path(artifact.file_path), "rb"
+        )
+    except FileNotFoundError:
+        raise Http404("Artifact file is missing") from None
+
+    size = os.fstat(file.fileno()).st_size
+    try:
+        byte_range = parse_byte_range(range_header, size)
+    except ValueError:
+        file.close()
+        unsatisfiable = HttpResponse(status=416)
+        unsatisfiable["Content-Range"] = f"bytes */{size}"
+        return unsatisfiable
+    if is_new_download(request, range_header, size):
+        await count_download(artifact.pk)
+
+    start, length = byte_range or (0, size)
+    response = file_response(
+        request,
+        file,
+        artifact.filename,
+        start,
+        length,
+        status=206 if byte_range else 200,
+    )
+    if byte_range:
+        response["Content-Range"] = (
+            f"bytes {start}-{start + length - 1}/{size}"
+        )
+    response["Accept-Ranges"] = "bytes"
+    set_validators(response, etag, last_modified)
+    return response
+
+
+@require_safe
+async def delta_download_view(
+    request: HttpRequest, artifact_id: int, base_sha256: str
+) -> HttpResponseBase:
+    """
+    Serve a patch that turns the build with the given digest into this
+    artifact. The base must be a build of the same target. Until the patch
+    is generated, answer 202 with Retry-After.
+    """
+    response: HttpResponseBase
+    artifact = await aget_object_or_404(
+        Artifact,
+        pk=artifact_id,
+        revision__is_hidden=False,
+    )
+    if not deltas_available():
+        return JsonResponse(
+            {"error": "Delta downloads are not available"}, status=404
+        )
+    if artifact.blob_id is None:
+        return JsonResponse(
+            {"error": "No delta available for this artifact"}, status=404
+        )
+    base_exists = await Artifact.objects.filter(
+        target_id=artifact.target_id, blob_id=base_sha256.lower()
+    ).aexists()
+    if not base_exists:
+        return JsonResponse(
+            {"error": "Unknown base build for this target"}, status=404
+        )
+
+    delta_path = await asyncio.to_thread(
+        get_cached_delta, base_sha256.lower(), artifact.blob_id
+    )
+    if delta_path is None:
+        try:
+            await sync_to_async(request_delta)(
+                base_sha256.lower(), artifact.blob_id
+            )
+        except FileNotFoundError:
+            raise Http404("Artifact file is missing") from None
+        response = JsonResponse(
+            {"error": "Delta is being generated"}, status=202
+        )
+        response["Retry-After"] = str(DELTA_RETRY_AFTER)
+        return response
+    if request.method == "GET":
+        await count_download(artifact.pk)
+
+    filename = f"{artifact.filename}.patch.zst"
+    accel_prefix = getattr(settings, "ARTIFACTS_X_ACCEL_REDIRECT_PREFIX", "")
+    if accel_prefix:
+        response = x_accel_redirect_response(
+            delta_path, filename, accel_prefix
+        )
+    else:
+        try:
+            file = await asyncio.to_thread(
+                open, get_full_file_path(delta_path), "rb"
+            )
+        except FileNotFoundError:
+            # Evicted in the meantime.
+            raise Http404("Delta is missing") from None
+        size = os.fstat(file.fileno()).st_size
+        response = file_response(request, file, filename, 0, size)
+    response["X-Artifact-SHA256"] = artifact.blob_id
+    return response
+
+
+@require_safe
+async def revision_zip_view(
+    request: HttpRequest, revision_id: int
+) -> HttpResponseBase:
+    """
+    Stream a ZIP of all artifacts of a revision, or of those for the
+    targets given with ?target=... (repeatable).
+    """
+    revision = await aget_object_or_404(
+        Revision, pk=revision_id, is_hidden=False
+    )
+    artifacts = Artifact.objects.filter(revision=revision).order_by(
+        "target_id", "filename"
+    )
+    target_ids = request.GET.getlist("target")
+    if target_ids:
+        artifacts = artifacts.filter(target_id__in=target_ids)
+    artifact_list = [artifact async for artifact in artifacts]
+    if not artifact_list:
+        return JsonResponse({"error": "No artifacts found"}, status=404)
+
+    if request.method == "GET":
+        for artifact in artifact_list:
+            await count_download(artifact.pk)
+
+    chunks = iter_zip(
+        (
+            f"{artifact.target_id}/{artifact.filename}",
+            get_full_file_path(artifact.file_path),
+        )
+        for artifact in artifact_list
+    )
+    response = StreamingHttpResponse(
+        # See file_response() for why this depends on the handler.
+        iter_in_thread(chunks) if isinstance(request, ASGIRequest) else chunks,
+        content_type="application/zip",
+    )
+    disposition = content_disposition_header(
+        True, f"artifacts-{revision.commit_hash[:8]}.zip"
+    )
+    if disposition:
+        response["Content-Disposition"] = disposition
+    return response
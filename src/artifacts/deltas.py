@@ -0,0 +1,178 @@
+"""
+Binary patches between builds of the same target.
+
+Testers who already have one build of a target can download another one as
+a patch against it instead of the whole file. Patches are made with
+`zstd --patch-from`, so the stock zstd tool (or scripts/apply_delta.py)
+can apply them. Making a patch of a large build takes longer than a request
+may, so the first request only queues an artifacts.delta job, and the patch
+is served once the job has stored it under
+{ARTIFACTS_STORAGE_PATH}/.cache/deltas/, keyed by the digests of both
+blobs. When the cache grows past ARTIFACTS_DELTA_CACHE_SIZE bytes, the
+least recently used patches are evicted, along with temporary files left
+behind by killed jobs. release_blobs() and the janitor delete the patches
+of released blobs.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from core.jobs import enqueue_job
+from core.models import Job
+
+from .storage import DELTAS_DIR, get_blob_path, get_delta_path
+from .utils import get_full_file_path
+
+logger = logging.getLogger(__name__)
+
+# Temporary and lock files older than this belong to a job that died.
+STALE_TEMP_AGE = 3600
+
+
+def deltas_available() -> bool:
+    return shutil.which("zstd") is not None
+
+
+def make_delta(base: Path, target: Path, output: Path) -> None:
+    """
+    Write a patch that turns base into target to output (atomically).
+    """
+    level = getattr(settings, "ARTIFACTS_DELTA_LEVEL", 19)
+    temp_path = output.with_name(f".{output.name}.{uuid.uuid4().hex}")
+    try:
+        subprocess.run(
+            [
+                "zstd",
+                "--quiet",
+                "--force",
+                "--ultra",
+                f"-{level}",
+                f"--patch-from={base}",
+                str(target),
+                "-o",
+                str(temp_path),
+            ],
+            check=True,
+            capture_output=True,
+        )
+        temp_path.replace(output)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def touch(full_path: Path) -> bool:
+    """
+    Mark a cached patch as recently used. Returns whether it exists.
+    """
+    try:
+        os.utime(full_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def evict_deltas(keep: Path | None = None) -> int:
+    """
+    Delete the least recently used patches until the cache fits into
+    ARTIFACTS_DELTA_CACHE_SIZE, and stale temporary files. Returns the
+    number of patches deleted.
+    """
+    max_size = getattr(
+        settings, "ARTIFACTS_DELTA_CACHE_SIZE", 2 * 1024 * 1024 * 1024
+    )
+    stale_before = time.time() - STALE_TEMP_AGE
+    entries = []
+    for path in get_full_file_path(DELTAS_DIR).iterdir():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if path.name.startswith("."):
+            if stat.st_mtime < stale_before:
+                path.unlink(missing_ok=True)
+            continue
+        if path.suffix == ".zst":
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+        evicted += 1
+    return evicted
+
+
+def get_cached_delta(base_sha256: str, target_sha256: str) -> str | None:
+    """
+    Get the file path of the patch from one blob to another, or None if it
+    isn't cached.
+    """
+    delta_path = get_delta_path(base_sha256, target_sha256)
+    if touch(get_full_file_path(delta_path)):
+        return delta_path
+    return None
+
+
+def request_delta(base_sha256: str, target_sha256: str) -> None:
+    """
+    Queue generating the patch from one blob to another, unless it is
+    queued already. Raises FileNotFoundError if a blob is missing.
+    """
+    for sha256 in (base_sha256, target_sha256):
+        if not get_full_file_path(get_blob_path(sha256)).exists():
+            raise FileNotFoundError(f"Blob {sha256}")
+    payload = {"base_sha256": base_sha256, "target_sha256": target_sha256}
+    queued = Job.objects.filter(
+        name="artifacts.delta",
+        status__in=[Job.Status.PENDING, Job.Status.RUNNING],
+        payload=payload,
+    ).exists()
+    if not queued:
+        enqueue_job("artifacts.delta", max_attempts=1, **payload)
+
+
+def generate_delta(base_sha256: str, target_sha256: str) -> str:
+    """
+    Get the file path of the patch from one blob to another, generating it
+    if it isn't cached. Raises FileNotFoundError if a blob is missing.
+    """
+    delta_path = get_delta_path(base_sha256, target_sha256)
+    full_path = get_full_file_path(delta_path)
+    if touch(full_path):
+        return delta_path
+
+    base = get_full_file_path(get_blob_path(base_sha256))
+    target = get_full_file_path(get_blob_path(target_sha256))
+    if not base.exists() or not target.exists():
+        raise FileNotFoundError(f"Blob {base_sha256} or {target_sha256}")
+
+    # Two workers may still pick up the same patch, so only one of them
+    # generates it and the other waits for it.
+    full_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = full_path.with_name(f".{full_path.name}.lock")
+    with open(lock_path, "wb") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not touch(full_path):
+                make_delta(base, target, full_path)
+                logger.info(
+                    f"Generated delta {base_sha256} -> {target_sha256}:"
+                    f" {full_path.stat().st_size} bytes"
+                )
+                evict_deltas(keep=full_path)
+        finally:
+            lock_path.unlink(missing_ok=True)
+    return delta_path
@@ -0,0 +1,97 @@
+"""
+Download counting.
+
+Popular artifacts get downloaded in bursts, and an UPDATE per download would
+turn their rows into a write hotspot. Instead, each process counts downloads
+in memory and adds them to Artifact.download_count in batches: once
+ARTIFACTS_DOWNLOAD_COUNT_FLUSH_SIZE downloads have been buffered or
+ARTIFACTS_DOWNLOAD_COUNT_FLUSH_INTERVAL seconds have passed, and when the
+process exits. Counts buffered in a process that gets killed are lost.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+
+from .matrix import refresh_artifact_maps
+from .models import Artifact
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCounter:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Counter[int] = Counter()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, artifact_id: int) -> bool:
+        """
+        Count a download. Returns whether the buffer is due to be flushed.
+        """
+        flush_size = getattr(
+            settings, "ARTIFACTS_DOWNLOAD_COUNT_FLUSH_SIZE", 100
+        )
+        flush_interval = getattr(
+            settings, "ARTIFACTS_DOWNLOAD_COUNT_FLUSH_INTERVAL", 10
+        )
+        with self._lock:
+            self._counts[artifact_id] += 1
+            self._pending += 1
+            return (
+                self._pending >= flush_size
+                or time.monotonic() - self._last_flush >= flush_interval
+            )
+
+    def flush(self) -> int:
+        """
+        Write the buffered counts to the database, with one UPDATE per
+        distinct increment. Returns the number of downloads written.
+        """
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._pending = 0
+            self._last_flush = time.monotonic()
+        if not counts:
+            return 0
+
+        by_increment: defaultdict[int, list[int]] = defaultdict(list)
+        for artifact_id, increment in counts.items():
+            by_increment[increment].append(artifact_id)
+
+        try:
+            with transaction.atomic():
+                for increment, artifact_ids in by_increment.items():
+                    Artifact.objects.filter(pk__in=artifact_ids).update(
+                        download_count=F("download_count") + increment
+                    )
+        except DatabaseError:
+            logger.exception("Failed to flush download counts")
+            # Keep them for the next attempt.
+            with self._lock:
+                self._counts.update(counts)
+                self._pending += sum(counts.values())
+            return 0
+
+        # Separately, so that the artifact rows aren't locked while waiting
+        # for revision locks (uploads take them the other way around).
+        try:
+            refresh_artifact_maps(
+                Artifact.objects.filter(pk__in=counts).values_list(
+                    "revision_id", flat=True
+                )
+            )
+        except DatabaseError:
+            logger.exception("Failed to refresh artifact maps")
+        return sum(counts.values())
+
+
+download_counter = DownloadCounter()
+atexit.register(download_counter.flush)
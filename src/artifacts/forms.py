@@ -0,0 +1,98 @@
+from datetime import date, datetime, time, timedelta
+
+from django import forms
+from django.db.models import Exists, OuterRef, QuerySet, Value
+from django.utils import timezone
+
+from .models import Artifact, Revision, Target
+
+
+def yes_no_field(label: str) -> forms.TypedChoiceField:
+    return forms.TypedChoiceField(
+        label=label,
+        choices=[("", "Any"), ("1", "Yes"), ("0", "No")],
+        coerce=lambda value: value == "1",
+        empty_value=None,
+        required=False,
+    )
+
+
+def start_of_day(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class RevisionFilterForm(forms.Form):
+    """
+    Filters for the artifacts table and the revisions API, taken from the
+    query string so that filtered views can be linked to.
+    """
+
+    pr = forms.IntegerField(label="PR", min_value=1, required=False)
+    target = forms.ModelMultipleChoiceField(
+        queryset=Target.objects.order_by("id"),
+        to_field_name="id",
+        required=False,
+    )
+    tagged = yes_no_field("Tagged")
+    pinned = yes_no_field("Pinned")
+    scheduled = yes_no_field("Scheduled")
+    date_from = forms.DateField(
+        label="From",
+        required=False,
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+    date_to = forms.DateField(
+        label="To",
+        required=False,
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+
+    def filter(self, revisions: QuerySet[Revision]) -> QuerySet[Revision]:
+        """
+        Apply the valid filters to the revisions. Filters are written so
+        that they can use the indexes on Revision and Artifact.
+        """
+        if not self.is_bound:
+            return revisions
+        self.is_valid()
+        data = self.cleaned_data
+
+        if data.get("pr") is not None:
+            revisions = revisions.filter(pr_number=data["pr"])
+        if data.get("target"):
+            revisions = revisions.filter(
+                Exists(
+                    Artifact.objects.filter(
+                        target__in=data["target"], revision=OuterRef("pk")
+                    )
+                )
+            )
+        if data.get("tagged") is not None:
+            if data["tagged"]:
+                revisions = revisions.exclude(tag_description="")
+            else:
+                revisions = revisions.filter(tag_description="")
+        # Value() for the same reason as in get_visible_revisions().
+        if data.get("pinned") is not None:
+            revisions = revisions.filter(is_pinned=Value(data["pinned"]))
+        if data.get("scheduled") is not None:
+            revisions = revisions.filter(
+                is_scheduled_for_deletion=Value(data["scheduled"])
+            )
+        # Compare against datetimes rather than __date, which would keep
+        # the database from using the index.
+        if data.get("date_from"):
+            revisions = revisions.filter(
+                datetime__gte=start_of_day(data["date_from"])
+            )
+        if data.get("date_to"):
+            revisions = revisions.filter(
+                datetime__lt=start_of_day(data["date_to"] + timedelta(days=1))
+            )
+        return revisions
+
+    def get_target_ids(self) -> list[str]:
+        if not self.is_bound:
+            return []
+        self.is_valid()
+        return [target.id for target in self.cleaned_data.get("target", [])]
@@ -1,8 +1,16 @@
+import base64
+import binascii
 from dataclasses import dataclass
+from datetime import datetime
 from typing import Optional
 
+from django.db.models import Q, QuerySet, Value
+
 from .models import Artifact, Revision, Target
 
+# Cursor: (datetime, id) of a revision in get_visible_revisions() order.
+Cursor = tuple[datetime, int]
+
 
 @dataclass
 class ArtifactsTableRow:
@@ -10,36 +18,133 @@ class ArtifactsTableRow:
     artifacts: list[Optional[Artifact]]
 
 
+@dataclass
+class RevisionPage:
+    revisions: list[Revision]
+    # Cursors for the pages of newer and older revisions, if there are any.
+    newer_cursor: str | None = None
+    older_cursor: str | None = None
+
+
+def get_visible_revisions() -> QuerySet[Revision]:
+    """
+    Revisions shown to users, newest first, with their retention. Their
+    artifacts come from Revision.artifact_map (see matrix.py).
+    """
+    return (
+        Revision.objects
+        .with_retention()
+        # Value() makes this "is_hidden = false". SQLite can't use the
+        # listing index for the "NOT is_hidden" that False compiles to.
+        .filter(is_hidden=Value(False))
+        .order_by("-datetime", "-id")
+    )
+
+
+def encode_cursor(revision: Revision) -> str:
+    raw = f"{revision.datetime.isoformat()}|{revision.pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, pk = raw.decode().split("|")
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor") from None
+
+
+def older_than(cursor: Cursor) -> Q:
+    """
+    Revisions after the cursor in get_visible_revisions() order, as one
+    seek on the listing index.
+    """
+    cursor_datetime, cursor_pk = cursor
+    return Q(datetime__lt=cursor_datetime) | Q(
+        datetime=cursor_datetime, id__lt=cursor_pk
+    )
+
+
+def newer_than(cursor: Cursor) -> Q:
+    cursor_datetime, cursor_pk = cursor
+    return Q(datetime__gt=cursor_datetime) | Q(
+        datetime=cursor_datetime, id__gt=cursor_pk
+    )
+
+
+def paginate_revisions(
+    revisions: QuerySet[Revision],
+    limit: int,
+    after: Cursor | None = None,
+    before: Cursor | None = None,
+) -> RevisionPage:
+    """
+    Get the page of revisions right after (older than) or right before
+    (newer than) a cursor, or the first page. Seeks by (datetime, id), so
+    every page costs the same as the first one.
+    """
+    if before is not None:
+        newer = list(
+            revisions
+            .filter(newer_than(before))
+            .order_by("datetime", "id")[: limit + 1]
+        )
+        page = newer[:limit][::-1]
+        has_newer, has_older = len(newer) > limit, True
+    else:
+        if after is not None:
+            revisions = revisions.filter(older_than(after))
+        older = list(revisions[: limit + 1])
+        page = older[:limit]
+        has_newer, has_older = after is not None, len(older) > limit
+
+    if not page:
+        return RevisionPage(revisions=[])
+    return RevisionPage(
+        revisions=page,
+        newer_cursor=encode_cursor(page[0]) if has_newer else None,
+        older_cursor=encode_cursor(page[-1]) if has_older else None,
+    )
+
+
 def get_artifacts_table_data(
     limit: int = 50,
-) -> tuple[list[Target], list[ArtifactsTableRow]]:
-    revisions = Revision.objects.filter(is_hidden=False).prefetch_related(
-        "artifact_set__target"
-    )[:limit]
+    revisions: QuerySet[Revision] | None = None,
+    target_ids: list[str] | None = None,
+    after: Cursor | None = None,
+    before: Cursor | None = None,
+) -> tuple[list[Target], list[ArtifactsTableRow], RevisionPage]:
+    if revisions is None:
+        revisions = get_visible_revisions()
+    page = paginate_revisions(revisions, limit, after=after, before=before)
 
     # Collect all target IDs
-    target_ids = {
-        artifact.target.id
-        for revision in revisions
-        for artifact in revision.artifact_set.all()
-    }
+    if not target_ids:
+        target_ids = [
+            target_id
+            for revision in page.revisions
+            for target_id in revision.artifact_map
+        ]
 
     targets = list(Target.objects.filter(id__in=target_ids).order_by("id"))
 
-    return targets, [
-        ArtifactsTableRow(
-            revision=revision,
-            artifacts=[
-                next(
-                    (
-                        a
-                        for a in revision.artifact_set.all()
-                        if a.target.id == target.id
-                    ),
-                    None,
-                )
-                for target in targets
-            ],
+    return targets, get_table_rows(page.revisions, targets), page
+
+
+def get_table_rows(
+    revisions: list[Revision], targets: list[Target]
+) -> list[ArtifactsTableRow]:
+    rows = []
+    for revision in revisions:
+        # The first artifact of each target.
+        by_target: dict[str, Artifact] = {}
+        for artifact in revision.get_artifacts():
+            by_target.setdefault(artifact.target_id, artifact)
+        rows.append(
+            ArtifactsTableRow(
+                revision=revision,
+                artifacts=[by_target.get(target.id) for target in targets],
+            )
         )
-        for revision in revisions
-    ]
+    return rows
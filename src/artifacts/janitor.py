@@ -0,0 +1,324 @@
+"""
+Deletion of expired revisions.
+
+Revision.expires_at says when a revision goes: right away if it is scheduled
+for deletion, never if it is pinned, otherwise at the end of its retention
+period (ARTIFACTS_RETENTION_DAYS, or ARTIFACTS_PR_RETENTION_DAYS for PR
+revisions that a newer revision of the same PR has superseded). It is
+stored when revisions change, so run_janitor() first recomputes it for all
+revisions, in case the retention settings changed since. It then selects
+the expired revisions with one range scan of its index and deletes them in
+batches of ARTIFACTS_JANITOR_BATCH_SIZE, each in its own transaction: the
+revisions, their artifacts and the blobs that no artifact references
+anymore.
+
+Unlinking files is mostly waiting for the file system, so it is spread over
+ARTIFACTS_JANITOR_PARALLELISM threads. Blob files are removed before the
+batch commits, while their rows are locked, as in release_blobs(): an
+upload of the same content waits for the lock and then stores the blob
+again instead of linking to a file that is about to disappear. The
+per-revision links are removed after the commit, a revision per task.
+Finally it purges upload sessions and staged upload files that were
+abandoned (purge_abandoned_uploads()).
+
+The command runs it directly. "Run Janitor Now" in the table queues a
+JanitorRun for the job worker instead (start_janitor_run()), which records
+its progress on the run as it goes, so that the page can show it without
+holding a request open for the whole purge.
+"""
+
+import logging
+import os
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, Exists, OuterRef, Sum
+from django.utils import timezone
+
+from core.jobs import enqueue_job
+
+from .live import publish_revision_changes
+from .models import Artifact, Blob, JanitorRun, Revision, expiry_expression
+from .storage import delete_blob_deltas, get_blob_path
+from .upload_sessions import purge_abandoned_uploads
+from .utils import (
+    COMPRESSED_SUFFIXES,
+    cleanup_empty_directories,
+    get_full_file_path,
+)
+
+logger = logging.getLogger(__name__)
+
+# Errors beyond this many are counted but not kept on a JanitorRun.
+MAX_RECORDED_ERRORS = 100
+
+
+@dataclass
+class JanitorResult:
+    scanned: int = 0
+    revisions_deleted: int = 0
+    artifacts_deleted: int = 0
+    blobs_deleted: int = 0
+    bytes_freed: int = 0
+    uploads_purged: int = 0
+    errors: list[str] = field(default_factory=list)
+
+
+def delete_files(file_paths: Iterable[str]) -> list[str]:
+    """
+    Delete the files with their precompressed variants, then the
+    directories that are left empty. Returns what couldn't be deleted.
+    """
+    file_paths = list(file_paths)
+    errors = []
+    for file_path in file_paths:
+        full_path = str(get_full_file_path(file_path))
+        for suffix in ("", *COMPRESSED_SUFFIXES):
+            try:
+                os.unlink(full_path + suffix)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                errors.append(f"{file_path}{suffix}: {e.strerror}")
+    for file_path in file_paths:
+        cleanup_empty_directories(file_path)
+    return errors
+
+
+def collect_errors(futures: list[Future], result: JanitorResult) -> None:
+    for future in futures:
+        try:
+            result.errors.extend(future.result())
+        except Exception as e:
+            logger.exception("Failed to delete files")
+            result.errors.append(str(e))
+
+
+def delete_batch(
+    revision_ids: list[int],
+    executor: ThreadPoolExecutor,
+    parallelism: int,
+    result: JanitorResult,
+) -> set[str]:
+    """
+    Delete the revisions that are still expired, and their files. Returns
+    the digests of the blobs deleted with them.
+    """
+    with transaction.atomic():
+        # Re-check under the row locks: a revision may have been pinned or
+        # deleted since it was selected.
+        revisions = dict(
+            Revision.objects
+            .select_for_update()
+            .filter(pk__in=revision_ids)
+            .expired()
+            .order_by("pk")
+            .values_list("pk", "pr_number")
+        )
+        if not revisions:
+            return set()
+        artifacts = list(
+            Artifact.objects.filter(revision_id__in=revisions).values_list(
+                "revision_id", "file_path", "blob_id", "size"
+            )
+        )
+        _, deleted = Revision.objects.filter(pk__in=revisions).delete()
+
+        sha256s = sorted({
+            blob_id for _, _, blob_id, _ in artifacts if blob_id
+        })
+        blobs = dict(
+            Blob.objects
+            .select_for_update()
+            .filter(sha256__in=sha256s)
+            .order_by("sha256")
+            .values_list("sha256", "size")
+        )
+        # Locked now, so no upload can attach to them anymore.
+        for sha256 in Artifact.objects.filter(blob_id__in=blobs).values_list(
+            "blob_id", flat=True
+        ):
+            blobs.pop(sha256, None)
+        Blob.objects.filter(sha256__in=blobs).delete()
+        # A share of the blobs per thread, rather than a task per blob.
+        released = sorted(blobs)
+        collect_errors(
+            [
+                executor.submit(
+                    delete_files,
+                    map(get_blob_path, released[i::parallelism]),
+                )
+                for i in range(min(parallelism, len(released)))
+            ],
+            result,
+        )
+
+        # The remaining revisions of the PRs may be the latest now.
+        Revision.objects.filter(
+            pr_number__in={pr for pr in revisions.values() if pr}
+        ).update_expiry()
+        publish_revision_changes(revisions)
+
+    by_revision: dict[int, list[str]] = {}
+    for revision_id, file_path, _, _ in artifacts:
+        by_revision.setdefault(revision_id, []).append(file_path)
+    collect_errors(
+        [
+            executor.submit(delete_files, file_paths)
+            for file_paths in by_revision.values()
+        ],
+        result,
+    )
+
+    result.revisions_deleted += len(revisions)
+    result.artifacts_deleted += deleted.get(Artifact._meta.label, 0)
+    result.blobs_deleted += len(blobs)
+    # Files of artifacts from before the blob store aren't shared.
+    result.bytes_freed += sum(blobs.values()) + sum(
+        size for _, _, blob_id, size in artifacts if not blob_id
+    )
+    return set(blobs)
+
+
+def plan_janitor() -> JanitorResult:
+    """
+    What run_janitor() would delete now, without deleting anything.
+    """
+    # With expires_at as run_janitor() would recompute it.
+    now = timezone.now()
+    expired = Revision.objects.alias(expiry=expiry_expression(now)).filter(
+        expiry__lte=now
+    )
+    artifacts = Artifact.objects.filter(revision__in=expired)
+    kept = Artifact.objects.filter(blob_id=OuterRef("pk")).exclude(
+        revision__in=expired
+    )
+    blobs = Blob.objects.filter(
+        Exists(artifacts.filter(blob_id=OuterRef("pk"))), ~Exists(kept)
+    ).aggregate(count=Count("pk"), size=Sum("size"))
+    unshared = artifacts.filter(blob__isnull=True).aggregate(size=Sum("size"))
+    revisions = expired.count()
+    return JanitorResult(
+        scanned=revisions,
+        revisions_deleted=revisions,
+        artifacts_deleted=artifacts.count(),
+        blobs_deleted=blobs["count"],
+        bytes_freed=(blobs["size"] or 0) + (unshared["size"] or 0),
+    )
+
+
+def run_janitor(
+    batch_size: int | None = None,
+    parallelism: int | None = None,
+    on_progress: Callable[[JanitorResult], None] | None = None,
+) -> JanitorResult:
+    """
+    Delete all expired revisions. on_progress is called with the totals so
+    far after each batch.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, "ARTIFACTS_JANITOR_BATCH_SIZE", 500)
+    if parallelism is None:
+        parallelism = getattr(settings, "ARTIFACTS_JANITOR_PARALLELISM", 8)
+
+    # The retention settings may have changed since expires_at was stored.
+    Revision.objects.update_expiry()
+    result = JanitorResult()
+    revision_ids = list(
+        Revision.objects.expired().order_by("pk").values_list("pk", flat=True)
+    )
+    result.scanned = len(revision_ids)
+    released: set[str] = set()
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        for start in range(0, len(revision_ids), batch_size):
+            batch = revision_ids[start : start + batch_size]
+            try:
+                released |= delete_batch(batch, executor, parallelism, result)
+            except DatabaseError as e:
+                logger.exception("Janitor failed to delete a batch")
+                result.errors.append(str(e))
+            if on_progress:
+                on_progress(result)
+    if released:
+        delete_blob_deltas(released)
+    result.uploads_purged = purge_abandoned_uploads()
+
+    logger.info(
+        f"Janitor deleted {result.revisions_deleted} revision(s),"
+        f" {result.artifacts_deleted} artifact(s) and"
+        f" {result.blobs_deleted} blob(s), freeing {result.bytes_freed}"
+        f" bytes, and {result.uploads_purged} abandoned upload(s), with"
+        f" {len(result.errors)} error(s)"
+    )
+    return result
+
+
+def start_janitor_run(user_id: int | None) -> JanitorRun | None:
+    """
+    Queue a janitor run for the job worker, on behalf of the given user.
+    Returns None if one is already queued or running.
+    """
+    try:
+        with transaction.atomic():
+            run = JanitorRun.objects.create(requested_by_id=user_id)
+            # Resuming is safe, but the run records a failure on its own.
+            enqueue_job("artifacts.janitor", max_attempts=1, run_id=run.pk)
+    except IntegrityError:
+        return None
+    return run
+
+
+def get_run_counts(result: JanitorResult) -> dict[str, Any]:
+    errors = result.errors[:MAX_RECORDED_ERRORS]
+    if len(result.errors) > MAX_RECORDED_ERRORS:
+        errors.append(
+            f"... and {len(result.errors) - MAX_RECORDED_ERRORS} more"
+        )
+    return {
+        "scanned": result.scanned,
+        "revisions_deleted": result.revisions_deleted,
+        "artifacts_deleted": result.artifacts_deleted,
+        "blobs_deleted": result.blobs_deleted,
+        "bytes_freed": result.bytes_freed,
+        "errors": errors,
+    }
+
+
+def execute_janitor_run(run_id: int) -> None:
+    """
+    Do a queued run, recording the counts on it after every batch.
+    """
+    run = JanitorRun.objects.filter(pk=run_id, is_active=True)
+    now = timezone.now()
+    if not run.update(
+        status=JanitorRun.Status.RUNNING, started_at=now, updated_at=now
+    ):
+        return
+
+    progress = JanitorResult()
+
+    def record(result: JanitorResult) -> None:
+        nonlocal progress
+        progress = result
+        run.update(**get_run_counts(result), updated_at=timezone.now())
+
+    status = JanitorRun.Status.FAILED
+    try:
+        progress = run_janitor(on_progress=record)
+        status = JanitorRun.Status.SUCCEEDED
+    except Exception as e:
+        progress.errors.append(str(e))
+        raise
+    finally:
+        now = timezone.now()
+        run.update(
+            **get_run_counts(progress),
+            status=status,
+            is_active=False,
+            updated_at=now,
+            finished_at=now,
+        )
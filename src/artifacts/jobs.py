@@ -0,0 +1,31 @@
+"""
+Background jobs for follow-up work after uploads, and janitor runs started
+from the table (see core/jobs.py).
+"""
+
+from core.jobs import register_job
+
+from .deltas import generate_delta
+from .janitor import execute_janitor_run
+from .precompress import precompress_artifact
+from .storage import release_blobs
+
+
+@register_job("artifacts.precompress")
+def precompress(artifact_id: int) -> None:
+    precompress_artifact(artifact_id)
+
+
+@register_job("artifacts.release_blobs")
+def release(sha256s: list[str]) -> None:
+    release_blobs(sha256s)
+
+
+@register_job("artifacts.delta")
+def delta(base_sha256: str, target_sha256: str) -> None:
+    generate_delta(base_sha256, target_sha256)
+
+
+@register_job("artifacts.janitor")
+def janitor(run_id: int) -> None:
+    execute_janitor_run(run_id)
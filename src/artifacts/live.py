@@ -0,0 +1,234 @@
+"""
+Live updates of the artifacts table.
+
+Every change that shows in the table logs the changed revisions as
+ChangeEvent rows, in the same transaction as the change
+(publish_revision_changes()). Pages with the table follow the log through
+an EventSource on /artifacts/live/, which sends the re-rendered row of each
+changed revision for the page's filters, columns and permission variant.
+An empty row means that the revision is no longer on the page. The log is
+in the database, so this works across worker processes without any other
+service.
+
+Under ASGI, a stream polls the log every ARTIFACTS_LIVE_POLL_INTERVAL
+seconds and ends after ARTIFACTS_LIVE_STREAM_TIMEOUT seconds. Under WSGI,
+where an open stream would hold a worker, it sends what is pending and ends
+right away. In both cases the browser reconnects with Last-Event-ID (after
+ARTIFACTS_LIVE_RETRY seconds under WSGI), so no event is missed.
+
+Ids are taken when an event is logged, not when its transaction commits, so
+a long transaction (a janitor batch, a large zip upload) can make an
+earlier id visible after later ones. Streams therefore only move past the
+ids they have seen without gaps. A gap is skipped once the event after it
+is GAP_TIMEOUT old, by when the missing event has either committed or been
+rolled back.
+"""
+
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator, Iterable, Iterator
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Max
+from django.http import QueryDict
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .forms import RevisionFilterForm
+from .helpers import get_table_rows, get_visible_revisions
+from .models import ChangeEvent, Target
+from .table_cache import ainvalidate_table_cache, invalidate_table_cache
+
+# Events are kept this long, so a page that has been offline for longer
+# may have to reload.
+EVENT_TTL = timedelta(hours=1)
+PRUNE_INTERVAL = 600
+# The longest a transaction may take to commit after logging an event, and
+# how long a rolled back one holds up the events after it.
+GAP_TIMEOUT = timedelta(minutes=2)
+MAX_EVENTS_PER_POLL = 200
+KEEPALIVE_INTERVAL = 15
+
+_last_prune = 0.0
+
+
+def prune_events() -> None:
+    """
+    Delete expired events, except for the newest one, which marks how far
+    the log has been pruned (see LiveStream.poll()).
+    """
+    global _last_prune
+    if time.monotonic() - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = time.monotonic()
+    watermark = ChangeEvent.objects.filter(
+        created_at__lt=timezone.now() - EVENT_TTL
+    ).aggregate(last=Max("id"))["last"]
+    if watermark is not None:
+        ChangeEvent.objects.filter(id__lt=watermark).delete()
+
+
+def publish_revision_changes(revision_ids: Iterable[int]) -> None:
+    """
+    Log that the revisions changed and invalidate the table cache, as part
+    of the current transaction.
+    """
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(revision_id=pk) for pk in sorted(set(revision_ids))
+    ])
+    invalidate_table_cache()
+    prune_events()
+
+
+async def apublish_revision_changes(revision_ids: Iterable[int]) -> None:
+    """
+    Async version of publish_revision_changes(), outside of transactions.
+    """
+    await ChangeEvent.objects.abulk_create([
+        ChangeEvent(revision_id=pk) for pk in sorted(set(revision_ids))
+    ])
+    await ainvalidate_table_cache()
+    await sync_to_async(prune_events)()
+
+
+def take_contiguous(after: int, events: list[tuple]) -> list[tuple]:
+    """
+    The events, ordered by id and each ending with its created_at, up to
+    the first gap in the ids after the given one that may still fill. After
+    0, an empty log, the first id can be anything.
+    """
+    cutoff = timezone.now() - GAP_TIMEOUT
+    for index, event in enumerate(events):
+        if after and event[0] != after + 1 and event[-1] > cutoff:
+            return events[:index]
+        after = event[0]
+    return events
+
+
+def get_last_event_id() -> int:
+    """
+    The id up to which the log is complete, for a page rendered now.
+    """
+    newest = ChangeEvent.objects.order_by("-id")[:MAX_EVENTS_PER_POLL]
+    events = list(newest.values_list("id", "created_at"))[::-1]
+    if not events:
+        return 0
+    # Assume no gap before the oldest of them, as older gaps are skipped.
+    contiguous = take_contiguous(events[0][0], events[1:])
+    return contiguous[-1][0] if contiguous else events[0][0]
+
+
+def format_event(event: str, data: dict, event_id: int | None = None) -> str:
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return f"id: {event_id}\n{message}" if event_id is not None else message
+
+
+class LiveStream:
+    """
+    The server-sent events for one connection of a table page.
+    """
+
+    def __init__(
+        self, query: QueryDict, after: int | None, can_manage: bool
+    ) -> None:
+        self.filter_form = RevisionFilterForm(query or None)
+        self.column_ids = query.getlist("column")
+        self.after = after
+        self.can_manage = can_manage
+        self.checked_gap = False
+
+    def render_rows(self, revision_ids: list[int]) -> dict[int, dict]:
+        revisions = list(
+            self.filter_form.filter(get_visible_revisions()).filter(
+                pk__in=revision_ids
+            )
+        )
+        targets = list(
+            Target.objects.filter(id__in=self.column_ids).order_by("id")
+        )
+        columns = {target.id for target in targets}
+        data: dict[int, dict] = {
+            pk: {"revision": pk, "html": "", "new_targets": False}
+            for pk in revision_ids
+        }
+        for row in get_table_rows(revisions, targets):
+            data[row.revision.pk].update(
+                html=render_to_string(
+                    "artifacts/table_row.html",
+                    {"row": row, "can_manage": self.can_manage},
+                ),
+                new_targets=not set(row.revision.artifact_map) <= columns,
+            )
+        return data
+
+    def poll(self) -> list[str]:
+        """
+        Get the messages for the events since the last poll.
+        """
+        if self.after is None:
+            self.after = get_last_event_id()
+            return []
+        if not self.checked_gap:
+            # Events the page hasn't seen may have been pruned, if it is
+            # older than the pruning watermark. Ids alone can't tell, as
+            # sequences skip the ids of rolled back transactions.
+            self.checked_gap = True
+            oldest = ChangeEvent.objects.order_by("id").first()
+            if (
+                oldest is not None
+                and oldest.pk > self.after
+                and oldest.created_at < timezone.now() - EVENT_TTL
+            ):
+                return [format_event("reload", {})]
+
+        pending = (
+            ChangeEvent.objects
+            .filter(id__gt=self.after)
+            .order_by("id")
+            .values_list("id", "revision_id", "created_at")
+        )
+        events = take_contiguous(
+            self.after, list(pending[:MAX_EVENTS_PER_POLL])
+        )
+        if not events:
+            return []
+        self.after = events[-1][0]
+
+        # Only the latest event of each revision matters.
+        last_event_ids = {
+            revision_id: event_id for event_id, revision_id, _ in events
+        }
+        data = self.render_rows(list(last_event_ids))
+        return [
+            format_event("revision", data[revision_id], event_id)
+            for revision_id, event_id in sorted(
+                last_event_ids.items(), key=lambda item: item[1]
+            )
+        ]
+
+    def __iter__(self) -> Iterator[str]:
+        retry = getattr(settings, "ARTIFACTS_LIVE_RETRY", 5)
+        yield f"retry: {int(retry * 1000)}\n\n"
+        yield from self.poll()
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        poll_interval = getattr(settings, "ARTIFACTS_LIVE_POLL_INTERVAL", 1.0)
+        timeout = getattr(settings, "ARTIFACTS_LIVE_STREAM_TIMEOUT", 60)
+        yield f"retry: {int(poll_interval * 1000)}\n\n"
+        deadline = time.monotonic() + timeout
+        last_sent = time.monotonic()
+        while True:
+            messages = await sync_to_async(self.poll)()
+            for message in messages:
+                yield message
+            if messages:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= KEEPALIVE_INTERVAL:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(poll_interval)
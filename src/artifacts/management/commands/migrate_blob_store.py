@@ -0,0 +1,92 @@
+import os
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+
+from artifacts.live import publish_revision_changes
+from artifacts.matrix import refresh_artifact_maps
+from artifacts.models import Artifact, Blob
+from artifacts.storage import get_blob_path, hash_file, link_blob
+from artifacts.utils import (
+    ensure_directory_exists,
+    get_full_file_path,
+    move_into_place,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move artifact files that predate the blob store into it, replacing"
+        " duplicates with links to a single copy"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be done",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        dry_run = options["dry_run"]
+        seen: set[str] = set()
+        migrated = missing = 0
+        saved_bytes = 0
+
+        artifacts = Artifact.objects.filter(blob__isnull=True).order_by("pk")
+        for artifact in artifacts.iterator():
+            full_path = get_full_file_path(artifact.file_path)
+            if not full_path.is_file():
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Missing file for artifact {artifact.pk}:"
+                        f" {artifact.file_path}"
+                    )
+                )
+                missing += 1
+                continue
+
+            sha256 = hash_file(full_path)
+            size = full_path.stat().st_size
+            is_duplicate = (
+                sha256 in seen or Blob.objects.filter(sha256=sha256).exists()
+            )
+            seen.add(sha256)
+            migrated += 1
+            if is_duplicate:
+                saved_bytes += size
+            if dry_run:
+                continue
+
+            with transaction.atomic():
+                Blob.objects.bulk_create(
+                    [Blob(sha256=sha256, size=size)], ignore_conflicts=True
+                )
+                blob = Blob.objects.select_for_update().get(sha256=sha256)
+                blob_path = get_blob_path(sha256)
+
+                if get_full_file_path(blob_path).exists():
+                    # Replace the duplicate copy with a link to the blob.
+                    link_blob(blob, artifact.file_path)
+                else:
+                    try:
+                        os.link(full_path, ensure_directory_exists(blob_path))
+                    except OSError:
+                        move_into_place(full_path, blob_path)
+                        link_blob(blob, artifact.file_path)
+
+                Artifact.objects.filter(pk=artifact.pk).update(blob=blob)
+                # The map and the manifest serve the digest.
+                refresh_artifact_maps([artifact.revision_id])
+                publish_revision_changes([artifact.revision_id])
+
+        prefix = "Would migrate" if dry_run else "Migrated"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix} {migrated} artifact(s), freeing"
+                f" {filesizeformat(saved_bytes)} of duplicates"
+                f" ({missing} missing file(s))"
+            )
+        )
@@ -0,0 +1,42 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from artifacts.models import Artifact
+from artifacts.precompress import precompress_artifact
+
+
+class Command(BaseCommand):
+    help = (
+        "Write precompressed variants for existing artifacts of targets that"
+        " have precompress enabled"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--target",
+            action="append",
+            help="Only process this target (can be given multiple times)",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        artifacts = Artifact.objects.filter(
+            target__precompress=True, blob__isnull=False
+        )
+        if options["target"]:
+            artifacts = artifacts.filter(target_id__in=options["target"])
+
+        processed = compressed = 0
+        for artifact_id in artifacts.order_by("pk").values_list(
+            "pk", flat=True
+        ):
+            processed += 1
+            if precompress_artifact(artifact_id):
+                compressed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {processed} artifact(s),"
+                f" {compressed} with precompressed variants"
+            )
+        )
@@ -0,0 +1,76 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+    CommandParser,
+)
+from django.template.defaultfilters import filesizeformat
+
+from artifacts.janitor import JanitorResult, plan_janitor, run_janitor
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete revisions that are scheduled for deletion or out of their"
+        " retention period, with their artifacts and files"
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be deleted",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=getattr(settings, "ARTIFACTS_JANITOR_BATCH_SIZE", 500),
+            help="Revisions deleted per transaction",
+        )
+        parser.add_argument(
+            "--parallelism",
+            type=int,
+            default=getattr(settings, "ARTIFACTS_JANITOR_PARALLELISM", 8),
+            help="Threads deleting files",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["batch_size"] < 1 or options["parallelism"] < 1:
+            raise CommandError(
+                "--batch-size and --parallelism must be at least 1"
+            )
+        if options["dry_run"]:
+            result = plan_janitor()
+            self.stdout.write(self.format_result(result, "Would delete"))
+            return
+
+        def report(result: JanitorResult) -> None:
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"Deleted {result.revisions_deleted}"
+                    f" of {result.scanned} revision(s)"
+                )
+
+        result = run_janitor(
+            batch_size=options["batch_size"],
+            parallelism=options["parallelism"],
+            on_progress=report,
+        )
+        for error in result.errors:
+            self.stderr.write(error)
+        style = self.style.WARNING if result.errors else self.style.SUCCESS
+        self.stdout.write(style(self.format_result(result, "Deleted")))
+        if result.uploads_purged:
+            self.stdout.write(
+                f"Purged {result.uploads_purged} abandoned upload(s)"
+            )
+
+    def format_result(self, result: JanitorResult, verb: str) -> str:
+        return (
+            f"{verb} {result.revisions_deleted} revision(s),"
+            f" {result.artifacts_deleted} artifact(s) and"
+            f" {result.blobs_deleted} blob(s),"
+            f" freeing {filesizeformat(result.bytes_freed)}"
+        )
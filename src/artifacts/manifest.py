@@ -0,0 +1,186 @@
+"""
+JSON manifest of revisions, targets and artifacts for scripts and bots.
+
+The revision list has the same revisions as the table, with the same
+filters (see RevisionFilterForm). It is paginated with an opaque cursor,
+and ?fields= selects which fields are returned. Pollers are meant to send
+If-None-Match: the ETag only depends on the newest entries of the change
+log (see live.py) and the request URL, so a 304 costs one read of the end
+of an index and no serialization.
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Any
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.http import HttpRequest
+from django.urls import reverse
+
+from .helpers import Cursor, paginate_revisions
+from .models import Artifact, ChangeEvent, Revision, Target
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Change log entries in the ETag. All of them rather than the last id, so
+# that a transaction that logged an earlier id but committed later changes
+# the ETag too.
+VALIDATOR_EVENTS = 100
+
+REVISION_FIELDS = (
+    "id",
+    "commit_hash",
+    "datetime",
+    "pr_number",
+    "tag",
+    "pinned",
+    "scheduled_for_deletion",
+    "cleanup_at",
+    "artifacts",
+)
+ARTIFACT_FIELDS = (
+    "id",
+    "target",
+    "filename",
+    "size",
+    "sha256",
+    "url",
+    "created_at",
+)
+
+
+def parse_fields(value: str | None) -> tuple[list[str], list[str]]:
+    """
+    Parse ?fields=commit_hash,artifacts.url,... into the revision and
+    artifact fields to return. Everything is returned by default, and all
+    artifact fields if only "artifacts" is given.
+    """
+    if not value:
+        return list(REVISION_FIELDS), list(ARTIFACT_FIELDS)
+
+    revision_fields: list[str] = []
+    artifact_fields: list[str] = []
+    for name in filter(None, (name.strip() for name in value.split(","))):
+        if name.startswith("artifacts."):
+            field = name.removeprefix("artifacts.")
+            if field not in ARTIFACT_FIELDS:
+                raise ValueError(f"Unknown field {name!r}")
+            artifact_fields.append(field)
+        elif name in REVISION_FIELDS:
+            revision_fields.append(name)
+        else:
+            raise ValueError(f"Unknown field {name!r}")
+
+    if artifact_fields and "artifacts" not in revision_fields:
+        revision_fields.append("artifacts")
+    if "artifacts" in revision_fields and not artifact_fields:
+        artifact_fields = list(ARTIFACT_FIELDS)
+    return revision_fields, artifact_fields
+
+
+def get_manifest_validators(
+    request: HttpRequest,
+) -> tuple[str, datetime | None]:
+    """
+    ETag and Last-Modified of the revision list for this request. Every
+    change to revisions and artifacts is logged as a ChangeEvent, deletions
+    included, so the newest events identify the version of the data.
+    """
+    newest = ChangeEvent.objects.order_by("-id")[:VALIDATOR_EVENTS]
+    events = list(newest.values_list("id", "created_at"))
+    version = "|".join(
+        str(value)
+        for value in (
+            *(event_id for event_id, _ in events),
+            # These change cleanup_at without touching any row.
+            getattr(settings, "ARTIFACTS_RETENTION_DAYS", 30),
+            getattr(settings, "ARTIFACTS_PR_RETENTION_DAYS", 7),
+            request.build_absolute_uri(),
+        )
+    )
+    etag = f'"{hashlib.sha256(version.encode()).hexdigest()[:32]}"'
+    return etag, max((created_at for _, created_at in events), default=None)
+
+
+def serialize_artifact(
+    request: HttpRequest, artifact: Artifact, fields: list[str]
+) -> dict[str, Any]:
+    values = {
+        "id": lambda: artifact.pk,
+        "target": lambda: artifact.target_id,
+        "filename": lambda: artifact.filename,
+        "size": lambda: artifact.size,
+        "sha256": lambda: artifact.sha256,
+        "url": lambda: request.build_absolute_uri(
+            reverse("artifacts:download", args=[artifact.pk])
+        ),
+        "created_at": lambda: artifact.created_at,
+    }
+    return {field: values[field]() for field in fields}
+
+
+def serialize_revision(
+    request: HttpRequest,
+    revision: Revision,
+    revision_fields: list[str],
+    artifact_fields: list[str],
+) -> dict[str, Any]:
+    values = {
+        "id": lambda: revision.pk,
+        "commit_hash": lambda: revision.commit_hash,
+        "datetime": lambda: revision.datetime,
+        "pr_number": lambda: revision.pr_number,
+        "tag": lambda: revision.tag_description,
+        "pinned": lambda: revision.is_pinned,
+        "scheduled_for_deletion": lambda: revision.is_scheduled_for_deletion,
+        # As the janitor will compute it, which is now for scheduled
+        # revisions, rather than the stored expires_at: that may predate a
+        # change of the retention settings.
+        "cleanup_at": lambda: getattr(
+            revision, "retention_expires_at", revision.expires_at
+        ),
+        "artifacts": lambda: [
+            serialize_artifact(request, artifact, artifact_fields)
+            for artifact in revision.get_artifacts()
+        ],
+    }
+    return {field: values[field]() for field in revision_fields}
+
+
+def build_revisions_manifest(
+    request: HttpRequest,
+    revisions: QuerySet[Revision],
+    revision_fields: list[str],
+    artifact_fields: list[str],
+    limit: int = DEFAULT_PAGE_SIZE,
+    after: Cursor | None = None,
+) -> dict[str, Any]:
+    page = paginate_revisions(revisions, limit, after=after)
+
+    next_url = None
+    if page.older_cursor:
+        query = request.GET.copy()
+        query["cursor"] = page.older_cursor
+        next_url = request.build_absolute_uri(
+            f"{request.path}?{query.urlencode()}"
+        )
+
+    return {
+        "revisions": [
+            serialize_revision(
+                request, revision, revision_fields, artifact_fields
+            )
+            for revision in page.revisions
+        ],
+        "next": next_url,
+    }
+
+
+def build_targets_manifest() -> dict[str, Any]:
+    return {
+        "targets": [
+            {"id": target.id, "name": target.name}
+            for target in Target.objects.order_by("id")
+        ]
+    }
@@ -0,0 +1,65 @@
+"""
+Denormalized artifact map of each revision.
+
+The table and the revisions API show every artifact of every revision on a
+page. Rather than prefetching the Artifact and Target rows and matching them
+up per cell, each revision keeps a copy of what they need in
+Revision.artifact_map: {target_id: [artifact fields, ...]}, sorted by target
+and filename. Its keys are the revision's targets. A page of the table is
+then one query over the revision listing index.
+
+The map is rebuilt from the Artifact rows whenever they change: in the
+upload transaction, by admin edits and deletions, and after download counts
+are flushed. Rebuilds hold the revision row lock, the same lock uploads
+take, so a rebuild never overwrites a newer map with an older one.
+"""
+
+from collections.abc import Iterable
+from typing import Any
+
+from django.db import transaction
+
+from .models import Artifact, Revision
+
+
+def serialize_artifact(artifact: Artifact) -> dict[str, Any]:
+    return {
+        "id": artifact.pk,
+        "filename": artifact.filename,
+        "size": artifact.size,
+        "sha256": artifact.blob_id,
+        "download_count": artifact.download_count,
+        "created_at": artifact.created_at.isoformat(),
+    }
+
+
+def build_artifact_map(
+    artifacts: Iterable[Artifact],
+) -> dict[str, list[dict[str, Any]]]:
+    artifact_map: dict[str, list[dict[str, Any]]] = {}
+    for artifact in sorted(artifacts, key=lambda a: (a.target_id, a.filename)):
+        artifact_map.setdefault(artifact.target_id, []).append(
+            serialize_artifact(artifact)
+        )
+    return artifact_map
+
+
+def refresh_artifact_maps(revision_ids: Iterable[int]) -> None:
+    """
+    Rebuild the artifact maps of the revisions from their Artifact rows.
+    """
+    with transaction.atomic():
+        locked = list(
+            Revision.objects
+            .select_for_update()
+            .filter(pk__in=set(revision_ids))
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        artifacts: dict[int, list[Artifact]] = {pk: [] for pk in locked}
+        for artifact in Artifact.objects.filter(revision_id__in=locked):
+            artifacts[artifact.revision_id].append(artifact)
+        for pk in locked:
+            Revision.objects.filter(pk=pk).update(
+                artifact_map=build_artifact_map(artifacts[pk])
+            )
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.3 on 2026-10-17 19:05
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artifacts", "0002_alter_revision_options"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadSession",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("target_id", models.CharField(max_length=50)),
+                ("commit_hash", models.CharField(max_length=40)),
+                ("revision_datetime", models.DateTimeField()),
+                ("pr_number", models.IntegerField(blank=True, null=True)),
+                ("tag_description", models.TextField(blank=True)),
+                ("filename", models.CharField(max_length=255)),
+                ("size", models.BigIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("expires_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="UploadChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index", models.IntegerField()),
+                ("offset", models.BigIntegerField()),
+                ("size", models.BigIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="artifacts.uploadsession",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["offset"],
+                "unique_together": {("session", "index")},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-17 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artifacts", "0004_blob_store"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="target",
+            name="precompress",
+            field=models.BooleanField(
+                default=False,
+                help_text="Store .gz/.zst variants next to uploaded files",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-17 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artifacts", "0005_target_precompress"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadSlot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("token_key", models.CharField(db_index=True, max_length=16)),
+                ("size", models.BigIntegerField()),
+                ("acquired_at", models.DateTimeField(auto_now_add=True)),
+                ("expires_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-17 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artifacts", "0006_upload_slots"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="artifact",
+            name="download_count",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
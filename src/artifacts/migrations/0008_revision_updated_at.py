@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-17 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artifacts", "0007_artifact_download_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="revision",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-17 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artifacts", "0008_revision_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="artifact",
+            index=models.Index(
+                fields=["target", "revision"],
+                name="artifact_target_revision_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="revision",
+            index=models.Index(
+                fields=["is_hidden", "-datetime", "-id"],
+                name="revision_listing_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="revision",
+            index=models.Index(
+                fields=["pr_number", "-datetime", "-id"],
+                name="revision_pr_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="revision",
+            index=models.Index(
+                fields=["is_pinned", "-datetime", "-id"],
+                name="revision_pinned_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="revision",
+            index=models.Index(
+                fields=["is_scheduled_for_deletion", "-datetime", "-id"],
+                name="revision_scheduled_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="revision",
+            index=models.Index(
+                condition=models.Q(("tag_description", ""), _negated=True),
+                fields=["-datetime", "-id"],
+                name="revision_tagged_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-17 19:46
+
+from django.db import migrations, models
+
+
+def fill_artifact_map(apps, schema_editor):
+    # Same as matrix.refresh_artifact_maps(), on the historical models.
+    Revision = apps.get_model("artifacts", "Revision")
+    Artifact = apps.get_model("artifacts", "Artifact")
+    maps = {}
+    for artifact in Artifact.objects.order_by("target_id", "filename"):
+        maps.setdefault(artifact.revision_id, {}).setdefault(
+            artifact.target_id, []
+        ).append({
+            "id": artifact.pk,
+            "filename": artifact.filename,
+            "size": artifact.size,
+            "sha256": artifact.blob_id,
+            "download_count": artifact.download_count,
+            "created_at": artifact.created_at.isoformat(),
+        })
+    for revision_id, artifact_map in maps.items():
+        Revision.objects.filter(pk=revision_id).update(
+            artifact_map=artifact_map
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artifacts", "0010_revision_expires_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="revision",
+            name="artifact_map",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(fill_artifact_map, migrations.RunPython.noop),
+    ]
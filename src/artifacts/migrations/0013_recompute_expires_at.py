@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:10
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
+
+
+def recompute_expires_at(apps, schema_editor):
+    # 0010 gave the latest revision of a PR the PR retention period and the
+    # superseded ones the normal one; it is the other way round. Same as
+    # RevisionQuerySet.update_expiry(), on the historical model.
+    Revision = apps.get_model("artifacts", "Revision")
+    retention = getattr(settings, "ARTIFACTS_RETENTION_DAYS", 30)
+    pr_retention = getattr(settings, "ARTIFACTS_PR_RETENTION_DAYS", 7)
+    newer_of_same_pr = Revision.objects.filter(
+        Q(datetime__gt=OuterRef("datetime"))
+        | Q(datetime=OuterRef("datetime"), id__gt=OuterRef("id")),
+        pr_number=OuterRef("pr_number"),
+    )
+    Revision.objects.update(
+        expires_at=Case(
+            When(is_pinned=True, then=Value(None)),
+            When(is_scheduled_for_deletion=True, then=F("expires_at")),
+            When(
+                Q(Exists(newer_of_same_pr), pr_number__isnull=False),
+                then=F("datetime") + timedelta(days=pr_retention),
+            ),
+            default=F("datetime") + timedelta(days=retention),
+            output_field=models.DateTimeField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("artifacts", "0012_change_events"),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_expires_at, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,95 @@
-from datetime import timedelta
+import uuid
+from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.db import models
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
 from django.utils import timezone
 
 
-class RevisionManager(models.Manager):
-    pass
+def get_retention_periods() -> tuple[timedelta, timedelta]:
+    """
+    Retention of ordinary revisions and of PR revisions that a newer
+    revision of the same PR has superseded.
+    """
+    return (
+        timedelta(days=getattr(settings, "ARTIFACTS_RETENTION_DAYS", 30)),
+        timedelta(days=getattr(settings, "ARTIFACTS_PR_RETENTION_DAYS", 7)),
+    )
+
+
+def latest_of_pr_condition() -> Q:
+    """
+    Whether a revision is the latest of its PR, as a condition that the
+    database evaluates per row with an index lookup on revision_pr_idx.
+    Ties on datetime are broken by id, as in the table.
+    """
+    newer_of_same_pr = Revision.objects.filter(
+        Q(datetime__gt=OuterRef("datetime"))
+        | Q(datetime=OuterRef("datetime"), id__gt=OuterRef("id")),
+        pr_number=OuterRef("pr_number"),
+    )
+    return Q(~Exists(newer_of_same_pr), pr_number__isnull=False)
+
+
+def expiry_expression(now: datetime) -> Case:
+    """
+    What Revision.expires_at should be: never for pinned revisions, now for
+    revisions scheduled for deletion, and the end of the retention period
+    otherwise. The latest revision of a PR is kept as long as revisions
+    without a PR, older ones only for the PR retention period.
+    """
+    retention, pr_retention = get_retention_periods()
+    return Case(
+        When(is_pinned=True, then=Value(None)),
+        When(is_scheduled_for_deletion=True, then=Value(now)),
+        When(latest_of_pr_condition(), then=F("datetime") + retention),
+        When(pr_number__isnull=False, then=F("datetime") + pr_retention),
+        default=F("datetime") + retention,
+        output_field=models.DateTimeField(),
+    )
+
+
+class RevisionQuerySet(models.QuerySet):
+    def with_retention(self) -> "RevisionQuerySet":
+        """
+        Annotate latest_of_pr and retention_expires_at (what expires_at
+        should be) in the same query, instead of a query per revision.
+        """
+        return self.annotate(
+            latest_of_pr=models.ExpressionWrapper(
+                latest_of_pr_condition(), output_field=models.BooleanField()
+            ),
+            retention_expires_at=expiry_expression(timezone.now()),
+        )
+
+    def update_expiry(self) -> int:
+        """
+        Recompute the stored expires_at of these revisions in one UPDATE.
+        """
+        return self.update(expires_at=expiry_expression(timezone.now()))
+
+    async def aupdate_expiry(self) -> int:
+        return await self.aupdate(expires_at=expiry_expression(timezone.now()))
+
+    def expired(self) -> "RevisionQuerySet":
+        """
+        Revisions that the janitor should delete, by a range scan over
+        the expires_at index.
+        """
+        return self.filter(expires_at__lte=timezone.now())
+
+
+RevisionManager = models.Manager.from_queryset(RevisionQuerySet)
 
 
 class Target(models.Model):
     id = models.CharField(max_length=50, primary_key=True)
     name = models.TextField()
+    precompress = models.BooleanField(
+        default=False,
+        help_text="Store .gz/.zst variants next to uploaded files",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self) -> str:
@@ -27,33 +105,110 @@ class Revision(models.Model):
     is_scheduled_for_deletion = models.BooleanField(default=False)
     is_hidden = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # When the janitor deletes the revision, or None if it is pinned. Kept
+    # up to date by update_expiry() whenever an upload, a pin/deletion
+    # change or a deletion can change it.
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Copy of the artifacts for the table and the API, see matrix.py.
+    artifact_map = models.JSONField(default=dict, blank=True, editable=False)
 
     objects = RevisionManager()
 
     def __str__(self) -> str:
         return f"{self.commit_hash[:8]} ({self.datetime})"
 
-    def days_until_cleanup(self):
-        if self.is_scheduled_for_deletion or self.is_pinned:
-            return None if self.is_pinned else 0
-
-        age = timezone.now() - self.datetime
-        retention_days = getattr(settings, "ARTIFACTS_RETENTION_DAYS", 30)
-        pr_retention_days = getattr(settings, "ARTIFACTS_PR_RETENTION_DAYS", 7)
-
-        # Latest PR revision gets PR retention period
-        if (
+    def is_latest_of_pr(self) -> bool:
+        return bool(
             self.pr_number
             and self
-            == Revision.objects.filter(pr_number=self.pr_number)
-            .order_by("-datetime")
+            == Revision.objects
+            .filter(pr_number=self.pr_number)
+            .order_by("-datetime", "-id")
             .first()
-        ):
-            cutoff = timedelta(days=pr_retention_days)
-        else:
-            cutoff = timedelta(days=retention_days)
+        )
+
+    def get_artifacts(self) -> list["Artifact"]:
+        """
+        The artifacts of the revision from artifact_map, sorted by target
+        and filename, without a query. They only have the fields the map
+        keeps and are not meant to be saved.
+        """
+        return [
+            Artifact(
+                id=entry["id"],
+                revision=self,
+                target_id=target_id,
+                filename=entry["filename"],
+                size=entry["size"],
+                blob_id=entry["sha256"],
+                download_count=entry["download_count"],
+                created_at=datetime.fromisoformat(entry["created_at"]),
+            )
+            # jsonb doesn't keep the order of keys.
+            for target_id, entries in sorted(self.artifact_map.items())
+            for entry in entries
+        ]
+
+    def get_pr_revisions(self) -> RevisionQuerySet:
+        """
+        This revision and the other revisions of its PR, whose expiry
+        depends on which of them is the latest.
+        """
+        if not self.pr_number:
+            return Revision.objects.filter(pk=self.pk)
+        return Revision.objects.filter(
+            Q(pk=self.pk) | Q(pr_number=self.pr_number)
+        )
 
-        return max(0, (cutoff - age).days)
+    def refresh_expiry(self) -> list[int]:
+        """
+        Recompute the expiry of this revision and the others of its PR.
+        Returns the ids of all of them, to publish the change.
+        """
+        revisions = self.get_pr_revisions()
+        revision_ids = list(revisions.values_list("pk", flat=True))
+        revisions.update_expiry()
+        self.refresh_from_db(fields=["expires_at"])
+        return revision_ids
+
+    async def arefresh_expiry(self) -> list[int]:
+        revisions = self.get_pr_revisions()
+        revision_ids = [
+            pk async for pk in revisions.values_list("pk", flat=True)
+        ]
+        await revisions.aupdate_expiry()
+        await self.arefresh_from_db(fields=["expires_at"])
+        return revision_ids
+
+    def cleanup_at(self, is_latest_of_pr: bool | None = None):
+        """
+        When the revision falls out of its retention period, or None if it
+        is pinned. Pass is_latest_of_pr if it is already known, or load the
+        revision with with_retention(), to save a query.
+        """
+        if self.is_pinned:
+            return None
+
+        retention, pr_retention = get_retention_periods()
+
+        if not self.pr_number:
+            return self.datetime + retention
+        if is_latest_of_pr is None:
+            is_latest_of_pr = getattr(self, "latest_of_pr", None)
+        if is_latest_of_pr is None:
+            is_latest_of_pr = self.is_latest_of_pr()
+        # Superseded PR revisions get the PR retention period
+        return self.datetime + (retention if is_latest_of_pr else pr_retention)
+
+    def days_until_cleanup(self):
+        if self.is_scheduled_for_deletion or self.is_pinned:
+            return None if self.is_pinned else 0
+
+        expires_at = getattr(self, "retention_expires_at", self.expires_at)
+        if expires_at is None:
+            expires_at = self.cleanup_at()
+        return max(0, (expires_at - timezone.now()).days)
 
     def cleanup_status_display(self):
         if self.is_pinned:
@@ -64,6 +219,30 @@ class Revision(models.Model):
 
     class Meta:
         ordering = ["-datetime"]
+        # The table and the API seek by (datetime, id), optionally filtered.
+        indexes = [
+            models.Index(
+                fields=["is_hidden", "-datetime", "-id"],
+                name="revision_listing_idx",
+            ),
+            models.Index(
+                fields=["pr_number", "-datetime", "-id"],
+                name="revision_pr_idx",
+            ),
+            models.Index(
+                fields=["is_pinned", "-datetime", "-id"],
+                name="revision_pinned_idx",
+            ),
+            models.Index(
+                fields=["is_scheduled_for_deletion", "-datetime", "-id"],
+                name="revision_scheduled_idx",
+            ),
+            models.Index(
+                fields=["-datetime", "-id"],
+                condition=~models.Q(tag_description=""),
+                name="revision_tagged_idx",
+            ),
+        ]
         permissions = [
             (
                 "manage_revisions",
@@ -72,16 +251,36 @@ class Revision(models.Model):
         ]
 
 
+class Blob(models.Model):
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"{self.sha256[:16]} ({self.size} bytes)"
+
+
 class Artifact(models.Model):
     revision = models.ForeignKey(Revision, on_delete=models.CASCADE)
     target = models.ForeignKey(Target, on_delete=models.CASCADE)
     filename = models.CharField(max_length=255)
     file_path = models.TextField()
     size = models.BigIntegerField()
+    blob = models.ForeignKey(
+        Blob, on_delete=models.PROTECT, null=True, blank=True
+    )
+    download_count = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ["revision", "target", "filename"]
+        indexes = [
+            # For filtering revisions by target.
+            models.Index(
+                fields=["target", "revision"],
+                name="artifact_target_revision_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return (
@@ -89,9 +288,123 @@ class Artifact(models.Model):
             f"({self.revision.commit_hash[:8]} - {self.target.id})"
         )
 
+    @property
+    def sha256(self) -> str | None:
+        return self.blob_id
+
     @property
     def download_url(self) -> str:
         download_prefix = getattr(
             settings, "ARTIFACTS_DOWNLOAD_URL_PREFIX", "/static/artifacts"
         )
         return f"{download_prefix}/{self.file_path}"
+
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    target_id = models.CharField(max_length=50)
+    commit_hash = models.CharField(max_length=40)
+    revision_datetime = models.DateTimeField()
+    pr_number = models.IntegerField(null=True, blank=True)
+    tag_description = models.TextField(blank=True)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.filename} ({self.commit_hash[:8]} - {self.target_id})"
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(
+        UploadSession, on_delete=models.CASCADE, related_name="chunks"
+    )
+    index = models.IntegerField()
+    offset = models.BigIntegerField()
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ["session", "index"]
+        ordering = ["offset"]
+
+    def __str__(self) -> str:
+        return f"#{self.index} [{self.offset}, {self.offset + self.size})"
+
+
+class UploadSlot(models.Model):
+    """
+    Lease held by an upload that is in progress, used to limit concurrent
+    uploads across worker processes (see admission.py).
+    """
+
+    token_key = models.CharField(max_length=16, db_index=True)
+    size = models.BigIntegerField()
+    acquired_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.token_key}: {self.size} bytes"
+
+
+class ChangeEvent(models.Model):
+    """
+    Log of changes to revisions, which pages with the table follow to
+    update themselves (see live.py).
+    """
+
+    # Not a foreign key: deletions are logged too.
+    revision_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return f"#{self.pk}: revision {self.revision_id}"
+
+
+class JanitorRun(models.Model):
+    """
+    A janitor run started from the table and done by the job worker (see
+    janitor.py). The counts are updated after every batch, for the table
+    to show progress.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.QUEUED
+    )
+    # Set while queued or running. At most one run can be active.
+    is_active = models.BooleanField(default=True)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    scanned = models.IntegerField(default=0)
+    revisions_deleted = models.IntegerField(default=0)
+    artifacts_deleted = models.IntegerField(default=0)
+    blobs_deleted = models.IntegerField(default=0)
+    bytes_freed = models.BigIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["is_active"],
+                condition=Q(is_active=True),
+                name="janitor_run_one_active",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Janitor run #{self.pk} ({self.status})"
@@ -0,0 +1,141 @@
+"""
+Precompressed variants of stored artifacts.
+
+For targets with precompress enabled, each blob gets {sha256}.gz and (if
+the optional zstandard package is installed) {sha256}.zst siblings after
+upload, and link_blob() links them next to every artifact path. nginx can
+then serve them with gzip_static/zstd_static without compressing anything
+at request time. A variant is only kept if it is at least
+ARTIFACTS_PRECOMPRESS_MIN_RATIO times smaller than the original.
+"""
+
+import gzip
+import logging
+import shutil
+import uuid
+from collections.abc import Callable
+from typing import IO
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Artifact, Blob, Revision
+from .storage import get_blob_path, link_blob
+from .utils import COMPRESSED_SUFFIXES, get_full_file_path
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def get_min_ratio() -> float:
+    return getattr(settings, "ARTIFACTS_PRECOMPRESS_MIN_RATIO", 1.1)
+
+
+def compress_gzip(source: IO[bytes], destination: IO[bytes]) -> None:
+    # mtime=0 keeps the output identical for identical input.
+    with gzip.GzipFile(
+        fileobj=destination, mode="wb", compresslevel=9, mtime=0
+    ) as compressed:
+        shutil.copyfileobj(source, compressed, COPY_BUFFER_SIZE)
+
+
+def compress_zstd(source: IO[bytes], destination: IO[bytes]) -> None:
+    assert zstandard is not None
+    compressor = zstandard.ZstdCompressor(level=19, threads=-1)
+    compressor.copy_stream(source, destination)
+
+
+Compressor = Callable[[IO[bytes], IO[bytes]], None]
+
+
+def get_compressors() -> dict[str, Compressor]:
+    compressors: dict[str, Compressor] = {".gz": compress_gzip}
+    if zstandard is not None:
+        compressors[".zst"] = compress_zstd
+    return compressors
+
+
+def compress_blob(blob: Blob) -> list[str]:
+    """
+    Write the precompressed variants of a blob that don't exist yet,
+    discarding those that don't compress well enough. Returns the suffixes
+    of the variants that exist afterwards.
+    """
+    blob_path = get_blob_path(blob.sha256)
+    full_path = get_full_file_path(blob_path)
+    min_ratio = get_min_ratio()
+
+    suffixes = []
+    for suffix, compress in get_compressors().items():
+        variant = get_full_file_path(blob_path + suffix)
+        if variant.exists():
+            suffixes.append(suffix)
+            continue
+
+        temp_path = variant.with_name(f".{variant.name}.{uuid.uuid4().hex}")
+        try:
+            with open(full_path, "rb") as source, open(temp_path, "wb") as f:
+                compress(source, f)
+            compressed_size = temp_path.stat().st_size
+            if blob.size < compressed_size * min_ratio:
+                logger.debug(
+                    f"Not keeping {suffix} for blob {blob.sha256}:"
+                    f" {blob.size} -> {compressed_size} bytes"
+                )
+                continue
+            temp_path.replace(variant)
+            suffixes.append(suffix)
+        finally:
+            temp_path.unlink(missing_ok=True)
+    return suffixes
+
+
+def delete_blob_variants(blob_path: str) -> None:
+    for suffix in COMPRESSED_SUFFIXES:
+        get_full_file_path(blob_path + suffix).unlink(missing_ok=True)
+
+
+def precompress_artifact(artifact_id: int) -> list[str]:
+    """
+    Post-upload stage: compress the artifact's blob and link the variants
+    next to the artifact. Returns the suffixes that were linked.
+    """
+    artifact = (
+        Artifact.objects
+        .select_related("target", "blob")
+        .filter(pk=artifact_id)
+        .first()
+    )
+    if artifact is None or artifact.blob is None:
+        return []
+    if not artifact.target.precompress:
+        return []
+
+    # Compressing is slow, so it happens outside of any lock. The variants
+    # are only linked if the artifact still has the same content afterwards.
+    try:
+        suffixes = compress_blob(artifact.blob)
+    except FileNotFoundError:
+        # The blob was released before we got to it.
+        return []
+
+    with transaction.atomic():
+        # Same lock order as uploads: blob first, then the revision.
+        if not Blob.objects.select_for_update().filter(pk=artifact.blob_id):
+            # The blob was released while we were compressing it.
+            delete_blob_variants(get_blob_path(artifact.blob.sha256))
+            return []
+        Revision.objects.select_for_update().get(pk=artifact.revision_id)
+        current = Artifact.objects.filter(
+            pk=artifact.pk, blob_id=artifact.blob_id
+        ).first()
+        if current is None:
+            return []
+        link_blob(artifact.blob, current.file_path)
+    return suffixes
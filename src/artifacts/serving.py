@@ -0,0 +1,282 @@
+"""
+Serving artifact files from Django, for setups without nginx in front of
+ARTIFACTS_STORAGE_PATH.
+
+Files are never read into memory as a whole. Under WSGI they are handed to
+the server as a file object (gunicorn sends it with sendfile()). A byte
+range becomes a FileRange, which the server sends with Content-Length as
+the length. Under ASGI they are streamed in chunks from a worker thread.
+
+Several files can be sent as one ZIP archive that is built while it is
+being sent, see iter_zip().
+"""
+
+import asyncio
+import logging
+import os
+import time
+import zipfile
+from collections.abc import AsyncIterator, Iterable, Iterator
+from pathlib import Path
+from typing import IO
+from urllib.parse import quote
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.utils.http import content_disposition_header, parse_http_date_safe
+
+from .models import Artifact
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class FileRange:
+    """
+    Read-only view of length bytes of a file, starting at start. The
+    underlying file is positioned at start, so servers that send files by
+    descriptor with sendfile() pick up the right offset.
+    """
+
+    def __init__(self, file: IO[bytes], start: int, length: int) -> None:
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def parse_byte_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse a Range header into a (start, length) pair. Returns None if the
+    whole file should be sent: no header, an invalid one (which RFC 9110
+    says to ignore), or several ranges, which aren't supported. Raises
+    ValueError if the range can't be satisfied.
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, sep, last = ranges.strip().partition("-")
+    if not sep or not (first or last):
+        return None
+    if (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes.
+        if int(last) == 0 or size == 0:
+            raise ValueError(f"Range {header!r} not satisfiable")
+        start = max(0, size - int(last))
+        end = size - 1
+    else:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            raise ValueError(f"Range {header!r} not satisfiable")
+        end = min(int(last), size - 1) if last else size - 1
+    return start, end - start + 1
+
+
+def get_artifact_etag(artifact: Artifact) -> str:
+    """
+    The content digest is a strong validator. Artifacts that predate the
+    blob store only get a weak one.
+    """
+    if artifact.blob_id:
+        return f'"{artifact.blob_id}"'
+    return f'W/"{artifact.pk}-{artifact.size}"'
+
+
+def if_range_matches(
+    request: HttpRequest, etag: str, last_modified: int
+) -> bool:
+    """
+    Check If-Range: a Range only applies if the client's copy is still
+    current. Weak ETags never match.
+    """
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def is_new_download(
+    request: HttpRequest, range_header: str, size: int
+) -> bool:
+    """
+    Whether a request starts a download, as opposed to resuming one or
+    just checking the headers.
+    """
+    if request.method != "GET":
+        return False
+    try:
+        byte_range = parse_byte_range(range_header, size)
+    except ValueError:
+        return False
+    return byte_range is None or byte_range[0] == 0
+
+
+def x_accel_redirect_response(
+    file_path: str, filename: str, prefix: str
+) -> HttpResponse:
+    """
+    Let nginx serve the file from an internal location (see deployment.md).
+    """
+    response = HttpResponse(content_type="application/octet-stream")
+    response["X-Accel-Redirect"] = f"{prefix.rstrip('/')}/{quote(file_path)}"
+    disposition = content_disposition_header(True, filename)
+    if disposition:
+        response["Content-Disposition"] = disposition
+    return response
+
+
+async def iter_file_async(
+    file: IO[bytes], length: int
+) -> AsyncIterator[bytes]:
+    """
+    Stream length bytes from the current file position, reading in a
+    worker thread.
+    """
+    remaining = length
+    try:
+        while remaining > 0:
+            data = await asyncio.to_thread(
+                file.read, min(remaining, DOWNLOAD_CHUNK_SIZE)
+            )
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        await asyncio.to_thread(file.close)
+
+
+def file_response(
+    request: HttpRequest,
+    file: IO[bytes],
+    filename: str,
+    start: int,
+    length: int,
+    status: int = 200,
+) -> StreamingHttpResponse:
+    """
+    Send length bytes of an open file, starting at start, as an attachment.
+    The response takes care of closing the file.
+    """
+    response: StreamingHttpResponse
+    if isinstance(request, ASGIRequest):
+        # Django would buffer a sync iterator completely before sending it
+        # under ASGI, so stream asynchronously.
+        file.seek(start)
+        response = StreamingHttpResponse(
+            iter_file_async(file, length),
+            status=status,
+            content_type="application/octet-stream",
+        )
+        disposition = content_disposition_header(True, filename)
+        if disposition:
+            response["Content-Disposition"] = disposition
+    else:
+        # Under WSGI a file object lets the server use sendfile(); an async
+        # iterator would have to be read into memory first.
+        response = FileResponse(
+            FileRange(file, start, length),
+            status=status,
+            as_attachment=True,
+            filename=filename,
+            content_type="application/octet-stream",
+        )
+        response.block_size = DOWNLOAD_CHUNK_SIZE
+    response["Content-Length"] = str(length)
+    return response
+
+
+class ZipOutput:
+    """
+    Write-only, unseekable file that collects what ZipFile writes to it
+    until it is taken out with pop().
+    """
+
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+        self.position = 0
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_zip(entries: Iterable[tuple[str, Path]]) -> Iterator[bytes]:
+    """
+    Generate a ZIP archive of (name in archive, file path) entries on the
+    fly. Entries are stored uncompressed (builds rarely compress well, and
+    this keeps it cheap) and memory use doesn't depend on the file sizes.
+    Missing files are skipped.
+    """
+    output = ZipOutput()
+    # As the output isn't seekable, ZipFile puts sizes and CRCs into data
+    # descriptors after each entry.
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as archive:
+        for name, full_path in entries:
+            try:
+                file = open(full_path, "rb")
+            except FileNotFoundError:
+                logger.warning(f"Skipping missing file {full_path} in ZIP")
+                continue
+            with file:
+                stat = os.fstat(file.fileno())
+                info = zipfile.ZipInfo(
+                    name, date_time=time.localtime(stat.st_mtime)[:6]
+                )
+                # Lets ZipFile decide on ZIP64 up front.
+                info.file_size = stat.st_size
+                with archive.open(info, "w") as entry:
+                    while data := file.read(DOWNLOAD_CHUNK_SIZE):
+                        entry.write(data)
+                        yield output.pop()
+            yield output.pop()
+    yield output.pop()
+
+
+async def iter_in_thread(iterator: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Run a blocking iterator in a worker thread, one chunk at a time.
+    """
+    while (data := await asyncio.to_thread(next, iterator, None)) is not None:
+        yield data
@@ -0,0 +1,206 @@
+"""
+Content-addressed blob store.
+
+Every distinct file content is stored once under
+{ARTIFACTS_STORAGE_PATH}/blobs/ and keyed by its SHA-256. The per-revision
+paths produced by generate_file_path() are hardlinks (or symlinks, where
+hardlinks aren't possible) to the blob, so nginx keeps serving them as
+before. Precompressed variants of a blob ({sha256}.gz, {sha256}.zst) are
+linked next to each of those paths in the same way. A blob is deleted once
+no Artifact references it anymore, together with the cached patches from or
+to it (see deltas.py).
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import uuid
+from collections.abc import Collection, Iterable
+from pathlib import Path
+
+from django.db import transaction
+
+from core.jobs import enqueue_job
+
+from .models import Artifact, Blob
+from .utils import (
+    COMPRESSED_SUFFIXES,
+    cleanup_empty_directories,
+    delete_file_if_exists,
+    get_full_file_path,
+    move_into_place,
+)
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR = "blobs"
+DELTAS_DIR = ".cache/deltas"
+
+
+def get_blob_path(sha256: str) -> str:
+    """
+    Generate file path for storing a blob.
+    Format: blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}
+    """
+    return f"{BLOBS_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def get_delta_path(base_sha256: str, target_sha256: str) -> str:
+    """
+    Generate file path for caching a patch between two blobs.
+    Format: .cache/deltas/{base_sha256}_{target_sha256}.zst
+    """
+    return f"{DELTAS_DIR}/{base_sha256}_{target_sha256}.zst"
+
+
+def delete_blob_deltas(sha256s: Collection[str]) -> None:
+    """
+    Delete the cached patches from or to any of the blobs, in one pass over
+    the cache directory.
+    """
+    for path in get_full_file_path(DELTAS_DIR).glob("*.zst"):
+        base, _, target = path.stem.partition("_")
+        if base in sha256s or target in sha256s:
+            path.unlink(missing_ok=True)
+
+
+def hash_file(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def store_blob(source: Path, sha256: str, size: int) -> Blob:
+    """
+    Move source into the blob store, or discard it if an identical blob is
+    already there. Must be called inside a transaction; the blob row stays
+    locked until it ends so that release_blobs() can't remove it meanwhile.
+    """
+    Blob.objects.bulk_create(
+        [Blob(sha256=sha256, size=size)], ignore_conflicts=True
+    )
+    blob = Blob.objects.select_for_update().get(sha256=sha256)
+
+    blob_path = get_blob_path(sha256)
+    if get_full_file_path(blob_path).exists():
+        source.unlink(missing_ok=True)
+    else:
+        move_into_place(source, blob_path)
+    return blob
+
+
+def get_existing_blob(
+    sha256: str, size: int | None = None, lock: bool = False
+) -> Blob | None:
+    """
+    Get the blob with the given digest (and size, if given) if it is stored.
+    With lock=True, must be called inside a transaction and keeps the blob
+    row locked until it ends.
+    """
+    blobs = Blob.objects.filter(sha256=sha256.lower())
+    if size is not None:
+        blobs = blobs.filter(size=size)
+    if lock:
+        blobs = blobs.select_for_update()
+
+    blob = blobs.first()
+    if (
+        blob is None
+        or not get_full_file_path(get_blob_path(blob.sha256)).exists()
+    ):
+        return None
+    return blob
+
+
+def link_file(source: Path, full_path: Path) -> None:
+    """
+    Atomically make full_path a hardlink (or, failing that, a symlink) to
+    source, replacing whatever was there before.
+    """
+    full_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = full_path.with_name(f".{full_path.name}.{uuid.uuid4().hex}")
+
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        os.symlink(os.path.relpath(source, temp_path.parent), temp_path)
+    try:
+        os.replace(temp_path, full_path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def link_blob(blob: Blob, file_path: str) -> None:
+    """
+    Atomically make file_path refer to the blob, replacing whatever was
+    there before. Precompressed variants of the blob are linked next to it,
+    and stale ones from the previous content are removed first.
+    """
+    blob_path = get_blob_path(blob.sha256)
+    full_path = get_full_file_path(file_path)
+
+    for suffix in COMPRESSED_SUFFIXES:
+        get_full_file_path(file_path + suffix).unlink(missing_ok=True)
+
+    link_file(get_full_file_path(blob_path), full_path)
+
+    for suffix in COMPRESSED_SUFFIXES:
+        variant = get_full_file_path(blob_path + suffix)
+        if variant.exists():
+            link_file(variant, get_full_file_path(file_path + suffix))
+
+
+def release_blobs(sha256s: Iterable[str] | None = None) -> int:
+    """
+    Delete blobs that are no longer referenced by any artifact. Checks the
+    given blobs, or all of them if none are given. Returns the number of
+    blobs deleted.
+    """
+    candidates = Blob.objects.filter(artifact__isnull=True)
+    if sha256s is not None:
+        candidates = candidates.filter(sha256__in=list(sha256s))
+
+    deleted = 0
+    for sha256 in candidates.values_list("sha256", flat=True):
+        with transaction.atomic():
+            # Re-check under the row lock: an upload may have attached to
+            # the blob since it was selected.
+            locked = list(
+                Blob.objects.select_for_update().filter(sha256=sha256)
+            )
+            if not locked or Artifact.objects.filter(blob_id=sha256).exists():
+                continue
+            locked[0].delete()
+            blob_path = get_blob_path(sha256)
+            delete_file_if_exists(blob_path)
+            cleanup_empty_directories(blob_path)
+            delete_blob_deltas({sha256})
+            deleted += 1
+
+    if deleted:
+        logger.info(f"Released {deleted} unreferenced blob(s)")
+    return deleted
+
+
+def delete_links(file_paths: Iterable[str]) -> None:
+    for file_path in file_paths:
+        delete_file_if_exists(file_path)
+        cleanup_empty_directories(file_path)
+
+
+def release_artifact_files(files: Iterable[tuple[str, str | None]]) -> None:
+    """
+    Follow-up of deleting artifacts, given their (file_path, blob_id) as
+    read before the delete: their links go once the deletion commits, and a
+    job releases their blobs if nothing references them anymore.
+    """
+    files = list(files)
+    if not files:
+        return
+    transaction.on_commit(
+        functools.partial(delete_links, [path for path, _ in files])
+    )
+    sha256s = sorted({blob_id for _, blob_id in files if blob_id})
+    if sha256s:
+        enqueue_job("artifacts.release_blobs", sha256s=sha256s)
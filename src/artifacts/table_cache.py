@@ -0,0 +1,167 @@
+"""
+Cache of the rendered artifacts table.
+
+The table is read far more often than it changes, so its rendered HTML is
+cached per permission variant (anonymous or manage_revisions) and query
+string (filters and page). Cache keys contain a version token, and
+invalidate_table_cache() replaces the token after every change that shows
+in the table, once it commits: uploads, table management, janitor runs and
+admin edits. Download counts and days until cleanup are allowed to lag by
+ARTIFACTS_TABLE_CACHE_TIMEOUT seconds (0 disables the cache).
+
+On a miss, only one request renders the table, so a version bump doesn't
+make all readers hit the database at once. The others get the entry of the
+previous version meanwhile, if it is still cached, or else wait for the
+render with backoff, for about as long as the last render took, before
+rendering it themselves. A previous version carries its own last event id,
+so live updates bring such a page up to date (see live.py).
+
+Pages for anonymous visitors are also cached by browsers and the CDN, and
+revalidated with get_table_validators().
+"""
+
+import hashlib
+import time
+import uuid
+from collections.abc import Callable
+from datetime import UTC, datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpRequest
+
+from .manifest import get_manifest_validators
+
+VERSION_KEY = "artifacts:table:version"
+PREVIOUS_VERSION_KEY = "artifacts:table:previous-version"
+RENDER_TIME_KEY = "artifacts:table:render-time"
+RENDER_LOCK_TIMEOUT = 10
+# Waiting for someone else's render polls the cache after FIRST_POLL
+# seconds, then at doubling intervals.
+FIRST_POLL = 0.05
+DEFAULT_RENDER_TIME = 0.5
+
+
+def get_table_version() -> str:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # First request after a cache flush; whoever adds it first wins.
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_table_version() -> None:
+    cache.set_many(
+        {
+            PREVIOUS_VERSION_KEY: cache.get(VERSION_KEY),
+            VERSION_KEY: uuid.uuid4().hex,
+        },
+        None,
+    )
+
+
+def invalidate_table_cache() -> None:
+    """
+    Make readers render the table again, once the current transaction (if
+    any) commits. Readers that render before that cache the table under
+    the old version, which nobody reads anymore.
+    """
+    transaction.on_commit(bump_table_version)
+
+
+async def ainvalidate_table_cache() -> None:
+    """
+    Async version of invalidate_table_cache(), outside of transactions.
+    """
+    await cache.aset_many(
+        {
+            PREVIOUS_VERSION_KEY: await cache.aget(VERSION_KEY),
+            VERSION_KEY: uuid.uuid4().hex,
+        },
+        None,
+    )
+
+
+def get_table_cache_key(
+    request: HttpRequest, can_manage: bool, version: str | None = None
+) -> str:
+    query = sorted(
+        (key, value) for key, values in request.GET.lists() for value in values
+    )
+    digest = hashlib.sha256(repr(query).encode()).hexdigest()[:32]
+    variant = "manage" if can_manage else "view"
+    if version is None:
+        version = get_table_version()
+    return f"artifacts:table:{version}:{variant}:{digest}"
+
+
+def get_cached_table(
+    request: HttpRequest, can_manage: bool, render: Callable[[], str]
+) -> str:
+    """
+    Get the rendered table for this request from the cache, or render it
+    with render() and cache it.
+    """
+    timeout = getattr(settings, "ARTIFACTS_TABLE_CACHE_TIMEOUT", 60)
+    if not timeout:
+        return render()
+
+    key = get_table_cache_key(request, can_manage)
+    html = cache.get(key)
+    if html is not None:
+        return html
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, RENDER_LOCK_TIMEOUT):
+        try:
+            started = time.monotonic()
+            html = render()
+            cache.set_many(
+                {key: html, RENDER_TIME_KEY: time.monotonic() - started},
+                timeout,
+            )
+        finally:
+            cache.delete(lock_key)
+        return html
+
+    # Someone else is rendering it. The previous version is at most as old
+    # as the render, which the next page load replaces.
+    previous_version = cache.get(PREVIOUS_VERSION_KEY)
+    if previous_version is not None:
+        html = cache.get(
+            get_table_cache_key(request, can_manage, previous_version)
+        )
+        if html is not None:
+            return html
+
+    # Wait for them rather than doing the same work, but only for about as
+    # long as doing it takes, in case they died or are slow.
+    render_time = cache.get(RENDER_TIME_KEY, DEFAULT_RENDER_TIME)
+    deadline = time.monotonic() + min(render_time, RENDER_LOCK_TIMEOUT)
+    interval = FIRST_POLL
+    while time.monotonic() < deadline:
+        time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+        interval *= 2
+        html = cache.get(key)
+        if html is not None:
+            return html
+    return render()
+
+
+def get_table_validators(request: HttpRequest) -> tuple[str, datetime]:
+    """
+    ETag and Last-Modified of the anonymous table for this request. These
+    are the manifest's, plus the current ARTIFACTS_TABLE_CACHE_TIMEOUT
+    period: download counts and days until cleanup change without touching
+    the revision and artifact rows, and may only lag that long.
+    """
+    etag, last_modified = get_manifest_validators(request)
+    period = max(getattr(settings, "ARTIFACTS_TABLE_CACHE_TIMEOUT", 60), 1)
+    now = int(time.time())
+    period_start = datetime.fromtimestamp(now - now % period, tz=UTC)
+    digest = hashlib.sha256(f"{etag}|{period_start}".encode()).hexdigest()
+    if last_modified is None or last_modified < period_start:
+        last_modified = period_start
+    return f'"{digest[:32]}"', last_modified
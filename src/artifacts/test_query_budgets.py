@@ -0,0 +1,342 @@
+"""
+Query budgets for the hot paths.
+
+Seeds a few months worth of builds and checks that each view stays
+within a fixed number of queries, however many revisions there are, and
+that the key queries are served by an index rather than a sequential scan
+of the large tables. Runs against whichever database is configured; see
+`just check-tests`.
+"""
+
+import json
+import re
+from collections.abc import Iterator
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser, Permission
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.context_processors import menu_context
+
+from .forms import RevisionFilterForm
+from .helpers import (
+    decode_cursor,
+    get_visible_revisions,
+    older_than,
+    paginate_revisions,
+)
+from .janitor import run_janitor
+from .live import LiveStream
+from .manifest import VALIDATOR_EVENTS
+from .matrix import build_artifact_map
+from .models import Artifact, Blob, ChangeEvent, Revision, Target
+from .tests import UPLOAD_TOKEN, StorageTestMixin
+
+User = get_user_model()
+
+REVISIONS = 2000
+TARGETS = [
+    "linux",
+    "linux-cuda",
+    "windows",
+    "windows-cuda",
+    "macos",
+    "android",
+]
+# Tables that grow with the number of builds.
+LARGE_TABLES = {
+    table._meta.db_table for table in (Revision, Artifact, Blob, ChangeEvent)
+}
+
+
+def seed() -> list[Revision]:
+    """
+    Two thousand revisions, every third one on one of a hundred PRs, with
+    an artifact per target each, and a change event per revision.
+    """
+    now = timezone.now()
+    Target.objects.bulk_create([
+        Target(id=target_id, name=target_id) for target_id in TARGETS
+    ])
+    revisions = Revision.objects.bulk_create([
+        Revision(
+            commit_hash=f"{i:040x}",
+            datetime=now - timedelta(hours=i),
+            pr_number=i % 100 if i % 3 == 0 else None,
+            is_pinned=i % 97 == 0,
+            is_hidden=i % 89 == 0,
+            tag_description="v0.31" if i % 200 == 0 else "",
+        )
+        for i in range(1, REVISIONS + 1)
+    ])
+    blobs = Blob.objects.bulk_create([
+        Blob(sha256=f"{i:064x}", size=1000 + i)
+        for i in range(len(revisions) * len(TARGETS))
+    ])
+    artifacts = Artifact.objects.bulk_create([
+        Artifact(
+            revision=revision,
+            target_id=target_id,
+            filename="lc0",
+            file_path=f"{revision.pk}/{target_id}/lc0",
+            size=blob.size,
+            blob=blob,
+        )
+        for (revision, target_id), blob in zip(
+            (
+                (revision, target_id)
+                for revision in revisions
+                for target_id in TARGETS
+            ),
+            blobs,
+            strict=True,
+        )
+    ])
+    by_revision: dict[int, list[Artifact]] = {}
+    for artifact in artifacts:
+        by_revision.setdefault(artifact.revision_id, []).append(artifact)
+    for revision in revisions:
+        revision.artifact_map = build_artifact_map(by_revision[revision.pk])
+    Revision.objects.bulk_update(revisions, ["artifact_map"], batch_size=500)
+    Revision.objects.update_expiry()
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(revision_id=revision.pk) for revision in revisions
+    ])
+    return revisions
+
+
+def walk_plan(node: dict, parent: dict | None = None) -> Iterator[tuple]:
+    yield node, parent
+    for child in node.get("Plans", []):
+        yield from walk_plan(child, node)
+
+
+class MaxQueriesContext(CaptureQueriesContext):
+    def __init__(self, test_case, budget: int):
+        super().__init__(connection)
+        self.test_case = test_case
+        self.budget = budget
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        queries = "\n".join(
+            f"{i}. {query['sql']}"
+            for i, query in enumerate(self.captured_queries, start=1)
+        )
+        self.test_case.assertLessEqual(
+            len(self), self.budget, f"Over budget:\n{queries}"
+        )
+
+
+# Caching would hide the queries being measured.
+@override_settings(ARTIFACTS_TABLE_CACHE_TIMEOUT=0)
+class QueryBudgetTests(StorageTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.revisions = seed()
+        cls.manager = User.objects.create_user(username="manager")
+        cls.manager.user_permissions.add(
+            Permission.objects.get(codename="manage_revisions")
+        )
+
+    def assertMaxQueries(self, budget: int):
+        return MaxQueriesContext(self, budget)
+
+    def assertIndexed(self, queryset: QuerySet):
+        """
+        Fail if the plan of the query scans one of the large tables in full.
+        PostgreSQL plans small test tables with sequential scans anyway, so
+        they are disabled while planning. A query without a usable index
+        then still scans the whole table, or the whole of some index. An
+        unfiltered scan in index order that stops at the LIMIT only reads
+        the end of the index, and is fine.
+        """
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+                cursor.execute("SET enable_seqscan = off")
+            try:
+                plan = queryset.explain(format="json")
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute("RESET enable_seqscan")
+            scanned = [
+                node["Relation Name"]
+                for node, parent in walk_plan(json.loads(plan)[0]["Plan"])
+                if node["Node Type"] == "Seq Scan"
+                or (
+                    node["Node Type"] in ("Index Scan", "Index Only Scan")
+                    and "Index Cond" not in node
+                    and not (
+                        parent
+                        and parent["Node Type"] == "Limit"
+                        and "Filter" not in node
+                    )
+                )
+            ]
+        else:
+            plan = queryset.explain()
+            # SCAN <table> without USING [COVERING] INDEX is a full scan,
+            # except in primary key order without a WHERE, up to the LIMIT.
+            scanned = re.findall(r"\bSCAN (\w+)(?: AS \w+)?$", plan, re.M)
+            if (
+                queryset.query.high_mark is not None
+                and not queryset.query.where
+                and "TEMP B-TREE" not in plan
+            ):
+                scanned = []
+        full_scans = set(scanned) & LARGE_TABLES
+        self.assertFalse(
+            full_scans,
+            f"Sequential scan of {', '.join(sorted(full_scans))}:\n"
+            f"{queryset.query}\n{plan}",
+        )
+
+    def test_table(self):
+        # Validators, change log position, revisions, targets, and the
+        # targets of the filter form.
+        with self.assertMaxQueries(6):
+            response = self.client.get(reverse("artifacts:table"))
+        self.assertEqual(len(response.context["matrix"]), 50)
+        with self.assertMaxQueries(6):
+            self.client.get(
+                reverse("artifacts:table"),
+                {"after": response.context["page"].older_cursor, "pr": "3"},
+            )
+
+    def test_table_for_managers(self):
+        self.client.force_login(self.manager)
+        # Plus the session, the user, their permissions and the last janitor
+        # run.
+        with self.assertMaxQueries(9):
+            response = self.client.get(reverse("artifacts:table"))
+        self.assertContains(response, "Save Changes")
+
+    def test_upload(self):
+        # Admission, revision, blob, artifact, map and change log; none of
+        # it depends on the number of revisions.
+        with self.assertMaxQueries(32):
+            response = self.client.put(
+                reverse("artifacts:upload")
+                + f"?filename=lc0&target_id=linux&commit_hash={'f' * 40}",
+                data=b"data",
+                content_type="application/octet-stream",
+                HTTP_AUTHORIZATION=f"Bearer {UPLOAD_TOKEN}",
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_manage(self):
+        self.client.force_login(self.manager)
+        page = self.revisions[:50]
+        data = {f"revision_{revision.pk}_hidden": "" for revision in page}
+        data.update({
+            f"revision_{revision.pk}_pinned": "on" for revision in page[:10]
+        })
+        data.update({
+            f"revision_{revision.pk}_deletion": "on"
+            for revision in page[10:15]
+        })
+        with self.assertMaxQueries(20):
+            response = self.client.post(reverse("artifacts:bulk_manage"), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            Revision.objects
+            .filter(pk__in=[r.pk for r in page])
+            .filter(is_pinned=True)
+            .count(),
+            10,
+        )
+
+    def test_janitor(self):
+        self.client.force_login(self.manager)
+        with self.assertMaxQueries(10):
+            response = self.client.post(reverse("artifacts:run_janitor"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_janitor_command(self):
+        expired = Revision.objects.expired().count()
+        self.assertGreater(expired, 1000)
+        # Recomputing expiry, selection and the two of purging abandoned
+        # uploads, then queries per batch that only depend on the batch
+        # size: Django deletes in chunks of 100 rows, and a batch of 500
+        # revisions has 3000 artifacts and blobs.
+        with self.assertMaxQueries(4 + 60 * -(-expired // 500)):
+            result = run_janitor(batch_size=500, parallelism=2)
+        self.assertEqual(result.revisions_deleted, expired)
+        self.assertEqual(result.artifacts_deleted, expired * len(TARGETS))
+
+    def test_menu_context(self):
+        request = RequestFactory().get("/artifacts/")
+        request.user = AnonymousUser()
+        with self.assertNumQueries(0):
+            context = menu_context(request)
+        self.assertTrue(context["menu_groups"])
+        request.user = self.manager
+        with self.assertNumQueries(0):
+            menu_context(request)
+
+    def test_manifest(self):
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse("artifacts:api_revisions"))
+        self.assertEqual(len(response.json()["revisions"]), 50)
+
+    def test_live_poll(self):
+        stream = LiveStream(
+            RequestFactory().get("/", {"column": TARGETS}).GET,
+            ChangeEvent.objects.order_by("id")[REVISIONS - 50].pk,
+            False,
+        )
+        # Gap check, events, revisions, targets.
+        with self.assertMaxQueries(4):
+            self.assertEqual(len(stream.poll()), 49)
+
+    def test_plans(self):
+        now = timezone.now()
+        visible = get_visible_revisions()
+        cursor = decode_cursor(
+            paginate_revisions(visible, 50).older_cursor or ""
+        )
+        filters = {}
+        for name, data in {
+            "pr": {"pr": "3"},
+            "pinned": {"pinned": "1"},
+            "scheduled": {"scheduled": "1"},
+        }.items():
+            filter_form = RevisionFilterForm(data)
+            self.assertTrue(filter_form.is_valid(), filter_form.errors)
+            filters[f"{name} filter"] = filter_form.filter(visible)[:51]
+        querysets = {
+            "table": visible[:51],
+            "table page": visible.filter(older_than(cursor))[:51],
+            **filters,
+            "expired": Revision.objects.expired(),
+            "pr revisions": Revision.objects.filter(pr_number=3),
+            "artifacts of a revision": Artifact.objects.filter(
+                revision=self.revisions[0]
+            ),
+            "artifacts of a target": Artifact.objects.filter(
+                target_id="linux"
+            ).values("revision_id"),
+            "blob": Blob.objects.filter(sha256="0" * 64),
+            "change events": ChangeEvent.objects.filter(id__gt=1).order_by(
+                "id"
+            )[:200],
+            "change log position": ChangeEvent.objects.order_by("-id")[:200],
+            "manifest validators": ChangeEvent.objects.order_by("-id")[
+                :VALIDATOR_EVENTS
+            ],
+            "pruned change events": ChangeEvent.objects.filter(
+                created_at__lt=now - timedelta(hours=1)
+            ),
+        }
+        for name, queryset in querysets.items():
+            with self.subTest(name):
+                self.assertIndexed(queryset)
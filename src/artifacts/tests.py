@@ -1,9 +1,90 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.auth.models import Permission
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.http import FileResponse, QueryDict
+from django.test import (
+    AsyncRequestFactory,
+    Client,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+from core.jobs import run_pending_jobs
+from core.models import Job
 
-# Testing imports for future use
-# from .models import Artifact, Revision, Target
+from .admission import get_token_key
+from .async_views import AsyncUploadView
+from .deltas import generate_delta, make_delta
+from .downloads import DownloadCounter
+from .helpers import (
+    RevisionPage,
+    decode_cursor,
+    get_artifacts_table_data,
+    get_visible_revisions,
+    paginate_revisions,
+)
+from .janitor import delete_batch, plan_janitor, run_janitor
+from .live import (
+    GAP_TIMEOUT,
+    LiveStream,
+    get_last_event_id,
+    prune_events,
+    publish_revision_changes,
+)
+from .matrix import refresh_artifact_maps
+from .models import (
+    Artifact,
+    Blob,
+    ChangeEvent,
+    JanitorRun,
+    Revision,
+    Target,
+    UploadSession,
+    UploadSlot,
+)
+from .serving import parse_byte_range
+from .storage import get_blob_path, release_blobs
+from .table_cache import (
+    PREVIOUS_VERSION_KEY,
+    RENDER_TIME_KEY,
+    bump_table_version,
+    get_cached_table,
+    get_table_cache_key,
+)
+from .upload_sessions import get_session_staging_file
+from .uploads import (
+    acreate_revision_and_target,
+    attach_blob,
+    create_revision_and_target,
+)
+from .utils import delete_file_if_exists
 
 User = get_user_model()
 
@@ -52,3 +133,2111 @@ class ArtifactsViewTests(TestCase):
         response = self.client.post("/artifacts/janitor/")
         # Should redirect to login since user lacks permission
         self.assertEqual(response.status_code, 302)
+
+
+class ManifestApiTests(TestCase):
+    def setUp(self):
+        self.target = Target.objects.create(id="linux", name="Linux")
+        now = timezone.now()
+        self.revisions = [
+            Revision.objects.create(
+                commit_hash=str(i) * 40,
+                # Two revisions with the same datetime to test the cursor.
+                datetime=now - timedelta(hours=min(i, 2)),
+                pr_number=7,
+            )
+            for i in range(4)
+        ]
+        for revision in self.revisions:
+            Artifact.objects.create(
+                revision=revision,
+                target=self.target,
+                filename="lc0",
+                file_path=f"{revision.pk}/linux/lc0",
+                size=100,
+            )
+        refresh_artifact_maps(revision.pk for revision in self.revisions)
+        Revision.objects.update_expiry()
+        self.url = reverse("artifacts:api_revisions")
+        self.ordered = list(Revision.objects.order_by("-datetime", "-id"))
+
+    def test_revisions_include_artifacts_and_cleanup_date(self):
+        data = self.client.get(self.url).json()
+        self.assertIsNone(data["next"])
+        self.assertEqual(
+            [revision["commit_hash"] for revision in data["revisions"]],
+            [revision.commit_hash for revision in self.ordered],
+        )
+        newest = data["revisions"][0]
+        artifact = Artifact.objects.get(revision=self.revisions[0])
+        self.assertEqual(
+            newest["artifacts"][0]["url"],
+            "http://testserver"
+            + reverse("artifacts:download", args=[artifact.pk]),
+        )
+        # Older revisions of the PR get the PR retention period.
+        for revision, is_latest in [
+            (newest, True),
+            (data["revisions"][1], False),
+        ]:
+            expected = Revision.objects.get(pk=revision["id"]).cleanup_at(
+                is_latest
+            )
+            self.assertEqual(
+                revision["cleanup_at"], DjangoJSONEncoder().default(expected)
+            )
+
+    def test_scheduled_revision_is_cleaned_up_now(self):
+        scheduled = Revision.objects.filter(pk=self.revisions[1].pk)
+        scheduled.update(is_scheduled_for_deletion=True)
+        scheduled.update_expiry()
+        publish_revision_changes([self.revisions[1].pk])
+        revision = self.client.get(self.url).json()["revisions"][1]
+        self.assertEqual(revision["id"], self.revisions[1].pk)
+        self.assertLessEqual(
+            datetime.fromisoformat(revision["cleanup_at"]), timezone.now()
+        )
+
+    def test_fields_can_be_selected(self):
+        data = self.client.get(
+            self.url, {"fields": "commit_hash,artifacts.sha256"}
+        ).json()
+        self.assertEqual(
+            data["revisions"][0],
+            {"commit_hash": "0" * 40, "artifacts": [{"sha256": None}]},
+        )
+        response = self.client.get(self.url, {"fields": "commit_hash,size"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination_visits_every_revision_once(self):
+        seen = []
+        url = self.url + "?limit=1&fields=id"
+        while url:
+            data = self.client.get(url).json()
+            seen += [revision["id"] for revision in data["revisions"]]
+            url = data["next"]
+        self.assertEqual(seen, [revision.pk for revision in self.ordered])
+
+        response = self.client.get(self.url, {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unchanged_manifest_is_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        # Another page or field selection is another representation.
+        self.assertNotEqual(
+            self.client.get(self.url, {"fields": "id"})["ETag"], etag
+        )
+
+    def test_changes_invalidate_etag(self):
+        etags = {self.client.get(self.url)["ETag"]}
+        self.revisions[1].is_pinned = True
+        self.revisions[1].save()
+        publish_revision_changes([self.revisions[1].pk])
+        etags.add(self.client.get(self.url)["ETag"])
+        Artifact.objects.filter(revision=self.revisions[2]).delete()
+        publish_revision_changes([self.revisions[2].pk])
+        etags.add(self.client.get(self.url)["ETag"])
+        self.assertEqual(len(etags), 3)
+
+    def test_late_commit_invalidates_etag(self):
+        publish_revision_changes([self.revisions[0].pk])
+        publish_revision_changes([self.revisions[1].pk])
+        # The earlier event's transaction hasn't committed yet.
+        earlier = ChangeEvent.objects.order_by("id")[0]
+        earlier.delete()
+        etag = self.client.get(self.url)["ETag"]
+        earlier.save()
+        self.assertNotEqual(self.client.get(self.url)["ETag"], etag)
+
+    def test_targets(self):
+        url = reverse("artifacts:api_targets")
+        response = self.client.get(url)
+        self.assertEqual(
+            response.json(), {"targets": [{"id": "linux", "name": "Linux"}]}
+        )
+        response = self.client.get(
+            url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class TableFilterTests(TestCase):
+    def setUp(self):
+        self.linux = Target.objects.create(id="linux", name="Linux")
+        self.windows = Target.objects.create(id="windows", name="Windows")
+        now = timezone.now()
+        self.revisions = []
+        for i in range(6):
+            revision = Revision.objects.create(
+                commit_hash=str(i) * 40,
+                datetime=now - timedelta(days=i),
+                pr_number=7 if i % 2 else None,
+                tag_description="v0.31" if i == 3 else "",
+                is_pinned=i == 4,
+            )
+            target = self.linux if i < 3 else self.windows
+            Artifact.objects.create(
+                revision=revision,
+                target=target,
+                filename="lc0",
+                file_path=f"{revision.pk}/{target.id}/lc0",
+                size=1,
+            )
+            self.revisions.append(revision)
+        refresh_artifact_maps(revision.pk for revision in self.revisions)
+
+    def get_commits(self, **params):
+        response = self.client.get(reverse("artifacts:table"), params)
+        self.assertEqual(response.status_code, 200)
+        return [
+            row.revision.commit_hash[0] for row in response.context["matrix"]
+        ]
+
+    def test_filters(self):
+        self.assertEqual(self.get_commits(), list("012345"))
+        self.assertEqual(self.get_commits(pr=7), list("135"))
+        self.assertEqual(self.get_commits(target="windows"), list("345"))
+        self.assertEqual(self.get_commits(tagged="1"), ["3"])
+        self.assertEqual(self.get_commits(pinned="1"), ["4"])
+        self.assertEqual(self.get_commits(scheduled="1"), [])
+        date = (timezone.now() - timedelta(days=2)).date()
+        self.assertEqual(
+            self.get_commits(date_from=date.isoformat()), list("012")
+        )
+        self.assertEqual(
+            self.get_commits(date_to=date.isoformat()), list("2345")
+        )
+
+    def test_target_filter_limits_columns(self):
+        response = self.client.get(
+            reverse("artifacts:table"), {"target": "windows"}
+        )
+        self.assertEqual(response.context["targets"], [self.windows])
+
+    def test_keyset_pagination_both_ways(self):
+        first = paginate_revisions(get_visible_revisions(), 2)
+        self.assertIsNone(first.newer_cursor)
+        second = paginate_revisions(
+            get_visible_revisions(), 2, after=decode_cursor(first.older_cursor)
+        )
+        self.assertEqual(
+            [revision.commit_hash[0] for revision in second.revisions],
+            ["2", "3"],
+        )
+        back = paginate_revisions(
+            get_visible_revisions(),
+            2,
+            before=decode_cursor(second.newer_cursor),
+        )
+        self.assertEqual(back.revisions, first.revisions)
+        self.assertIsNone(back.newer_cursor)
+
+        # Later pages take as many queries as the first one: one, since
+        # the artifacts come with the revisions.
+        cursor = decode_cursor(second.older_cursor)
+        with self.assertNumQueries(1):
+            paginate_revisions(get_visible_revisions(), 2)
+        with self.assertNumQueries(1):
+            last = paginate_revisions(get_visible_revisions(), 2, after=cursor)
+        self.assertIsNone(last.older_cursor)
+
+    @mock.patch("artifacts.views.get_artifacts_table_data")
+    def test_page_links_keep_filters(self, get_data):
+        get_data.return_value = ([], [], RevisionPage([], "new", "old"))
+        response = self.client.get(
+            reverse("artifacts:table"), {"pr": "7", "after": "x"}
+        )
+        self.assertContains(response, 'href="?pr=7&amp;after=old"')
+        self.assertContains(response, 'href="?pr=7&amp;before=new"')
+
+    def test_api_uses_same_filters(self):
+        response = self.client.get(
+            reverse("artifacts:api_revisions"),
+            {"pr": "7", "fields": "commit_hash"},
+        )
+        self.assertEqual(
+            [r["commit_hash"][0] for r in response.json()["revisions"]],
+            list("135"),
+        )
+        response = self.client.get(
+            reverse("artifacts:api_revisions"), {"pinned": "maybe"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    ARTIFACTS_RETENTION_DAYS=30,
+    ARTIFACTS_PR_RETENTION_DAYS=7,
+    ARTIFACTS_TABLE_CACHE_TIMEOUT=0,
+)
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.revisions = [
+            Revision.objects.create(
+                commit_hash=str(i) * 40,
+                datetime=self.now - timedelta(days=i),
+                pr_number=7 if i in (1, 2) else None,
+            )
+            for i in range(4)
+        ]
+        Revision.objects.update_expiry()
+
+    def create_revision(self, commit_hash, days_ago, pr_number=None):
+        revision, _ = create_revision_and_target({
+            "target_id": "linux",
+            "commit_hash": commit_hash,
+            "revision_datetime": self.now - timedelta(days=days_ago),
+            "pr_number": pr_number,
+            "tag_description": "",
+        })
+        return revision
+
+    def get_expiry(self, revision):
+        revision.refresh_from_db(fields=["expires_at"])
+        return revision.expires_at
+
+    def test_with_retention_matches_per_revision_logic(self):
+        with self.assertNumQueries(1):
+            revisions = list(Revision.objects.with_retention())
+        for revision in revisions:
+            with self.subTest(revision=revision.commit_hash[0]):
+                self.assertEqual(
+                    revision.latest_of_pr,
+                    Revision.objects.get(pk=revision.pk).is_latest_of_pr(),
+                )
+                self.assertEqual(
+                    revision.retention_expires_at, revision.expires_at
+                )
+        latest = {r.commit_hash[0]: r.latest_of_pr for r in revisions}
+        self.assertEqual(
+            latest, {"0": False, "1": True, "2": False, "3": False}
+        )
+        self.assertEqual(
+            self.get_expiry(self.revisions[1]),
+            self.revisions[1].datetime + timedelta(days=30),
+        )
+        self.assertEqual(
+            self.get_expiry(self.revisions[2]),
+            self.revisions[2].datetime + timedelta(days=7),
+        )
+
+    def test_table_has_no_per_row_retention_queries(self):
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(reverse("artifacts:table"))
+        self.assertContains(response, "in 29 days")
+        for i in range(10):
+            self.create_revision(chr(ord("a") + i) * 40, 5 + i, pr_number=8)
+        with self.assertNumQueries(len(few)):
+            response = self.client.get(reverse("artifacts:table"))
+        self.assertContains(response, "in 24 days")
+
+    def test_upload_updates_expiry_of_pr_revisions(self):
+        revision = self.create_revision("f" * 40, 0, pr_number=7)
+        self.assertEqual(
+            revision.expires_at, revision.datetime + timedelta(30)
+        )
+        # The previous latest revision of the PR gets the PR retention.
+        self.assertEqual(
+            self.get_expiry(self.revisions[1]),
+            self.revisions[1].datetime + timedelta(days=7),
+        )
+        # And live pages hear about it.
+        self.assertEqual(
+            set(ChangeEvent.objects.values_list("revision_id", flat=True)),
+            {revision.pk, self.revisions[1].pk, self.revisions[2].pk},
+        )
+
+    async def test_async_upload_sets_expiry(self):
+        revision, _ = await acreate_revision_and_target({
+            "target_id": "linux",
+            "commit_hash": "e" * 40,
+            "revision_datetime": self.now,
+            "pr_number": None,
+            "tag_description": "",
+        })
+        self.assertEqual(revision.expires_at, self.now + timedelta(days=30))
+
+    def test_pin_and_schedule_update_expiry(self):
+        user = User.objects.create_user(username="manager")
+        user.user_permissions.add(
+            Permission.objects.get(codename="manage_revisions")
+        )
+        self.client.force_login(user)
+        self.assertFalse(Revision.objects.expired().exists())
+
+        pinned, scheduled = self.revisions[0].pk, self.revisions[1].pk
+        self.client.post(
+            reverse("artifacts:bulk_manage"),
+            {
+                f"revision_{pinned}_pinned": "on",
+                f"revision_{scheduled}_deletion": "on",
+            },
+        )
+        self.assertIsNone(self.get_expiry(self.revisions[0]))
+        self.assertEqual(list(Revision.objects.expired()), [self.revisions[1]])
+
+        self.client.post(
+            reverse("artifacts:bulk_manage"),
+            {
+                f"revision_{pinned}_hidden": "",
+                f"revision_{scheduled}_hidden": "",
+            },
+        )
+        self.assertFalse(Revision.objects.expired().exists())
+        self.assertEqual(
+            self.get_expiry(self.revisions[0]),
+            self.revisions[0].datetime + timedelta(days=30),
+        )
+
+
+@override_settings(ARTIFACTS_TABLE_CACHE_TIMEOUT=60)
+class TableCacheTests(TestCase):
+    def setUp(self):
+        self.revision = Revision.objects.create(
+            commit_hash="a" * 40, datetime=timezone.now()
+        )
+        self.manager = User.objects.create_user(username="manager")
+        self.manager.user_permissions.add(
+            Permission.objects.get(codename="manage_revisions")
+        )
+
+    def get_table(self):
+        response = self.client.get(reverse("artifacts:table"))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    @mock.patch(
+        "artifacts.views.get_artifacts_table_data",
+        wraps=get_artifacts_table_data,
+    )
+    def test_table_is_rendered_once(self, get_data):
+        self.assertIn("aaaaaaaa", self.get_table())
+        self.assertIn("aaaaaaaa", self.get_table())
+        self.client.get(reverse("artifacts:table"), {"pr": "1"})
+        self.assertEqual(get_data.call_count, 2)
+
+    def test_permission_variants_are_cached_separately(self):
+        self.assertNotIn("revision_", self.get_table())
+        self.client.force_login(self.manager)
+        self.assertIn(f"revision_{self.revision.pk}_pinned", self.get_table())
+
+    def test_changes_invalidate_the_cache(self):
+        self.client.force_login(self.manager)
+        self.assertNotIn("status-badge pinned", self.get_table())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("artifacts:bulk_manage"),
+                {f"revision_{self.revision.pk}_pinned": "on"},
+            )
+        self.assertIn("status-badge pinned", self.get_table())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_revision_and_target({
+                "target_id": "linux",
+                "commit_hash": "b" * 40,
+                "revision_datetime": timezone.now(),
+                "pr_number": None,
+                "tag_description": "",
+            })
+        self.assertIn("bbbbbbbb", self.get_table())
+
+    def test_concurrent_miss_waits_for_the_renderer(self):
+        request = RequestFactory().get(reverse("artifacts:table"))
+        key = get_table_cache_key(request, False)
+        render = mock.Mock(return_value="fresh")
+        # Another request holds the render lock and finishes while this one
+        # waits.
+        cache.delete(PREVIOUS_VERSION_KEY)
+        cache.add(f"{key}:lock", 1)
+        with mock.patch(
+            "artifacts.table_cache.time.sleep",
+            side_effect=lambda _: cache.set(key, "theirs"),
+        ):
+            self.assertEqual(
+                get_cached_table(request, False, render), "theirs"
+            )
+        render.assert_not_called()
+
+    def test_concurrent_miss_gets_the_previous_version(self):
+        request = RequestFactory().get(reverse("artifacts:table"))
+        cache.set(get_table_cache_key(request, False), "previous")
+        bump_table_version()
+        cache.add(f"{get_table_cache_key(request, False)}:lock", 1)
+        render = mock.Mock(return_value="fresh")
+        self.assertEqual(get_cached_table(request, False, render), "previous")
+        render.assert_not_called()
+
+    def test_wait_is_bounded_by_the_render_time(self):
+        request = RequestFactory().get(reverse("artifacts:table"))
+        cache.delete(PREVIOUS_VERSION_KEY)
+        cache.set(RENDER_TIME_KEY, 0.2)
+        # The renderer died.
+        cache.add(f"{get_table_cache_key(request, False)}:lock", 1)
+        with mock.patch(
+            "artifacts.table_cache.time.sleep", wraps=time.sleep
+        ) as sleep:
+            self.assertEqual(
+                get_cached_table(request, False, lambda: "mine"), "mine"
+            )
+        # 0.05, 0.1, then the rest of the 0.2 seconds.
+        waits = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(waits[:2], [0.05, 0.1])
+        self.assertAlmostEqual(sum(waits), 0.2, delta=0.02)
+
+
+class EdgeCacheTests(TestCase):
+    def setUp(self):
+        self.revision = Revision.objects.create(
+            commit_hash="a" * 40, datetime=timezone.now()
+        )
+
+    def test_anonymous_table_is_public(self):
+        response = self.client.get(reverse("artifacts:table"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("s-maxage=60", response["Cache-Control"])
+        self.assertNotIn("Cookie", response.get("Vary", ""))
+        self.assertFalse(response.cookies)
+
+        # Revalidation only reads the end of the change log.
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("artifacts:table"),
+                HTTP_IF_NONE_MATCH=response["ETag"],
+            )
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("public", response["Cache-Control"])
+
+    def test_changes_and_time_change_the_etag(self):
+        etag = self.client.get(reverse("artifacts:table"))["ETag"]
+        revision = Revision.objects.create(
+            commit_hash="b" * 40, datetime=timezone.now()
+        )
+        publish_revision_changes([revision.pk])
+        new_etag = self.client.get(reverse("artifacts:table"))["ETag"]
+        self.assertNotEqual(new_etag, etag)
+        self.assertNotEqual(
+            self.client.get(reverse("artifacts:table"), {"pr": "1"})["ETag"],
+            new_etag,
+        )
+        # Download counts may only lag for one cache period.
+        with mock.patch(
+            "artifacts.table_cache.time.time", return_value=time.time() + 60
+        ):
+            self.assertNotEqual(
+                self.client.get(reverse("artifacts:table"))["ETag"], new_etag
+            )
+
+    def test_logged_in_users_get_private_responses(self):
+        self.client.force_login(User.objects.create_user(username="user"))
+        response = self.client.get(reverse("artifacts:table"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-store", response["Cache-Control"])
+        self.assertFalse(response.has_header("ETag"))
+        self.assertIn("user", response.content.decode())
+
+    def test_anonymous_manifest_is_public(self):
+        response = self.client.get(reverse("artifacts:api_revisions"))
+        self.assertIn("public", response["Cache-Control"])
+        self.client.force_login(User.objects.create_user(username="user"))
+        response = self.client.get(reverse("artifacts:api_revisions"))
+        self.assertIn("private", response["Cache-Control"])
+
+
+# Events are sent as soon as they are logged.
+class LiveStreamTests(TestCase):
+    def setUp(self):
+        self.linux = Target.objects.create(id="linux", name="Linux")
+        self.revision = Revision.objects.create(
+            commit_hash="a" * 40, datetime=timezone.now(), pr_number=7
+        )
+        Artifact.objects.create(
+            revision=self.revision,
+            target=self.linux,
+            filename="lc0",
+            file_path=f"{self.revision.pk}/linux/lc0",
+            size=1,
+        )
+        refresh_artifact_maps([self.revision.pk])
+        self.manager = User.objects.create_user(username="manager")
+        self.manager.user_permissions.add(
+            Permission.objects.get(codename="manage_revisions")
+        )
+
+    def get_events(self, stream):
+        return [
+            json.loads(message.split("data: ")[1]) for message in stream.poll()
+        ]
+
+    def test_changes_are_sent_as_rows(self):
+        stream = LiveStream(QueryDict("column=linux"), 0, False)
+        publish_revision_changes([self.revision.pk])
+        publish_revision_changes([self.revision.pk])
+        [event] = self.get_events(stream)
+        self.assertEqual(event["revision"], self.revision.pk)
+        self.assertIn(f'data-revision="{self.revision.pk}"', event["html"])
+        self.assertIn("lc0", event["html"])
+        self.assertNotIn("revision_", event["html"])
+        self.assertFalse(event["new_targets"])
+        self.assertEqual(self.get_events(stream), [])
+
+    def test_filtered_out_revision_has_no_row(self):
+        stream = LiveStream(QueryDict("pr=8"), 0, True)
+        publish_revision_changes([self.revision.pk])
+        self.assertEqual(self.get_events(stream)[0]["html"], "")
+
+    def test_new_targets_are_flagged(self):
+        stream = LiveStream(QueryDict(), 0, False)
+        publish_revision_changes([self.revision.pk])
+        self.assertTrue(self.get_events(stream)[0]["new_targets"])
+
+    def test_bulk_manage_publishes_changes(self):
+        stream = LiveStream(QueryDict("column=linux"), None, True)
+        self.assertEqual(stream.poll(), [])
+        self.client.force_login(self.manager)
+        self.client.post(
+            reverse("artifacts:bulk_manage"),
+            {f"revision_{self.revision.pk}_hidden": "on"},
+        )
+        [message] = stream.poll()
+        self.assertTrue(message.startswith("id: "))
+        self.assertEqual(json.loads(message.split("data: ")[1])["html"], "")
+
+    def test_pruned_events_require_a_reload(self):
+        publish_revision_changes([self.revision.pk])
+        first = ChangeEvent.objects.get().pk
+        publish_revision_changes([self.revision.pk])
+        ChangeEvent.objects.update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+        with mock.patch("artifacts.live._last_prune", 0.0):
+            prune_events()
+        self.assertEqual(ChangeEvent.objects.get().pk, first + 1)
+
+        stream = LiveStream(QueryDict(), first - 1, False)
+        self.assertEqual(stream.poll(), ["event: reload\ndata: {}\n\n"])
+        # A page that has seen the remaining event missed nothing.
+        stream = LiveStream(QueryDict(), first + 1, False)
+        self.assertEqual(stream.poll(), [])
+
+    def test_event_committed_late_is_not_skipped(self):
+        other = Revision.objects.create(
+            commit_hash="b" * 40, datetime=timezone.now()
+        )
+        for revision in (other, self.revision, other):
+            publish_revision_changes([revision.pk])
+        # The transaction of the middle event hasn't committed yet.
+        first, earlier, _ = ChangeEvent.objects.order_by("id")
+        ChangeEvent.objects.filter(pk=earlier.pk).delete()
+        self.assertEqual(get_last_event_id(), first.pk)
+        stream = LiveStream(QueryDict(), first.pk, False)
+        self.assertEqual(self.get_events(stream), [])
+
+        earlier.save()
+        self.assertEqual(
+            [event["revision"] for event in self.get_events(stream)],
+            [self.revision.pk, other.pk],
+        )
+
+    def test_old_gap_is_skipped(self):
+        for _ in range(3):
+            publish_revision_changes([self.revision.pk])
+        first, rolled_back, event = ChangeEvent.objects.order_by("id")
+        rolled_back.delete()
+        stream = LiveStream(QueryDict(), first.pk, False)
+        self.assertEqual(self.get_events(stream), [])
+
+        ChangeEvent.objects.update(created_at=timezone.now() - GAP_TIMEOUT * 2)
+        [message] = stream.poll()
+        self.assertTrue(message.startswith(f"id: {event.pk}\n"))
+
+    def test_live_view_resumes_from_last_event_id(self):
+        publish_revision_changes([self.revision.pk])
+        response = self.client.get(reverse("artifacts:live"), {"since": 0})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        content = b"".join(response.streaming_content).decode()
+        self.assertTrue(content.startswith("retry: "))
+        self.assertIn("event: revision", content)
+
+        last_event_id = ChangeEvent.objects.get().pk
+        response = self.client.get(
+            reverse("artifacts:live"),
+            {"since": 0},
+            HTTP_LAST_EVENT_ID=str(last_event_id),
+        )
+        content = b"".join(response.streaming_content).decode()
+        self.assertNotIn("event: revision", content)
+
+
+UPLOAD_TOKEN = "test-upload-token"
+
+
+class StorageTestMixin:
+    """Points ARTIFACTS_STORAGE_PATH at a throwaway directory."""
+
+    def setUp(self):
+        super().setUp()
+        self.storage_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage_path, ignore_errors=True)
+        settings_override = override_settings(
+            ARTIFACTS_STORAGE_PATH=self.storage_path,
+            ARTIFACTS_UPLOAD_TOKEN=UPLOAD_TOKEN,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {UPLOAD_TOKEN}"}
+
+
+class UploadViewTests(StorageTestMixin, TestCase):
+    def upload(self, content, **extra):
+        return self.client.post(
+            reverse("artifacts:upload"),
+            {
+                "file": SimpleUploadedFile("lc0", content),
+                "target_id": "linux-cuda",
+                "commit_hash": "b" * 40,
+                **extra,
+            },
+            **self.auth,
+        )
+
+    def test_multipart_upload_is_streamed_into_place(self):
+        response = self.upload(b"binary data", filename="lc0-linux")
+        self.assertEqual(response.status_code, 200)
+
+        artifact = Artifact.objects.get(pk=response.json()["artifact_id"])
+        self.assertEqual(artifact.filename, "lc0-linux")
+        self.assertEqual(artifact.size, 11)
+        self.assertEqual(
+            (Path(self.storage_path) / artifact.file_path).read_bytes(),
+            b"binary data",
+        )
+        self.assertEqual(
+            list(Path(self.storage_path, ".staging", "uploads").iterdir()),
+            [],
+        )
+
+    def test_multipart_upload_over_limit_is_rejected(self):
+        with override_settings(ARTIFACTS_MAX_FILE_SIZE=4):
+            response = self.upload(b"too large")
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Artifact.objects.exists())
+        self.assertEqual(
+            list(Path(self.storage_path, ".staging", "uploads").iterdir()),
+            [],
+        )
+
+    def test_raw_put_upload(self):
+        response = self.client.put(
+            reverse("artifacts:upload")
+            + f"?filename=lc0.tar&target_id=linux-cuda&commit_hash={'c' * 40}",
+            data=b"raw body",
+            content_type="application/octet-stream",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+
+        artifact = Artifact.objects.get(pk=response.json()["artifact_id"])
+        self.assertEqual(
+            (Path(self.storage_path) / artifact.file_path).read_bytes(),
+            b"raw body",
+        )
+
+    def test_raw_put_over_limit_is_rejected_before_reading(self):
+        with override_settings(ARTIFACTS_MAX_FILE_SIZE=4):
+            response = self.client.put(
+                reverse("artifacts:upload")
+                + f"?filename=x&target_id=t&commit_hash={'c' * 40}",
+                data=b"too large",
+                content_type="application/octet-stream",
+                **self.auth,
+            )
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Path(self.storage_path, ".staging").exists())
+
+
+class AsyncViewTests(StorageTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        self.headers = {"Authorization": f"Bearer {UPLOAD_TOKEN}"}
+
+    async def test_async_multipart_upload(self):
+        request = self.factory.post(
+            "/artifacts/upload/",
+            {
+                "file": SimpleUploadedFile("lc0", b"async data"),
+                "target_id": "linux-cuda",
+                "commit_hash": "d" * 40,
+            },
+            headers=self.headers,
+        )
+        response = await AsyncUploadView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+
+        artifact = await Artifact.objects.aget(
+            pk=json.loads(response.content)["artifact_id"]
+        )
+        self.assertEqual(artifact.filename, "lc0")
+        self.assertEqual(
+            (Path(self.storage_path) / artifact.file_path).read_bytes(),
+            b"async data",
+        )
+
+    async def test_async_raw_put_upload(self):
+        request = self.factory.put(
+            f"/artifacts/upload/?filename=lc0.tar&target_id=linux-cuda"
+            f"&commit_hash={'d' * 40}",
+            data=b"raw body",
+            content_type="application/octet-stream",
+            headers=self.headers,
+        )
+        response = await AsyncUploadView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content)["sha256"],
+            hashlib.sha256(b"raw body").hexdigest(),
+        )
+
+    async def test_async_upload_requires_token(self):
+        request = self.factory.put("/artifacts/upload/?filename=x", data=b"x")
+        response = await AsyncUploadView.as_view()(request)
+        self.assertEqual(response.status_code, 401)
+
+
+class DownloadViewTests(StorageTestMixin, TestCase):
+    CONTENT = bytes(range(256)) * 12000
+
+    def setUp(self):
+        super().setUp()
+        response = self.client.put(
+            reverse("artifacts:upload")
+            + f"?filename=lc0.exe&target_id=windows&commit_hash={'e' * 40}",
+            data=self.CONTENT,
+            content_type="application/octet-stream",
+            **self.auth,
+        )
+        self.artifact = Artifact.objects.get(pk=response.json()["artifact_id"])
+        self.url = reverse("artifacts:download", args=[self.artifact.pk])
+
+        self.counter = DownloadCounter()
+        counter_patch = mock.patch(
+            "artifacts.async_views.download_counter", self.counter
+        )
+        counter_patch.start()
+        self.addCleanup(counter_patch.stop)
+
+    def test_download_under_wsgi_uses_file_response(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response, FileResponse)
+        self.assertIn("lc0.exe", response["Content-Disposition"])
+        self.assertEqual(b"".join(response.streaming_content), self.CONTENT)
+
+    async def test_download_under_asgi_streams_asynchronously(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Length"], "3072000")
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b"".join(chunks), self.CONTENT)
+
+    def test_hidden_revision_is_not_downloadable(self):
+        Revision.objects.update(is_hidden=True)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_missing_file_is_404(self):
+        (Path(self.storage_path) / self.artifact.file_path).unlink()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_range_request_returns_partial_content(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=100-"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response["Content-Range"], "bytes 100-3071999/3072000"
+        )
+        self.assertEqual(response["Content-Length"], "3071900")
+        self.assertEqual(
+            b"".join(response.streaming_content), self.CONTENT[100:]
+        )
+
+        response = self.client.get(self.url, headers={"Range": "bytes=-10"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            b"".join(response.streaming_content), self.CONTENT[-10:]
+        )
+
+    async def test_range_request_under_asgi(self):
+        response = await self.async_client.get(
+            self.url, headers={"Range": "bytes=1000-2999999"}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Length"], "2999000")
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(b"".join(chunks), self.CONTENT[1000:3000000])
+
+    def test_unsatisfiable_range_is_416(self):
+        response = self.client.get(
+            self.url, headers={"Range": "bytes=3072000-"}
+        )
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */3072000")
+
+    def test_validators_allow_conditional_requests(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["ETag"], f'"{self.artifact.blob_id}"')
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        response = self.client.get(
+            self.url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            self.url,
+            headers={"If-Modified-Since": response["Last-Modified"]},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_if_range_sends_whole_file(self):
+        response = self.client.get(
+            self.url, headers={"Range": "bytes=100-", "If-Range": '"stale"'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Length"], "3072000")
+
+        response = self.client.get(
+            self.url,
+            headers={
+                "Range": "bytes=100-",
+                "If-Range": f'"{self.artifact.blob_id}"',
+            },
+        )
+        self.assertEqual(response.status_code, 206)
+
+    def test_resumed_downloads_are_not_counted(self):
+        self.client.get(self.url, headers={"Range": "bytes=0-99"})
+        self.client.get(self.url, headers={"Range": "bytes=100-"})
+        self.client.get(self.url, headers={"If-None-Match": "*"})
+        self.assertEqual(self.counter.flush(), 1)
+
+    def test_parse_byte_range(self):
+        self.assertEqual(parse_byte_range("bytes=0-9", 100), (0, 10))
+        self.assertEqual(parse_byte_range("bytes=90-200", 100), (90, 10))
+        self.assertEqual(parse_byte_range("bytes=-200", 100), (0, 100))
+        for header in [
+            "",
+            "items=0-9",
+            "bytes=0-1,5-9",
+            "bytes=9-0",
+            "bytes=x-",
+        ]:
+            self.assertIsNone(parse_byte_range(header, 100))
+        for header in ["bytes=100-", "bytes=-0"]:
+            with self.assertRaises(ValueError):
+                parse_byte_range(header, 100)
+
+    @override_settings(ARTIFACTS_X_ACCEL_REDIRECT_PREFIX="/_artifacts/")
+    def test_x_accel_redirect_hands_file_to_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            f"/_artifacts/{self.artifact.file_path}",
+        )
+        self.assertEqual(response.content, b"")
+        self.assertIn("lc0.exe", response["Content-Disposition"])
+
+    @override_settings(
+        ARTIFACTS_X_ACCEL_REDIRECT_PREFIX="/_artifacts/",
+        ARTIFACTS_DOWNLOAD_COUNT_FLUSH_SIZE=3,
+        ARTIFACTS_DOWNLOAD_COUNT_FLUSH_INTERVAL=3600,
+    )
+    def test_downloads_are_counted_in_batches(self):
+        for _ in range(2):
+            self.client.get(self.url)
+        self.client.head(self.url)
+        self.artifact.refresh_from_db()
+        self.assertEqual(self.artifact.download_count, 0)
+
+        self.client.get(self.url)
+        self.artifact.refresh_from_db()
+        self.assertEqual(self.artifact.download_count, 3)
+
+    def test_table_links_to_download_view_with_count(self):
+        Artifact.objects.update(download_count=42)
+        refresh_artifact_maps([self.artifact.revision_id])
+        response = self.client.get(reverse("artifacts:table"))
+        self.assertContains(response, f'href="{self.url}"')
+        self.assertContains(response, "⬇42")
+
+    def test_flush_aggregates_increments(self):
+        other = Artifact.objects.create(
+            revision=self.artifact.revision,
+            target=self.artifact.target,
+            filename="other",
+            file_path="other",
+            size=0,
+        )
+        for artifact_id in [self.artifact.pk, other.pk, self.artifact.pk]:
+            self.counter.add(artifact_id)
+
+        self.assertEqual(self.counter.flush(), 3)
+        self.assertEqual(self.counter.flush(), 0)
+        self.assertEqual(
+            dict(Artifact.objects.values_list("filename", "download_count")),
+            {"lc0.exe": 2, "other": 1},
+        )
+
+
+class ConcurrentUploadTests(StorageTestMixin, TransactionTestCase):
+    """Parallel CI matrix jobs uploading into the same commit."""
+
+    UPLOADS = 8
+
+    def upload(self, index):
+        try:
+            return (
+                Client()
+                .post(
+                    reverse("artifacts:upload"),
+                    {
+                        # Two jobs per target, racing on the same artifact.
+                        "file": SimpleUploadedFile("lc0", b"x" * (index + 1)),
+                        "target_id": f"target-{index % (self.UPLOADS // 2)}",
+                        "commit_hash": "d" * 40,
+                    },
+                    **self.auth,
+                )
+                .status_code
+            )
+        finally:
+            connection.close()
+
+    # SQLite's shared in-memory test database fails concurrent writers with
+    # "table is locked" instead of waiting, so this needs PostgreSQL.
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_parallel_uploads_of_same_commit(self):
+        with ThreadPoolExecutor(max_workers=self.UPLOADS) as executor:
+            statuses = list(executor.map(self.upload, range(self.UPLOADS)))
+
+        self.assertEqual(statuses, [200] * self.UPLOADS)
+        self.assertEqual(Revision.objects.count(), 1)
+        self.assertEqual(Target.objects.count(), self.UPLOADS // 2)
+        self.assertEqual(Artifact.objects.count(), self.UPLOADS // 2)
+        for artifact in Artifact.objects.all():
+            self.assertEqual(
+                (Path(self.storage_path) / artifact.file_path).stat().st_size,
+                artifact.size,
+            )
+
+    def commit_session(self, session_id):
+        try:
+            return (
+                Client()
+                .post(
+                    reverse(
+                        "artifacts:upload_session_commit", args=[session_id]
+                    ),
+                    **self.auth,
+                )
+                .status_code
+            )
+        finally:
+            connection.close()
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_parallel_commits_of_same_session(self):
+        response = self.client.post(
+            reverse("artifacts:upload_session_create"),
+            {
+                "target_id": "linux",
+                "commit_hash": "f" * 40,
+                "filename": "lc0",
+                "size": 4,
+            },
+            **self.auth,
+        )
+        session_id = response.json()["session_id"]
+        self.client.put(
+            reverse("artifacts:upload_chunk", args=[session_id, 0])
+            + "?offset=0",
+            b"abcd",
+            content_type="application/octet-stream",
+            **self.auth,
+        )
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            statuses = list(
+                executor.map(self.commit_session, [session_id] * 2)
+            )
+
+        self.assertEqual(sorted(statuses), [200, 404])
+        artifact = Artifact.objects.get()
+        self.assertEqual(
+            (Path(self.storage_path) / artifact.file_path).read_bytes(),
+            b"abcd",
+        )
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_reupload_replaces_file_and_row(self):
+        params = {"target_id": "t", "commit_hash": "e" * 40}
+        for content in (b"old build", b"new"):
+            response = self.client.post(
+                reverse("artifacts:upload"),
+                {"file": SimpleUploadedFile("lc0", content), **params},
+                **self.auth,
+            )
+            self.assertEqual(response.status_code, 200)
+
+        artifact = Artifact.objects.get()
+        self.assertEqual(artifact.size, 3)
+        self.assertEqual(
+            (Path(self.storage_path) / artifact.file_path).read_bytes(), b"new"
+        )
+
+
+class AdmissionControlTests(StorageTestMixin, TestCase):
+    def put(self, content, **extra):
+        return self.client.put(
+            reverse("artifacts:upload")
+            + f"?filename=lc0&target_id=linux&commit_hash={'a' * 40}",
+            data=content,
+            content_type="application/octet-stream",
+            **extra,
+        )
+
+    def hold_slot(self, token=UPLOAD_TOKEN, size=1, expires_in=60):
+        return UploadSlot.objects.create(
+            token_key=get_token_key(token),
+            size=size,
+            expires_at=timezone.now() + timedelta(seconds=expires_in),
+        )
+
+    def test_slot_is_released_after_upload(self):
+        self.assertEqual(self.put(b"data", **self.auth).status_code, 200)
+        self.assertFalse(UploadSlot.objects.exists())
+
+    @override_settings(
+        ARTIFACTS_UPLOAD_MAX_CONCURRENT=1, ARTIFACTS_UPLOAD_RETRY_AFTER=7
+    )
+    def test_over_global_limit_is_rejected_before_reading(self):
+        self.hold_slot(token="another-token")
+
+        response = self.put(b"data", **self.auth)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertFalse(Path(self.storage_path, ".staging").exists())
+        self.assertEqual(UploadSlot.objects.count(), 1)
+
+    @override_settings(ARTIFACTS_UPLOAD_MAX_CONCURRENT=1)
+    def test_expired_slots_are_ignored(self):
+        self.hold_slot(expires_in=-1)
+        self.assertEqual(self.put(b"data", **self.auth).status_code, 200)
+        self.assertFalse(UploadSlot.objects.exists())
+
+    @override_settings(ARTIFACTS_UPLOAD_MAX_INFLIGHT_BYTES_PER_TOKEN=10)
+    def test_per_token_bytes_limit(self):
+        self.hold_slot(token="another-token", size=100)
+        self.assertEqual(self.put(b"x" * 9, **self.auth).status_code, 200)
+
+        self.hold_slot(size=5)
+        self.assertEqual(self.put(b"x" * 9, **self.auth).status_code, 429)
+
+    @override_settings(ARTIFACTS_UPLOAD_MAX_INFLIGHT_BYTES=4)
+    def test_single_large_upload_is_admitted_when_idle(self):
+        self.assertEqual(self.put(b"too large", **self.auth).status_code, 200)
+
+    @override_settings(ARTIFACTS_UPLOAD_MAX_CONCURRENT=1)
+    def test_unauthenticated_request_takes_no_slot(self):
+        self.hold_slot()
+        self.assertEqual(self.put(b"data").status_code, 401)
+
+    @override_settings(
+        ARTIFACTS_UPLOAD_MAX_CONCURRENT=3,
+        ARTIFACTS_UPLOAD_MAX_INFLIGHT_BYTES=0,
+    )
+    def test_occupancy_status(self):
+        self.hold_slot(size=10)
+        self.hold_slot(token="another-token", size=20)
+
+        response = self.client.get(
+            reverse("artifacts:upload_status"), **self.auth
+        )
+        self.assertEqual(response.status_code, 200)
+        status = response.json()
+        self.assertEqual(
+            status["global"],
+            {"uploads": 2, "bytes": 30, "max_uploads": 3, "max_bytes": 0},
+        )
+        self.assertEqual(status["token"]["uploads"], 1)
+        self.assertEqual(status["token"]["bytes"], 10)
+
+
+class ArtifactMapTests(StorageTestMixin, TestCase):
+    def upload(self, filename, target_id, data=b"data"):
+        response = self.client.put(
+            reverse("artifacts:upload")
+            + f"?filename={filename}&target_id={target_id}"
+            + f"&commit_hash={'a' * 40}",
+            data=data,
+            content_type="application/octet-stream",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        return Artifact.objects.get(pk=response.json()["artifact_id"])
+
+    def get_revision(self):
+        return Revision.objects.get(commit_hash="a" * 40)
+
+    def test_uploads_update_the_map(self):
+        self.upload("lc0", "linux", b"one")
+        self.upload("lc0.exe", "windows")
+        self.upload("lc0", "linux", b"two")
+
+        revision = self.get_revision()
+        self.assertEqual(sorted(revision.artifact_map), ["linux", "windows"])
+        self.assertEqual(
+            revision.artifact_map["linux"][0]["sha256"],
+            hashlib.sha256(b"two").hexdigest(),
+        )
+        self.assertEqual(
+            [
+                (a.pk, a.target_id, a.filename, a.size, a.created_at)
+                for a in revision.get_artifacts()
+            ],
+            list(
+                Artifact.objects.order_by("target_id", "filename").values_list(
+                    "pk", "target_id", "filename", "size", "created_at"
+                )
+            ),
+        )
+
+    def test_table_data_takes_two_queries(self):
+        self.upload("lc0", "linux")
+        self.upload("lc0.exe", "windows")
+        with self.assertNumQueries(2):
+            targets, rows, _ = get_artifacts_table_data()
+        self.assertEqual([t.id for t in targets], ["linux", "windows"])
+        self.assertEqual(
+            [a.filename for a in rows[0].artifacts], ["lc0", "lc0.exe"]
+        )
+
+    def test_download_counts_reach_the_map(self):
+        artifact = self.upload("lc0", "linux")
+        counter = DownloadCounter()
+        counter.add(artifact.pk)
+        counter.add(artifact.pk)
+        counter.flush()
+        self.assertEqual(
+            self.get_revision().artifact_map["linux"][0]["download_count"], 2
+        )
+
+    def test_admin_deletion_updates_the_map(self):
+        artifact = self.upload("lc0", "linux")
+        self.upload("lc0.exe", "windows")
+        self.client.force_login(
+            User.objects.create_superuser(username="admin")
+        )
+        self.client.post(
+            reverse("admin:artifacts_artifact_delete", args=[artifact.pk]),
+            {"post": "yes"},
+        )
+        self.assertEqual(list(self.get_revision().artifact_map), ["windows"])
+
+
+class BlobStoreTests(StorageTestMixin, TestCase):
+    def upload(self, commit_hash, content):
+        response = self.client.post(
+            reverse("artifacts:upload"),
+            {
+                "file": SimpleUploadedFile("lc0", content),
+                "target_id": "linux",
+                "commit_hash": commit_hash,
+            },
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        return Artifact.objects.get(pk=response.json()["artifact_id"])
+
+    def path(self, file_path):
+        return Path(self.storage_path) / file_path
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload("1" * 40, b"same bytes")
+        second = self.upload("2" * 40, b"same bytes")
+
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(first.blob_id, second.blob_id)
+        blob_path = self.path(get_blob_path(first.blob_id))
+        self.assertTrue(
+            blob_path.samefile(self.path(first.file_path))
+            and blob_path.samefile(self.path(second.file_path))
+        )
+
+    def test_blob_is_deleted_with_its_last_artifact(self):
+        first = self.upload("1" * 40, b"same bytes")
+        second = self.upload("2" * 40, b"same bytes")
+        blob_path = self.path(get_blob_path(first.blob_id))
+
+        first.delete()
+        self.assertEqual(release_blobs(), 0)
+        self.assertTrue(blob_path.exists())
+
+        second.delete()
+        self.assertEqual(release_blobs(), 1)
+        self.assertFalse(blob_path.exists())
+        self.assertFalse(Blob.objects.exists())
+
+    def test_reupload_with_new_content_releases_old_blob(self):
+        old = self.upload("1" * 40, b"old")
+        new = self.upload("1" * 40, b"new")
+        self.assertTrue(self.path(get_blob_path(old.blob_id)).exists())
+
+        run_pending_jobs("test")
+        self.assertNotEqual(old.blob_id, new.blob_id)
+        self.assertEqual(list(Blob.objects.all()), [new.blob])
+        self.assertFalse(self.path(get_blob_path(old.blob_id)).exists())
+
+    def test_admin_deletion_releases_the_blob(self):
+        artifact = self.upload("1" * 40, b"bytes")
+        self.client.force_login(
+            User.objects.create_superuser(username="admin")
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse(
+                    "admin:artifacts_revision_delete",
+                    args=[artifact.revision_id],
+                ),
+                {"post": "yes"},
+            )
+        self.assertFalse(self.path(artifact.file_path).exists())
+
+        run_pending_jobs("test")
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(self.path(get_blob_path(artifact.blob_id)).exists())
+
+    def test_migrate_blob_store_deduplicates_existing_files(self):
+        revisions = [
+            Revision.objects.create(
+                commit_hash=c * 40, datetime=timezone.now()
+            )
+            for c in "12"
+        ]
+        target = Target.objects.create(id="linux", name="Linux")
+        for revision in revisions:
+            file_path = f"{revision.pk}/linux/lc0"
+            self.path(file_path).parent.mkdir(parents=True)
+            self.path(file_path).write_bytes(b"legacy")
+            Artifact.objects.create(
+                revision=revision,
+                target=target,
+                filename="lc0",
+                file_path=file_path,
+                size=6,
+            )
+
+        call_command("migrate_blob_store", stdout=io.StringIO())
+
+        first, second = Artifact.objects.order_by("pk")
+        self.assertIsNotNone(first.blob_id)
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertTrue(
+            self.path(first.file_path).samefile(self.path(second.file_path))
+        )
+        self.assertEqual(self.path(second.file_path).read_bytes(), b"legacy")
+        # The map, and with it the manifest, has the digests now.
+        for revision in revisions:
+            revision.refresh_from_db()
+            self.assertEqual(
+                revision.artifact_map["linux"][0]["sha256"], first.blob_id
+            )
+
+
+@override_settings(ARTIFACTS_RETENTION_DAYS=30, ARTIFACTS_PR_RETENTION_DAYS=7)
+class JanitorTests(StorageTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.artifacts = {
+            name: self.upload(name, content, now - timedelta(days=days), pr)
+            for name, content, days, pr in [
+                ("old", b"shared", 40, None),
+                ("new", b"shared", 1, None),
+                ("old-unique", b"unique", 40, None),
+                ("pinned", b"pinned", 40, None),
+                ("scheduled", b"scheduled", 1, None),
+                ("pr-superseded", b"pr-1", 10, 5),
+                ("pr-latest", b"pr-2", 9, 5),
+            ]
+        }
+        Revision.objects.filter(
+            pk=self.artifacts["pinned"].revision_id
+        ).update(is_pinned=True)
+        Revision.objects.filter(
+            pk=self.artifacts["scheduled"].revision_id
+        ).update(is_scheduled_for_deletion=True)
+        Revision.objects.update_expiry()
+        self.deleted = ["old", "old-unique", "scheduled", "pr-superseded"]
+
+    def upload(self, name, content, revision_datetime, pr_number):
+        data = {
+            "file": SimpleUploadedFile("lc0", content),
+            "target_id": "linux",
+            "commit_hash": hashlib.sha1(name.encode()).hexdigest(),
+            "datetime": revision_datetime.isoformat(),
+        }
+        if pr_number:
+            data["pr_number"] = pr_number
+        response = self.client.post(
+            reverse("artifacts:upload"), data, **self.auth
+        )
+        self.assertEqual(response.status_code, 200)
+        return Artifact.objects.get(pk=response.json()["artifact_id"])
+
+    def path(self, file_path):
+        return Path(self.storage_path) / file_path
+
+    def test_retention_changes_apply_to_the_next_run(self):
+        # Stored with 30 days of retention; "old" is 40 days old.
+        old = self.artifacts["old"].revision
+        with override_settings(ARTIFACTS_RETENTION_DAYS=60):
+            revisions = self.client.get(
+                reverse("artifacts:api_revisions"), {"fields": "id,cleanup_at"}
+            ).json()["revisions"]
+            self.assertIn(
+                {
+                    "id": old.pk,
+                    "cleanup_at": DjangoJSONEncoder().default(
+                        old.datetime + timedelta(days=60)
+                    ),
+                },
+                revisions,
+            )
+            self.assertEqual(plan_janitor().revisions_deleted, 2)
+            self.assertEqual(run_janitor().revisions_deleted, 2)
+        self.assertTrue(Revision.objects.filter(pk=old.pk).exists())
+        self.assertFalse(
+            Revision.objects.filter(
+                pk=self.artifacts["scheduled"].revision_id
+            ).exists()
+        )
+
+    def test_deletes_expired_revisions_with_their_files(self):
+        unique = self.artifacts["old-unique"]
+        delta_path = self.path(
+            f".cache/deltas/{self.artifacts['pinned'].blob_id}_"
+            f"{unique.blob_id}.zst"
+        )
+        delta_path.parent.mkdir(parents=True)
+        delta_path.write_bytes(b"patch")
+        last_event_id = ChangeEvent.objects.latest("id").pk
+
+        out = io.StringIO()
+        call_command(
+            "run_janitor", "--batch-size=2", "--parallelism=2", stdout=out
+        )
+
+        self.assertIn(
+            "Deleted 4 revision(s), 4 artifact(s) and 3 blob(s)",
+            out.getvalue(),
+        )
+        self.assertEqual(
+            set(Revision.objects.values_list("pk", flat=True)),
+            {
+                artifact.revision_id
+                for name, artifact in self.artifacts.items()
+                if name not in self.deleted
+            },
+        )
+        for name in self.deleted:
+            artifact = self.artifacts[name]
+            self.assertFalse(self.path(artifact.file_path).exists())
+            self.assertFalse(self.path(str(artifact.revision_id)).exists())
+        # The blob of "old" is still used by "new".
+        self.assertTrue(self.path(self.artifacts["new"].file_path).exists())
+        self.assertTrue(
+            self.path(get_blob_path(self.artifacts["new"].blob_id)).exists()
+        )
+        self.assertFalse(self.path(get_blob_path(unique.blob_id)).exists())
+        self.assertFalse(delta_path.exists())
+        self.assertEqual(
+            set(
+                ChangeEvent.objects.filter(id__gt=last_event_id).values_list(
+                    "revision_id", flat=True
+                )
+            ),
+            {self.artifacts[name].revision_id for name in self.deleted},
+        )
+
+    def test_dry_run_deletes_nothing(self):
+        out = io.StringIO()
+        call_command("run_janitor", "--dry-run", stdout=out)
+        self.assertIn(
+            "Would delete 4 revision(s), 4 artifact(s) and 3 blob(s), freeing"
+            " 19\xa0bytes",
+            out.getvalue(),
+        )
+        self.assertEqual(Revision.objects.count(), len(self.artifacts))
+        for artifact in self.artifacts.values():
+            self.assertTrue(self.path(artifact.file_path).exists())
+
+    def test_revisions_pinned_after_selection_are_kept(self):
+        pinned = self.artifacts["old"].revision_id
+
+        def pin(*args):
+            Revision.objects.filter(pk=pinned).update(
+                is_pinned=True, expires_at=None
+            )
+            return delete_batch(*args)
+
+        with mock.patch("artifacts.janitor.delete_batch", pin):
+            result = run_janitor()
+        self.assertEqual(result.scanned, 4)
+        self.assertEqual(result.revisions_deleted, 3)
+        self.assertFalse(result.errors)
+        self.assertTrue(Revision.objects.filter(pk=pinned).exists())
+        self.assertTrue(self.path(self.artifacts["old"].file_path).exists())
+
+    def login_manager(self):
+        user = User.objects.create_user(username="manager")
+        user.user_permissions.add(
+            Permission.objects.get(codename="manage_revisions")
+        )
+        self.client.force_login(user)
+
+    def test_run_janitor_now_runs_in_the_background(self):
+        self.login_manager()
+        response = self.client.post(reverse("artifacts:run_janitor"))
+        self.assertEqual(response.status_code, 302)
+        run = JanitorRun.objects.get()
+        self.assertEqual(run.status, JanitorRun.Status.QUEUED)
+        self.assertTrue(self.path(self.artifacts["old"].file_path).exists())
+
+        # Only one run at a time.
+        response = self.client.post(reverse("artifacts:run_janitor"))
+        self.assertEqual(
+            [str(m) for m in get_messages(response.wsgi_request)][-1],
+            "The janitor is already running.",
+        )
+        self.assertEqual(JanitorRun.objects.count(), 1)
+        response = self.client.get(reverse("artifacts:table"))
+        self.assertContains(response, "Janitor queued:")
+        self.assertContains(response, "data-active")
+
+        run_pending_jobs("test")
+        # Session, user, its permissions twice and the run.
+        with self.assertNumQueries(5):
+            data = self.client.get(reverse("artifacts:janitor_status")).json()
+        self.assertEqual(data["run"]["status"], "succeeded")
+        self.assertFalse(data["run"]["is_active"])
+        self.assertEqual(data["run"]["scanned"], 4)
+        self.assertEqual(data["run"]["revisions_deleted"], 4)
+        self.assertEqual(data["run"]["artifacts_deleted"], 4)
+        self.assertEqual(data["run"]["bytes_freed"], 19)
+        self.assertIn("Last janitor run succeeded", data["html"])
+        self.assertFalse(self.path(self.artifacts["old"].file_path).exists())
+
+        self.client.post(reverse("artifacts:run_janitor"))
+        self.assertEqual(JanitorRun.objects.filter(is_active=True).count(), 1)
+
+    def test_failed_run_is_recorded(self):
+        self.login_manager()
+        self.client.post(reverse("artifacts:run_janitor"))
+        with mock.patch(
+            "artifacts.janitor.run_janitor",
+            side_effect=RuntimeError("disk on fire"),
+        ):
+            run_pending_jobs("test")
+        run = JanitorRun.objects.get()
+        self.assertEqual(run.status, JanitorRun.Status.FAILED)
+        self.assertFalse(run.is_active)
+        self.assertEqual(run.errors, ["disk on fire"])
+        self.assertEqual(Job.objects.get().status, Job.Status.FAILED)
+
+    def test_status_requires_permission(self):
+        response = self.client.get(reverse("artifacts:janitor_status"))
+        self.assertEqual(response.status_code, 403)
+
+
+class PrecompressTests(StorageTestMixin, TestCase):
+    COMPRESSIBLE = b"lc0 network weights " * 5000
+
+    def setUp(self):
+        super().setUp()
+        Target.objects.create(id="linux", name="Linux", precompress=True)
+
+    def upload(self, content, target_id="linux", commit_hash="1" * 40):
+        response = self.client.post(
+            reverse("artifacts:upload"),
+            {
+                "file": SimpleUploadedFile("lc0", content),
+                "target_id": target_id,
+                "commit_hash": commit_hash,
+            },
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        run_pending_jobs("test")
+        return Artifact.objects.get(pk=response.json()["artifact_id"])
+
+    def path(self, file_path):
+        return Path(self.storage_path) / file_path
+
+    def test_gzip_variant_is_written_next_to_artifact(self):
+        artifact = self.upload(self.COMPRESSIBLE)
+
+        variant = self.path(artifact.file_path + ".gz")
+        self.assertEqual(
+            gzip.decompress(variant.read_bytes()), self.COMPRESSIBLE
+        )
+        self.assertTrue(
+            variant.samefile(
+                self.path(get_blob_path(artifact.blob_id) + ".gz")
+            )
+        )
+
+    def test_compression_is_queued_instead_of_run_inline(self):
+        response = self.client.put(
+            reverse("artifacts:upload")
+            + f"?filename=lc0&target_id=linux&commit_hash={'2' * 40}",
+            data=self.COMPRESSIBLE,
+            content_type="application/octet-stream",
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 200)
+        artifact = Artifact.objects.get(pk=response.json()["artifact_id"])
+        self.assertFalse(self.path(artifact.file_path + ".gz").exists())
+
+        job = Job.objects.get(name="artifacts.precompress")
+        self.assertEqual(job.payload, {"artifact_id": artifact.pk})
+        self.assertEqual(run_pending_jobs("test"), 1)
+        self.assertTrue(self.path(artifact.file_path + ".gz").exists())
+
+    def test_incompressible_file_gets_no_variant(self):
+        artifact = self.upload(os.urandom(10000))
+        self.assertFalse(self.path(artifact.file_path + ".gz").exists())
+
+    def test_targets_without_opt_in_are_not_compressed(self):
+        artifact = self.upload(self.COMPRESSIBLE, target_id="windows")
+        self.assertFalse(self.path(artifact.file_path + ".gz").exists())
+
+    def test_stale_variant_is_replaced_on_reupload(self):
+        self.upload(self.COMPRESSIBLE)
+        artifact = self.upload(os.urandom(10000))
+
+        self.assertFalse(self.path(artifact.file_path + ".gz").exists())
+        self.assertEqual(Blob.objects.count(), 1)
+
+    def test_variants_are_deleted_with_the_file(self):
+        artifact = self.upload(self.COMPRESSIBLE)
+        blob_path = get_blob_path(artifact.blob_id)
+
+        self.assertTrue(delete_file_if_exists(artifact.file_path))
+        self.assertFalse(self.path(artifact.file_path + ".gz").exists())
+        artifact.delete()
+        self.assertEqual(release_blobs(), 1)
+        self.assertFalse(self.path(blob_path + ".gz").exists())
+
+    def test_backfill_command(self):
+        Target.objects.filter(id="linux").update(precompress=False)
+        artifact = self.upload(self.COMPRESSIBLE)
+        Target.objects.filter(id="linux").update(precompress=True)
+
+        call_command("precompress_artifacts", stdout=io.StringIO())
+        self.assertTrue(self.path(artifact.file_path + ".gz").exists())
+
+
+@skipUnless(shutil.which("zstd"), "needs the zstd tool")
+@override_settings(ARTIFACTS_DELTA_LEVEL=3)
+class DeltaDownloadTests(StorageTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.old_content = os.urandom(500000)
+        self.new_content = (
+            self.old_content[:1000] + b"patched" + self.old_content[1000:]
+        )
+        self.old = self.upload(self.old_content, "1" * 40)
+        self.new = self.upload(self.new_content, "2" * 40)
+
+        counter_patch = mock.patch(
+            "artifacts.async_views.download_counter", DownloadCounter()
+        )
+        counter_patch.start()
+        self.addCleanup(counter_patch.stop)
+
+    def upload(self, content, commit_hash, target_id="linux"):
+        response = self.client.post(
+            reverse("artifacts:upload"),
+            {
+                "file": SimpleUploadedFile("lc0", content),
+                "target_id": target_id,
+                "commit_hash": commit_hash,
+            },
+            **self.auth,
+        )
+        return Artifact.objects.get(pk=response.json()["artifact_id"])
+
+    def delta_url(self, artifact, base_sha256):
+        return reverse(
+            "artifacts:download_delta", args=[artifact.pk, base_sha256]
+        )
+
+    def apply_patch(self, patch):
+        base = Path(self.storage_path) / "base"
+        base.write_bytes(self.old_content)
+        patch_path = Path(self.storage_path) / "patch.zst"
+        patch_path.write_bytes(patch)
+        return subprocess.run(
+            ["zstd", "-dqc", "--long=31", f"--patch-from={base}", patch_path],
+            check=True,
+            capture_output=True,
+        ).stdout
+
+    def test_patch_turns_base_into_target(self):
+        url = self.delta_url(self.new, self.old.blob_id)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response["Retry-After"], "5")
+
+        run_pending_jobs("test")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Artifact-SHA256"], self.new.blob_id)
+        patch = b"".join(response.streaming_content)
+        self.assertLess(len(patch), len(self.new_content) // 10)
+        self.assertEqual(self.apply_patch(patch), self.new_content)
+
+    def test_patch_is_generated_once(self):
+        url = self.delta_url(self.new, self.old.blob_id)
+        with mock.patch(
+            "artifacts.deltas.make_delta", wraps=make_delta
+        ) as make:
+            for _ in range(2):
+                self.assertEqual(self.client.get(url).status_code, 202)
+            run_pending_jobs("test")
+            for _ in range(2):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                b"".join(response.streaming_content)
+        self.assertEqual(make.call_count, 1)
+
+    def test_base_must_be_a_build_of_the_same_target(self):
+        other = self.upload(self.old_content + b"x", "3" * 40, "windows")
+        response = self.client.get(self.delta_url(self.new, other.blob_id))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("error", response.json())
+
+    @override_settings(ARTIFACTS_DELTA_CACHE_SIZE=1)
+    def test_least_recently_used_patches_are_evicted(self):
+        newest = self.upload(self.new_content + b"newest", "3" * 40)
+        first = generate_delta(self.old.blob_id, self.new.blob_id)
+        second = generate_delta(self.old.blob_id, newest.blob_id)
+
+        self.assertFalse((Path(self.storage_path) / first).exists())
+        self.assertTrue((Path(self.storage_path) / second).exists())
+
+    def test_temp_files_of_killed_jobs_are_swept(self):
+        deltas_dir = Path(self.storage_path) / ".cache" / "deltas"
+        deltas_dir.mkdir(parents=True)
+        stale = deltas_dir / ".a_b.zst.0123"
+        stale.write_bytes(b"partial")
+        old = time.time() - 2 * 3600
+        os.utime(stale, (old, old))
+        fresh = deltas_dir / ".c_d.zst.4567"
+        fresh.write_bytes(b"partial")
+
+        generate_delta(self.old.blob_id, self.new.blob_id)
+        self.assertFalse(stale.exists())
+        self.assertTrue(fresh.exists())
+
+    def test_released_blob_takes_its_patches_along(self):
+        delta_path = generate_delta(self.old.blob_id, self.new.blob_id)
+        self.new.delete()
+        release_blobs([self.new.blob_id])
+        self.assertFalse((Path(self.storage_path) / delta_path).exists())
+
+
+class RevisionZipTests(StorageTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.contents = {"linux": os.urandom(3000000), "windows": b"exe"}
+        for target_id, content in self.contents.items():
+            response = self.client.post(
+                reverse("artifacts:upload"),
+                {
+                    "file": SimpleUploadedFile("lc0", content),
+                    "target_id": target_id,
+                    "commit_hash": "1" * 40,
+                },
+                **self.auth,
+            )
+            self.assertEqual(response.status_code, 200)
+        self.revision = Revision.objects.get()
+        self.url = reverse(
+            "artifacts:download_revision", args=[self.revision.pk]
+        )
+
+        counter_patch = mock.patch(
+            "artifacts.async_views.download_counter", DownloadCounter()
+        )
+        counter_patch.start()
+        self.addCleanup(counter_patch.stop)
+
+    def read_zip(self, content):
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            return {
+                info.filename: archive.read(info)
+                for info in archive.infolist()
+                if info.compress_type == zipfile.ZIP_STORED
+            }
+
+    def test_zip_contains_all_targets(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertIn(
+            "artifacts-11111111.zip", response["Content-Disposition"]
+        )
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(
+            self.read_zip(b"".join(chunks)),
+            {
+                "linux/lc0": self.contents["linux"],
+                "windows/lc0": self.contents["windows"],
+            },
+        )
+
+    async def test_zip_under_asgi_streams_asynchronously(self):
+        response = await self.async_client.get(self.url, {"target": "windows"})
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(
+            self.read_zip(b"".join(chunks)), {"windows/lc0": b"exe"}
+        )
+
+    def test_targets_can_be_selected(self):
+        response = self.client.get(self.url, {"target": ["linux", "mac"]})
+        self.assertEqual(
+            list(self.read_zip(b"".join(response.streaming_content))),
+            ["linux/lc0"],
+        )
+        response = self.client.get(self.url, {"target": "mac"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_hidden_revision_is_not_downloadable(self):
+        Revision.objects.update(is_hidden=True)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class BlobPreflightTests(StorageTestMixin, TestCase):
+    content = b"unchanged binary"
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    def url(self):
+        return reverse("artifacts:upload_blob", args=[self.sha256])
+
+    def attach(self, **extra):
+        return self.client.post(
+            self.url(),
+            {
+                "size": len(self.content),
+                "filename": "lc0",
+                "target_id": "linux",
+                "commit_hash": "f" * 40,
+                **extra,
+            },
+            **self.auth,
+        )
+
+    def test_upload_is_hashed_while_streaming(self):
+        with mock.patch("artifacts.uploads.hash_file") as hash_file:
+            response = self.client.post(
+                reverse("artifacts:upload"),
+                {
+                    "file": SimpleUploadedFile("lc0", self.content),
+                    "target_id": "linux",
+                    "commit_hash": "e" * 40,
+                },
+                **self.auth,
+            )
+        hash_file.assert_not_called()
+        self.assertEqual(response.json()["sha256"], self.sha256)
+        self.assertEqual(Artifact.objects.get().sha256, self.sha256)
+
+    def test_preflight_and_attach(self):
+        self.assertEqual(
+            self.client.get(self.url(), **self.auth).status_code, 404
+        )
+        self.assertEqual(self.attach().status_code, 404)
+
+        self.client.put(
+            reverse("artifacts:upload")
+            + f"?filename=lc0&target_id=linux&commit_hash={'e' * 40}",
+            data=self.content,
+            content_type="application/octet-stream",
+            **self.auth,
+        )
+
+        response = self.client.get(
+            self.url() + f"?size={len(self.content)}", **self.auth
+        )
+        self.assertEqual(response.json()["exists"], True)
+
+        response = self.attach()
+        self.assertEqual(response.status_code, 200)
+        artifact = Artifact.objects.get(pk=response.json()["artifact_id"])
+        self.assertEqual(artifact.revision.commit_hash, "f" * 40)
+        self.assertEqual(artifact.sha256, self.sha256)
+        self.assertEqual(
+            (Path(self.storage_path) / artifact.file_path).read_bytes(),
+            self.content,
+        )
+
+    def test_attach_with_wrong_size_is_refused(self):
+        self.client.put(
+            reverse("artifacts:upload")
+            + f"?filename=lc0&target_id=linux&commit_hash={'e' * 40}",
+            data=self.content,
+            content_type="application/octet-stream",
+            **self.auth,
+        )
+        self.assertEqual(self.attach(size=1).status_code, 404)
+        self.assertEqual(Artifact.objects.count(), 1)
+        self.assertFalse(Revision.objects.filter(commit_hash="f" * 40))
+
+
+def make_tar(files, mode="w:gz"):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+class BatchUploadTests(StorageTestMixin, TestCase):
+    files = {"build/lc0": b"engine", "build/lc0.pdb": b"symbols"}
+    query = f"?target_id=linux&commit_hash={'a' * 40}"
+
+    def assert_stored(self, response, files):
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()["artifacts"]
+        self.assertEqual(
+            [result["filename"] for result in results],
+            [name.rsplit("/")[-1] for name in files],
+        )
+        for result, content in zip(results, files.values(), strict=True):
+            artifact = Artifact.objects.get(pk=result["artifact_id"])
+            self.assertEqual(
+                (Path(self.storage_path) / artifact.file_path).read_bytes(),
+                content,
+            )
+        self.assertEqual(
+            list(Path(self.storage_path, ".staging", "uploads").iterdir()),
+            [],
+        )
+
+    def put(self, body, content_type):
+        return self.client.put(
+            reverse("artifacts:upload_batch") + self.query,
+            data=body,
+            content_type=content_type,
+            **self.auth,
+        )
+
+    def test_multiple_file_parts(self):
+        response = self.client.post(
+            reverse("artifacts:upload_batch"),
+            {
+                "file": [
+                    SimpleUploadedFile("lc0", b"engine"),
+                    SimpleUploadedFile("lc0.pdb", b"symbols"),
+                ],
+                "target_id": "linux",
+                "commit_hash": "a" * 40,
+            },
+            **self.auth,
+        )
+        self.assert_stored(response, {"lc0": b"engine", "lc0.pdb": b"symbols"})
+
+    def test_archive_part(self):
+        response = self.client.post(
+            reverse("artifacts:upload_batch"),
+            {
+                "archive": SimpleUploadedFile("b.zip", make_zip(self.files)),
+                "target_id": "linux",
+                "commit_hash": "a" * 40,
+            },
+            **self.auth,
+        )
+        self.assert_stored(response, self.files)
+
+    def test_streamed_tar_body(self):
+        response = self.put(make_tar(self.files), "application/x-tar")
+        self.assert_stored(response, self.files)
+
+    def test_zip_body(self):
+        response = self.put(make_zip(self.files), "application/zip")
+        self.assert_stored(response, self.files)
+
+    def test_duplicate_filenames_are_reported_per_file(self):
+        response = self.put(
+            make_tar({"a/lc0": b"one", "b/lc0": b"two"}), "application/x-tar"
+        )
+        self.assertEqual(response.status_code, 200)
+        first, second = response.json()["artifacts"]
+        self.assertIn("artifact_id", first)
+        self.assertEqual(second["error"], "Duplicate filename")
+        self.assertFalse(response.json()["success"])
+
+    def test_invalid_archive(self):
+        response = self.put(b"not an archive", "application/x-tar")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Artifact.objects.exists())
+
+    def test_artifacts_are_created_in_one_transaction(self):
+        with mock.patch(
+            "artifacts.uploads.attach_blob",
+            side_effect=[mock.DEFAULT, OSError("disk full")],
+            wraps=attach_blob,
+        ):
+            response = self.put(make_tar(self.files), "application/x-tar")
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Artifact.objects.exists())
+
+
+class UploadSessionTests(StorageTestMixin, TestCase):
+    def create_session(self, size):
+        response = self.client.post(
+            reverse("artifacts:upload_session_create"),
+            {
+                "filename": "lc0.exe",
+                "target_id": "windows-cpu",
+                "commit_hash": "a" * 40,
+                "size": size,
+            },
+            **self.auth,
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()["session_id"]
+
+    def put_chunk(self, session_id, index, offset, data):
+        return self.client.put(
+            reverse(
+                "artifacts:upload_chunk",
+                kwargs={"session_id": session_id, "index": index},
+            )
+            + f"?offset={offset}",
+            data=data,
+            content_type="application/octet-stream",
+            **self.auth,
+        )
+
+    def test_requires_token(self):
+        response = self.client.post(
+            reverse("artifacts:upload_session_create"), {}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_chunks_out_of_order_then_commit(self):
+        session_id = self.create_session(10)
+
+        self.assertEqual(
+            self.put_chunk(session_id, 1, 6, b"6789").status_code, 200
+        )
+        status = self.client.get(
+            reverse("artifacts:upload_session", args=[session_id]), **self.auth
+        ).json()
+        self.assertEqual(status["received"], [[6, 10]])
+        self.assertEqual(status["missing"], [[0, 6]])
+
+        commit_url = reverse(
+            "artifacts:upload_session_commit", args=[session_id]
+        )
+        self.assertEqual(
+            self.client.post(commit_url, **self.auth).status_code, 409
+        )
+
+        self.put_chunk(session_id, 0, 0, b"012345")
+        response = self.client.post(commit_url, **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+        artifact = Artifact.objects.get(pk=response.json()["artifact_id"])
+        self.assertEqual(artifact.size, 10)
+        self.assertEqual(
+            (Path(self.storage_path) / artifact.file_path).read_bytes(),
+            b"0123456789",
+        )
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_chunk_past_declared_size_is_rejected(self):
+        session_id = self.create_session(4)
+        response = self.put_chunk(session_id, 0, 2, b"abcd")
+        self.assertEqual(response.status_code, 400)
+
+    def test_expired_sessions_are_purged(self):
+        session_id = self.create_session(4)
+        session = UploadSession.objects.get(pk=session_id)
+        staging_dir = get_session_staging_file(session).parent
+        UploadSession.objects.filter(pk=session_id).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        self.assertEqual(
+            self.put_chunk(session_id, 0, 0, b"ab").status_code, 404
+        )
+        self.create_session(4)
+        self.assertFalse(UploadSession.objects.filter(pk=session_id).exists())
+        self.assertFalse(staging_dir.exists())
+
+    def test_janitor_purges_abandoned_uploads(self):
+        expired_id = self.create_session(4)
+        expired_dir = get_session_staging_file(
+            UploadSession.objects.get(pk=expired_id)
+        ).parent
+        live_id = self.create_session(4)
+        live_dir = get_session_staging_file(
+            UploadSession.objects.get(pk=live_id)
+        ).parent
+        UploadSession.objects.filter(pk=expired_id).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        staging = Path(self.storage_path) / ".staging"
+        orphan_dir = staging / "sessions" / "orphan"
+        orphan_dir.mkdir()
+        (staging / "uploads").mkdir()
+        stale_upload = staging / "uploads" / "stale"
+        stale_upload.write_bytes(b"partial")
+        fresh_upload = staging / "uploads" / "fresh"
+        fresh_upload.write_bytes(b"partial")
+        old = time.time() - 2 * 24 * 3600
+        for path in (orphan_dir, stale_upload, live_dir):
+            os.utime(path, (old, old))
+
+        self.assertEqual(run_janitor().uploads_purged, 3)
+        self.assertFalse(expired_dir.exists())
+        self.assertFalse(orphan_dir.exists())
+        self.assertFalse(stale_upload.exists())
+        self.assertTrue(fresh_upload.exists())
+        self.assertTrue(live_dir.exists())
+        self.assertTrue(UploadSession.objects.filter(pk=live_id).exists())
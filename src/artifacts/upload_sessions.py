@@ -0,0 +1,179 @@
+import shutil
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import UploadChunk, UploadSession
+from .uploadhandler import UPLOADS_DIR
+from .utils import get_staging_path
+
+SESSIONS_DIR = "sessions"
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def get_session_ttl() -> timedelta:
+    return timedelta(
+        hours=getattr(settings, "ARTIFACTS_UPLOAD_SESSION_TTL_HOURS", 24)
+    )
+
+
+def get_session_staging_file(session: UploadSession) -> Path:
+    """
+    Get the staging file that chunks of a session are written into.
+    Format: .staging/sessions/{session_id}/data
+    """
+    return get_staging_path(SESSIONS_DIR, str(session.id), "data")
+
+
+def create_upload_session(
+    params: dict[str, Any], filename: str, size: int
+) -> UploadSession:
+    purge_expired_upload_sessions()
+
+    session = UploadSession.objects.create(
+        target_id=params["target_id"],
+        commit_hash=params["commit_hash"],
+        revision_datetime=params["revision_datetime"],
+        pr_number=params["pr_number"],
+        tag_description=params["tag_description"],
+        filename=filename,
+        size=size,
+        expires_at=timezone.now() + get_session_ttl(),
+    )
+
+    staging_file = get_session_staging_file(session)
+    staging_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(staging_file, "wb") as f:
+        f.truncate(size)
+
+    return session
+
+
+def touch_upload_session(session: UploadSession) -> None:
+    """
+    Push back the expiry of a session that is still being worked on.
+    """
+    session.expires_at = timezone.now() + get_session_ttl()
+    UploadSession.objects.filter(pk=session.pk).update(
+        expires_at=session.expires_at
+    )
+
+
+def write_chunk(
+    session: UploadSession,
+    index: int,
+    offset: int,
+    stream: BinaryIO,
+    length: int,
+) -> UploadChunk:
+    if offset < 0 or length < 0 or offset + length > session.size:
+        raise ValueError(
+            f"Chunk [{offset}, {offset + length}) is outside of the"
+            f" declared file size {session.size}"
+        )
+
+    # The file is opened without truncation so that concurrent chunk writes
+    # into different regions don't clobber each other.
+    with open(get_session_staging_file(session), "r+b") as destination:
+        destination.seek(offset)
+        remaining = length
+        while remaining > 0:
+            data = stream.read(min(remaining, COPY_BUFFER_SIZE))
+            if not data:
+                raise ValueError(
+                    f"Request body ended {remaining} bytes short of the"
+                    " declared chunk length"
+                )
+            destination.write(data)
+            remaining -= len(data)
+
+    chunk, _ = UploadChunk.objects.update_or_create(
+        session=session,
+        index=index,
+        defaults={"offset": offset, "size": length},
+    )
+    touch_upload_session(session)
+    return chunk
+
+
+def get_received_ranges(session: UploadSession) -> list[tuple[int, int]]:
+    """
+    Get merged [start, end) byte ranges that have been stored so far.
+    """
+    ranges: list[tuple[int, int]] = []
+    for offset, size in session.chunks.order_by("offset").values_list(
+        "offset", "size"
+    ):
+        start, end = offset, offset + size
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        elif size > 0:
+            ranges.append((start, end))
+    return ranges
+
+
+def get_missing_ranges(
+    size: int, received: list[tuple[int, int]]
+) -> list[tuple[int, int]]:
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append((position, start))
+        position = max(position, end)
+    if position < size:
+        missing.append((position, size))
+    return missing
+
+
+def delete_upload_session(session: UploadSession) -> None:
+    shutil.rmtree(get_session_staging_file(session).parent, ignore_errors=True)
+    session.delete()
+
+
+def purge_expired_upload_sessions() -> int:
+    """
+    Delete sessions that haven't received data within the TTL, together
+    with their staged data.
+    """
+    expired = list(UploadSession.objects.filter(expires_at__lt=timezone.now()))
+    for session in expired:
+        delete_upload_session(session)
+    return len(expired)
+
+
+def purge_abandoned_uploads() -> int:
+    """
+    Delete expired sessions, and staged data older than the session TTL
+    that no session or running upload owns anymore: session directories
+    whose row is gone and upload files of killed workers. Returns the
+    number of sessions and files deleted.
+    """
+    purged = purge_expired_upload_sessions()
+    stale_before = time.time() - get_session_ttl().total_seconds()
+    session_ids = {
+        str(pk) for pk in UploadSession.objects.values_list("pk", flat=True)
+    }
+    for parent in (SESSIONS_DIR, UPLOADS_DIR):
+        try:
+            paths = list(get_staging_path(parent).iterdir())
+        except FileNotFoundError:
+            continue
+        for path in paths:
+            if parent == SESSIONS_DIR and path.name in session_ids:
+                continue
+            try:
+                if path.stat().st_mtime >= stale_before:
+                    continue
+            except FileNotFoundError:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            purged += 1
+    return purged
@@ -0,0 +1,164 @@
+import hashlib
+import uuid
+from pathlib import Path
+from typing import IO, Any, BinaryIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from .utils import get_staging_path
+
+UPLOADS_DIR = "uploads"
+
+
+def get_upload_buffer_size() -> int:
+    return getattr(settings, "ARTIFACTS_UPLOAD_BUFFER_SIZE", 4 * 1024 * 1024)
+
+
+def new_staging_file() -> Path:
+    """
+    Get a fresh path in the staging area for a file that is being received.
+    Format: .staging/uploads/{uuid}
+    """
+    path = get_staging_path(UPLOADS_DIR, uuid.uuid4().hex)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    An uploaded file that was streamed into the staging area under
+    ARTIFACTS_STORAGE_PATH. It can be renamed into its final location
+    instead of being copied; if it isn't, it is removed on close. sha256 is
+    the digest computed while streaming, if any.
+    """
+
+    def __init__(
+        self,
+        staging_path: Path,
+        name: str | None,
+        content_type: str | None,
+        size: int,
+        charset: str | None = None,
+        content_type_extra: dict[str, Any] | None = None,
+        sha256: str | None = None,
+    ) -> None:
+        super().__init__(
+            open(staging_path, "rb"),
+            name,
+            content_type,
+            size,
+            charset,
+            content_type_extra,
+        )
+        self.staging_path = staging_path
+        self.sha256 = sha256
+
+    def temporary_file_path(self) -> str:
+        return str(self.staging_path)
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self.staging_path.unlink(missing_ok=True)
+
+
+class StreamingArtifactUploadHandler(FileUploadHandler):
+    """
+    Upload handler that writes multipart file data straight into the staging
+    area with large buffered writes, hashing it on the way, and stops
+    reading the request as soon as ARTIFACTS_MAX_FILE_SIZE is exceeded.
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, request: Any = None) -> None:
+        super().__init__(request)
+        self.file_too_large = False
+        self.staging_path: Path | None = None
+        self.destination: BinaryIO | None = None
+        self.hasher = hashlib.sha256()
+        self.received = 0
+
+    def new_file(self, *args: Any, **kwargs: Any) -> None:
+        super().new_file(*args, **kwargs)
+        self.staging_path = new_staging_file()
+        self.destination = open(
+            self.staging_path, "wb", buffering=get_upload_buffer_size()
+        )
+        self.hasher = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data: bytes, start: int) -> None:
+        assert self.destination is not None
+        self.received += len(raw_data)
+        if self.received > settings.ARTIFACTS_MAX_FILE_SIZE:
+            self.file_too_large = True
+            self.upload_interrupted()
+            raise StopUpload(connection_reset=True)
+        self.destination.write(raw_data)
+        self.hasher.update(raw_data)
+
+    def file_complete(self, file_size: int) -> StagedUploadedFile | None:
+        if self.destination is None or self.staging_path is None:
+            return None
+        self.destination.close()
+        self.destination = None
+        return StagedUploadedFile(
+            self.staging_path,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.content_type_extra,
+            sha256=self.hasher.hexdigest(),
+        )
+
+    def upload_interrupted(self) -> None:
+        if self.destination is not None:
+            self.destination.close()
+            self.destination = None
+        if self.staging_path is not None:
+            self.staging_path.unlink(missing_ok=True)
+            self.staging_path = None
+
+
+def stage_stream(
+    stream: IO[bytes], length: int, name: str
+) -> StagedUploadedFile:
+    """
+    Stream data of a known length, such as a raw request body or an archive
+    member, into the staging area.
+    """
+    staging_path = new_staging_file()
+    hasher = hashlib.sha256()
+    try:
+        with open(
+            staging_path, "wb", buffering=get_upload_buffer_size()
+        ) as destination:
+            remaining = length
+            while remaining > 0:
+                data = stream.read(
+                    min(remaining, StreamingArtifactUploadHandler.chunk_size)
+                )
+                if not data:
+                    raise ValueError(
+                        f"Stream ended {remaining} bytes short of the"
+                        " declared length"
+                    )
+                destination.write(data)
+                hasher.update(data)
+                remaining -= len(data)
+    except BaseException:
+        staging_path.unlink(missing_ok=True)
+        raise
+
+    return StagedUploadedFile(
+        staging_path,
+        name,
+        "application/octet-stream",
+        length,
+        sha256=hasher.hexdigest(),
+    )
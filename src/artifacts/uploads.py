@@ -0,0 +1,197 @@
+import functools
+from dataclasses import dataclass
+from typing import Any
+
+from django.db import transaction
+
+from core.jobs import enqueue_job
+
+from .live import apublish_revision_changes, publish_revision_changes
+from .matrix import refresh_artifact_maps
+from .models import Artifact, Blob, Revision, Target
+from .storage import hash_file, link_blob, store_blob
+from .uploadhandler import StagedUploadedFile
+from .utils import delete_file_if_exists, generate_file_path
+
+
+def create_revision_and_target(
+    params: dict[str, Any],
+) -> tuple[Revision, Target]:
+    # Parallel uploads for the same commit race to create these rows, so
+    # insert with ON CONFLICT DO NOTHING and read back whichever row won.
+    Target.objects.bulk_create(
+        [Target(id=params["target_id"], name=params["target_id"])],
+        ignore_conflicts=True,
+    )
+    Revision.objects.bulk_create(
+        [
+            Revision(
+                commit_hash=params["commit_hash"],
+                datetime=params["revision_datetime"],
+                pr_number=params["pr_number"],
+                tag_description=params["tag_description"],
+            )
+        ],
+        ignore_conflicts=True,
+    )
+
+    target = Target.objects.get(id=params["target_id"])
+    revision = Revision.objects.get(commit_hash=params["commit_hash"])
+    if revision.expires_at is None and not revision.is_pinned:
+        # New revision: set its expiry, and that of the previous latest
+        # revision of its PR.
+        publish_revision_changes(revision.refresh_expiry())
+    return revision, target
+
+
+async def acreate_revision_and_target(
+    params: dict[str, Any],
+) -> tuple[Revision, Target]:
+    """
+    Async version of create_revision_and_target().
+    """
+    await Target.objects.abulk_create(
+        [Target(id=params["target_id"], name=params["target_id"])],
+        ignore_conflicts=True,
+    )
+    await Revision.objects.abulk_create(
+        [
+            Revision(
+                commit_hash=params["commit_hash"],
+                datetime=params["revision_datetime"],
+                pr_number=params["pr_number"],
+                tag_description=params["tag_description"],
+            )
+        ],
+        ignore_conflicts=True,
+    )
+
+    target = await Target.objects.aget(id=params["target_id"])
+    revision = await Revision.objects.aget(commit_hash=params["commit_hash"])
+    if revision.expires_at is None and not revision.is_pinned:
+        await apublish_revision_changes(await revision.arefresh_expiry())
+    return revision, target
+
+
+@dataclass
+class BatchEntry:
+    """One file of a batch upload, and what became of it."""
+
+    filename: str
+    file: StagedUploadedFile | None = None
+    error: str | None = None
+    artifact: Artifact | None = None
+
+    def result(self) -> dict[str, Any]:
+        if self.artifact is None:
+            return {"filename": self.filename, "error": self.error}
+        return {
+            "filename": self.filename,
+            "artifact_id": self.artifact.pk,
+            "file_path": self.artifact.file_path,
+            "size": self.artifact.size,
+            "sha256": self.artifact.sha256,
+        }
+
+
+def replace_artifact(
+    revision: Revision,
+    target: Target,
+    filename: str,
+    staged_file: StagedUploadedFile,
+) -> Artifact:
+    return replace_artifacts(revision, target, [(filename, staged_file)])[0]
+
+
+def replace_artifacts(
+    revision: Revision,
+    target: Target,
+    staged_files: list[tuple[str, StagedUploadedFile]],
+) -> list[Artifact]:
+    """
+    Store staged files as artifacts of the revision/target in a single
+    transaction. Returns the artifacts in the order of staged_files.
+    """
+    digests = [
+        (
+            staged_file.sha256 or hash_file(staged_file.staging_path),
+            staged_file.staging_path.stat().st_size,
+            staged_file,
+        )
+        for _, staged_file in staged_files
+    ]
+
+    with transaction.atomic():
+        # Blob rows are locked in digest order and before the revision, so
+        # concurrent batches with overlapping content can't deadlock.
+        blobs = {
+            sha256: store_blob(staged_file.staging_path, sha256, size)
+            for sha256, size, staged_file in sorted(
+                digests, key=lambda digest: digest[0]
+            )
+        }
+        return [
+            attach_blob(revision, target, filename, blobs[sha256])
+            for (filename, _), (sha256, _, _) in zip(
+                staged_files, digests, strict=True
+            )
+        ]
+
+
+def attach_blob(
+    revision: Revision, target: Target, filename: str, blob: Blob
+) -> Artifact:
+    """
+    Create or replace the artifact so that it refers to the blob. The caller
+    must hold the row lock on the blob (see store_blob()).
+    """
+    file_path = generate_file_path(revision.pk, target.pk, filename)
+
+    with transaction.atomic():
+        # Serialize concurrent uploads into the same revision, so that the
+        # file on disk and the Artifact row always come from the same upload.
+        Revision.objects.select_for_update().get(pk=revision.pk)
+
+        old = (
+            Artifact.objects
+            .filter(revision=revision, target=target, filename=filename)
+            .values("file_path", "blob_id")
+            .first()
+        )
+
+        # Atomic rename over the old file, so downloads never see a gap.
+        link_blob(blob, file_path)
+
+        Artifact.objects.bulk_create(
+            [
+                Artifact(
+                    revision=revision,
+                    target=target,
+                    filename=filename,
+                    file_path=file_path,
+                    size=blob.size,
+                    blob=blob,
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=["revision", "target", "filename"],
+            update_fields=["file_path", "size", "blob", "created_at"],
+        )
+        artifact = Artifact.objects.get(
+            revision=revision, target=target, filename=filename
+        )
+        refresh_artifact_maps([revision.pk])
+
+        if old and old["file_path"] != file_path:
+            transaction.on_commit(
+                functools.partial(delete_file_if_exists, old["file_path"])
+            )
+        # Follow-up work is queued in the same transaction and done by the
+        # job workers, so the uploader doesn't wait for it.
+        if old and old["blob_id"] and old["blob_id"] != blob.sha256:
+            enqueue_job("artifacts.release_blobs", sha256s=[old["blob_id"]])
+        if target.precompress:
+            enqueue_job("artifacts.precompress", artifact_id=artifact.pk)
+        publish_revision_changes([revision.pk])
+
+    return artifact
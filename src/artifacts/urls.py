@@ -1,10 +1,28 @@
+from django.conf import settings
 from django.urls import path
 
+from .async_views import (
+    AsyncUploadView,
+    delta_download_view,
+    download_view,
+    revision_zip_view,
+)
 from .views import (
+    BatchUploadView,
+    BlobPreflightView,
+    UploadChunkView,
+    UploadSessionCommitView,
+    UploadSessionCreateView,
+    UploadSessionView,
+    UploadStatusView,
     UploadView,
     artifacts_table_view,
     bulk_manage_view,
+    janitor_status_view,
+    live_view,
+    revisions_api_view,
     run_janitor_view,
+    targets_api_view,
 )
 
 app_name = "artifacts"
@@ -13,5 +31,53 @@ urlpatterns = [
     path("", artifacts_table_view, name="table"),
     path("manage/", bulk_manage_view, name="bulk_manage"),
     path("janitor/", run_janitor_view, name="run_janitor"),
-    path("upload/", UploadView.as_view(), name="upload"),
+    path("janitor/status/", janitor_status_view, name="janitor_status"),
+    path("live/", live_view, name="live"),
+    path("api/revisions/", revisions_api_view, name="api_revisions"),
+    path("api/targets/", targets_api_view, name="api_targets"),
+    path("download/<int:artifact_id>/", download_view, name="download"),
+    path(
+        "download/<int:artifact_id>/delta/<str:base_sha256>/",
+        delta_download_view,
+        name="download_delta",
+    ),
+    path(
+        "download/revision/<int:revision_id>/",
+        revision_zip_view,
+        name="download_revision",
+    ),
+    path(
+        "upload/",
+        (
+            AsyncUploadView if settings.ARTIFACTS_ASYNC_VIEWS else UploadView
+        ).as_view(),
+        name="upload",
+    ),
+    path("upload/batch/", BatchUploadView.as_view(), name="upload_batch"),
+    path("upload/status/", UploadStatusView.as_view(), name="upload_status"),
+    path(
+        "upload/blobs/<str:sha256>/",
+        BlobPreflightView.as_view(),
+        name="upload_blob",
+    ),
+    path(
+        "upload/sessions/",
+        UploadSessionCreateView.as_view(),
+        name="upload_session_create",
+    ),
+    path(
+        "upload/sessions/<uuid:session_id>/",
+        UploadSessionView.as_view(),
+        name="upload_session",
+    ),
+    path(
+        "upload/sessions/<uuid:session_id>/chunks/<int:index>/",
+        UploadChunkView.as_view(),
+        name="upload_chunk",
+    ),
+    path(
+        "upload/sessions/<uuid:session_id>/commit/",
+        UploadSessionCommitView.as_view(),
+        name="upload_session_commit",
+    ),
 ]
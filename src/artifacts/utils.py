@@ -1,7 +1,13 @@
+import os
 from pathlib import Path
 
 from django.conf import settings
 
+STAGING_DIR = ".staging"
+
+# Suffixes of the precompressed variants stored next to a file.
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+
 
 def generate_file_path(revision_id: int, target_id: str, filename: str) -> str:
     """
@@ -28,10 +34,25 @@ def ensure_directory_exists(file_path: str) -> Path:
     return full_path
 
 
+def move_into_place(source: Path, file_path: str) -> Path:
+    """
+    Move a fully written file to its final location. Staged files live under
+    ARTIFACTS_STORAGE_PATH, so this is a rename rather than a copy.
+    """
+    full_path = ensure_directory_exists(file_path)
+    os.replace(source, full_path)
+    return full_path
+
+
 def delete_file_if_exists(file_path: str) -> bool:
     """
-    Delete a file if it exists.
+    Delete a file if it exists, together with its precompressed variants.
     """
+    for suffix in COMPRESSED_SUFFIXES:
+        try:
+            get_full_file_path(file_path + suffix).unlink(missing_ok=True)
+        except OSError:
+            pass
     try:
         full_path = get_full_file_path(file_path)
         if full_path.exists():
@@ -46,14 +67,20 @@ def cleanup_empty_directories(file_path: str) -> None:
     """
     Remove empty parent directories after file deletion.
     """
+    storage_path = Path(settings.ARTIFACTS_STORAGE_PATH)
+    parent = get_full_file_path(file_path).parent
     try:
-        full_path = get_full_file_path(file_path)
-        parent = full_path.parent
-        while parent != Path(settings.ARTIFACTS_STORAGE_PATH):
-            if parent.exists() and not any(parent.iterdir()):
-                parent.rmdir()
-                parent = parent.parent
-            else:
-                break
+        # rmdir() fails once a directory isn't empty (or is already gone).
+        while parent != storage_path:
+            parent.rmdir()
+            parent = parent.parent
     except OSError:
         pass
+
+
+def get_staging_path(*parts: str) -> Path:
+    """
+    Get a path inside the staging area for incomplete uploads.
+    Format: {ARTIFACTS_STORAGE_PATH}/.staging/{parts...}
+    """
+    return get_full_file_path(STAGING_DIR).joinpath(*parts)
@@ -1,38 +1,189 @@
+import functools
+import hashlib
+import json
 import logging
+import uuid
+from collections.abc import Callable
 from datetime import datetime
-from typing import Any
+from inspect import iscoroutinefunction
+from typing import Any, cast
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import permission_required
+from django.contrib.auth.models import AnonymousUser
 from django.core.files.uploadedfile import UploadedFile
-from django.http import HttpRequest, JsonResponse
-from django.shortcuts import redirect, render
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Q
+from django.http import (
+    HttpRequest,
+    HttpResponseBase,
+    JsonResponse,
+    QueryDict,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.cache import (
+    add_never_cache_headers,
+    get_conditional_response,
+    patch_cache_control,
+)
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
 from django.views import View
+from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
-
-from .helpers import get_artifacts_table_data
-from .models import Artifact, Revision, Target
-from .utils import (
-    delete_file_if_exists,
-    ensure_directory_exists,
-    generate_file_path,
+from django.views.decorators.http import require_safe
+
+from .admission import (
+    UploadRejected,
+    acquire_upload_slot,
+    get_token_key,
+    release_upload_slot,
+    upload_occupancy_status,
+)
+from .archives import stage_archive, stage_tar_stream
+from .forms import RevisionFilterForm
+from .helpers import (
+    Cursor,
+    decode_cursor,
+    get_artifacts_table_data,
+    get_visible_revisions,
+)
+from .janitor import start_janitor_run
+from .live import LiveStream, get_last_event_id, publish_revision_changes
+from .manifest import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    build_revisions_manifest,
+    build_targets_manifest,
+    get_manifest_validators,
+    parse_fields,
+)
+from .models import Artifact, JanitorRun, Revision, UploadSession
+from .storage import get_existing_blob
+from .table_cache import get_cached_table, get_table_validators
+from .upload_sessions import (
+    create_upload_session,
+    delete_upload_session,
+    get_missing_ranges,
+    get_received_ranges,
+    get_session_staging_file,
+    write_chunk,
+)
+from .uploadhandler import (
+    StagedUploadedFile,
+    StreamingArtifactUploadHandler,
+    stage_stream,
+)
+from .uploads import (
+    BatchEntry,
+    attach_blob,
+    create_revision_and_target,
+    replace_artifact,
+    replace_artifacts,
 )
 
 logger = logging.getLogger(__name__)
 
 
-def authenticate_upload_token(request: HttpRequest) -> bool:
+def get_bearer_token(request: HttpRequest) -> str | None:
     auth_header = request.META.get("HTTP_AUTHORIZATION", "")
     if not auth_header.startswith("Bearer "):
+        return None
+    return auth_header.removeprefix("Bearer ")
+
+
+def authenticate_upload_token(request: HttpRequest) -> bool:
+    token = get_bearer_token(request)
+    if token is None:
         return False
 
-    token = auth_header.removeprefix("Bearer ")
     return token == settings.ARTIFACTS_UPLOAD_TOKEN
 
 
+def get_upload_slot_request(request: HttpRequest) -> tuple[str, int]:
+    try:
+        size = max(0, int(request.META.get("CONTENT_LENGTH") or 0))
+    except ValueError:
+        size = 0
+    return get_token_key(get_bearer_token(request) or ""), size
+
+
+def too_many_uploads_response(e: UploadRejected) -> JsonResponse:
+    response = JsonResponse({"error": str(e)}, status=429)
+    response["Retry-After"] = str(e.retry_after)
+    return response
+
+
+def admission_controlled(view_method: Callable[..., Any]) -> Any:
+    """
+    Hold an upload slot while the (sync or async) view method runs, or
+    answer 429 right away if none is free, before the request body is read.
+    Requests without a valid token are passed through for the view to
+    reject.
+    """
+    if iscoroutinefunction(view_method):
+
+        @functools.wraps(view_method)
+        async def async_wrapper(
+            self: View, request: HttpRequest, *args: Any, **kwargs: Any
+        ) -> Any:
+            if not authenticate_upload_token(request):
+                return await view_method(self, request, *args, **kwargs)
+            try:
+                slot = await sync_to_async(acquire_upload_slot)(
+                    *get_upload_slot_request(request)
+                )
+            except UploadRejected as e:
+                return too_many_uploads_response(e)
+            try:
+                return await view_method(self, request, *args, **kwargs)
+            finally:
+                await sync_to_async(release_upload_slot)(slot)
+
+        return async_wrapper
+
+    @functools.wraps(view_method)
+    def wrapper(
+        self: View, request: HttpRequest, *args: Any, **kwargs: Any
+    ) -> Any:
+        if not authenticate_upload_token(request):
+            return view_method(self, request, *args, **kwargs)
+        try:
+            slot = acquire_upload_slot(*get_upload_slot_request(request))
+        except UploadRejected as e:
+            return too_many_uploads_response(e)
+        try:
+            return view_method(self, request, *args, **kwargs)
+        finally:
+            release_upload_slot(slot)
+
+    return wrapper
+
+
+def parse_revision_parameters(data: QueryDict) -> dict[str, Any]:
+    revision_datetime = data.get("datetime")
+    pr_number = data.get("pr_number")
+
+    return {
+        "target_id": data["target_id"],
+        "commit_hash": data["commit_hash"],
+        "revision_datetime": (
+            datetime.fromisoformat(revision_datetime)
+            if revision_datetime
+            else timezone.now()
+        ),
+        "pr_number": int(pr_number) if pr_number else None,
+        "tag_description": data.get("tag_description") or "",
+    }
+
+
 def parse_upload_parameters(request: HttpRequest) -> dict[str, Any]:
     file_data = request.FILES["file"]
     if isinstance(file_data, list):
@@ -42,72 +193,48 @@ def parse_upload_parameters(request: HttpRequest) -> dict[str, Any]:
     return {
         "file": uploaded_file,
         "filename": request.POST.get("filename", uploaded_file.name),
-        "target_id": request.POST["target_id"],
-        "commit_hash": request.POST["commit_hash"],
-        "revision_datetime": (
-            datetime.fromisoformat(request.POST["datetime"])
-            if request.POST.get("datetime")
-            else timezone.now()
-        ),
-        "pr_number": (
-            int(request.POST["pr_number"])
-            if request.POST.get("pr_number")
-            else None
-        ),
-        "tag_description": request.POST.get("tag_description") or None,
+        **parse_revision_parameters(request.POST),
     }
 
 
-def create_revision_and_target(
-    params: dict[str, Any],
-) -> tuple[Revision, Target]:
-    target, _ = Target.objects.get_or_create(
-        id=params["target_id"], defaults={"name": params["target_id"]}
-    )
+def artifact_response(artifact: Artifact) -> JsonResponse:
+    return JsonResponse({
+        "success": True,
+        "artifact_id": artifact.pk,
+        "file_path": artifact.file_path,
+        "size": artifact.size,
+        "sha256": artifact.sha256,
+    })
 
-    revision, _ = Revision.objects.get_or_create(
-        commit_hash=params["commit_hash"],
-        defaults={
-            "datetime": params["revision_datetime"],
-            "pr_number": params["pr_number"],
-            "tag_description": params["tag_description"],
+
+def file_too_large_response() -> JsonResponse:
+    return JsonResponse(
+        {
+            "error": (
+                "File too large. Maximum size:"
+                f" {settings.ARTIFACTS_MAX_FILE_SIZE} bytes"
+            )
         },
+        status=413,
     )
 
-    return revision, target
-
-
-def delete_existing_artifact(
-    revision: Revision, target: Target, filename: str
-) -> None:
-    try:
-        existing_artifact = Artifact.objects.get(
-            revision=revision, target=target, filename=filename
-        )
-    except Artifact.DoesNotExist:
-        return
-
-    delete_file_if_exists(existing_artifact.file_path)
-    existing_artifact.delete()
-
-
-def save_uploaded_file(uploaded_file: Any, file_path: str) -> None:
-    full_path = ensure_directory_exists(file_path)
-
-    with open(full_path, "wb") as destination:
-        for chunk in uploaded_file.chunks():
-            destination.write(chunk)
-
 
 @method_decorator(csrf_exempt, name="dispatch")
 class UploadView(View):
+    @admission_controlled
     def post(self, request: HttpRequest) -> JsonResponse:
         if not authenticate_upload_token(request):
             return JsonResponse(
                 {"error": "Invalid or missing authorization token"}, status=401
             )
 
+        # Must be installed before request.FILES is first accessed.
+        upload_handler = StreamingArtifactUploadHandler(request)
+        request.upload_handlers = [upload_handler]
+
         if "file" not in request.FILES:
+            if upload_handler.file_too_large:
+                return file_too_large_response()
             return JsonResponse({"error": "No file provided"}, status=400)
 
         file_data = request.FILES["file"]
@@ -117,32 +244,59 @@ class UploadView(View):
             )
         uploaded_file: UploadedFile = file_data
         if uploaded_file.size > settings.ARTIFACTS_MAX_FILE_SIZE:
+            return file_too_large_response()
+
+        try:
+            params = parse_upload_parameters(request)
+        except (KeyError, ValueError) as e:
             return JsonResponse(
-                {
-                    "error": (
-                        "File too large. Maximum size:"
-                        f" {settings.ARTIFACTS_MAX_FILE_SIZE} bytes"
-                    )
-                },
-                status=413,
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
+            )
+        return self.store_artifact(params)
+
+    @admission_controlled
+    def put(self, request: HttpRequest) -> JsonResponse:
+        """
+        Raw-body upload: the request body is the file itself and the upload
+        parameters are passed in the query string.
+        """
+        if not authenticate_upload_token(request):
+            return JsonResponse(
+                {"error": "Invalid or missing authorization token"}, status=401
             )
 
         try:
-            params = parse_upload_parameters(request)
-            revision, target = create_revision_and_target(params)
-            file_path = generate_file_path(
-                revision.pk, target.pk, params["filename"]
+            length = int(request.META["CONTENT_LENGTH"])
+        except (KeyError, ValueError):
+            return JsonResponse(
+                {"error": "Content-Length is required"}, status=411
+            )
+        if length > settings.ARTIFACTS_MAX_FILE_SIZE:
+            return file_too_large_response()
+
+        try:
+            params = {
+                "filename": request.GET["filename"],
+                **parse_revision_parameters(request.GET),
+            }
+            params["file"] = stage_stream(request, length, params["filename"])
+        except (KeyError, ValueError) as e:
+            return JsonResponse(
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
             )
 
-            delete_existing_artifact(revision, target, params["filename"])
-            save_uploaded_file(params["file"], file_path)
+        try:
+            return self.store_artifact(params)
+        finally:
+            params["file"].close()
 
-            artifact = Artifact.objects.create(
-                revision=revision,
-                target=target,
-                filename=params["filename"],
-                file_path=file_path,
-                size=params["file"].size,
+    def store_artifact(self, params: dict[str, Any]) -> JsonResponse:
+        try:
+            revision, target = create_revision_and_target(params)
+            artifact = replace_artifact(
+                revision, target, params["filename"], params["file"]
             )
 
             logger.info(
@@ -150,12 +304,7 @@ class UploadView(View):
                 f" {params['commit_hash']} ({params['target_id']})"
             )
 
-            return JsonResponse({
-                "success": True,
-                "artifact_id": artifact.pk,
-                "file_path": file_path,
-                "size": params["file"].size,
-            })
+            return artifact_response(artifact)
 
         except (KeyError, ValueError) as e:
             return JsonResponse(
@@ -169,22 +318,557 @@ class UploadView(View):
             )
 
 
-def artifacts_table_view(request: HttpRequest):
-    targets, matrix = get_artifacts_table_data()
+def upload_session_status(session: UploadSession) -> dict[str, Any]:
+    received = get_received_ranges(session)
+    return {
+        "session_id": str(session.id),
+        "filename": session.filename,
+        "size": session.size,
+        "received": received,
+        "missing": get_missing_ranges(session.size, received),
+        "expires_at": session.expires_at.isoformat(),
+    }
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class UploadTokenView(View):
+    """
+    Base for upload API views that require the upload token on every
+    request.
+    """
+
+    def dispatch(self, request: HttpRequest, *args: Any, **kwargs: Any):
+        if not authenticate_upload_token(request):
+            return JsonResponse(
+                {"error": "Invalid or missing authorization token"}, status=401
+            )
+        return super().dispatch(request, *args, **kwargs)
+
+
+class UploadStatusView(UploadTokenView):
+    """
+    Reports how many uploads and bytes are in flight, globally and for the
+    caller's token, against the configured limits.
+    """
+
+    def get(self, request: HttpRequest) -> JsonResponse:
+        token_key, _ = get_upload_slot_request(request)
+        return JsonResponse(upload_occupancy_status(token_key))
+
+
+def get_live_session(
+    session_id: uuid.UUID, for_update: bool = False
+) -> UploadSession:
+    sessions = UploadSession.objects.all()
+    if for_update:
+        sessions = sessions.select_for_update()
+    return get_object_or_404(
+        sessions, id=session_id, expires_at__gte=timezone.now()
+    )
+
+
+class UploadSessionCreateView(UploadTokenView):
+    def post(self, request: HttpRequest) -> JsonResponse:
+        try:
+            params = parse_revision_parameters(request.POST)
+            filename = request.POST["filename"]
+            size = int(request.POST["size"])
+            if size < 0:
+                raise ValueError("size must not be negative")
+        except (KeyError, ValueError) as e:
+            return JsonResponse(
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
+            )
+
+        if size > settings.ARTIFACTS_MAX_FILE_SIZE:
+            return file_too_large_response()
+
+        session = create_upload_session(params, filename, size)
+        return JsonResponse(upload_session_status(session), status=201)
+
+
+class UploadSessionView(UploadTokenView):
+    def get(self, request: HttpRequest, session_id: uuid.UUID) -> JsonResponse:
+        session = get_live_session(session_id)
+        return JsonResponse(upload_session_status(session))
+
+    def delete(
+        self, request: HttpRequest, session_id: uuid.UUID
+    ) -> JsonResponse:
+        with transaction.atomic():
+            # Not while a commit is moving the staged data into place.
+            session = get_live_session(session_id, for_update=True)
+            delete_upload_session(session)
+        return JsonResponse({"success": True})
+
+
+class UploadChunkView(UploadTokenView):
+    @admission_controlled
+    def put(
+        self, request: HttpRequest, session_id: uuid.UUID, index: int
+    ) -> JsonResponse:
+        session = get_live_session(session_id)
+        try:
+            offset = int(request.GET["offset"])
+            length = int(request.META["CONTENT_LENGTH"])
+            chunk = write_chunk(session, index, offset, request, length)
+        except (KeyError, ValueError) as e:
+            return JsonResponse(
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
+            )
+
+        return JsonResponse({
+            "index": chunk.index,
+            "offset": chunk.offset,
+            "size": chunk.size,
+        })
+
+
+class UploadSessionCommitView(UploadTokenView):
+    @transaction.atomic
+    def post(
+        self, request: HttpRequest, session_id: uuid.UUID
+    ) -> JsonResponse:
+        # A concurrent commit of the same session waits here until this one
+        # is done, and then finds the session gone.
+        session = get_live_session(session_id, for_update=True)
+        status = upload_session_status(session)
+        if status["missing"]:
+            return JsonResponse(
+                {"error": "Upload is incomplete", **status}, status=409
+            )
+
+        try:
+            # A savepoint, so that the session stays locked after a failure.
+            with transaction.atomic():
+                params = {
+                    "target_id": session.target_id,
+                    "commit_hash": session.commit_hash,
+                    "revision_datetime": session.revision_datetime,
+                    "pr_number": session.pr_number,
+                    "tag_description": session.tag_description,
+                }
+                revision, target = create_revision_and_target(params)
+                staged_file = StagedUploadedFile(
+                    get_session_staging_file(session),
+                    session.filename,
+                    "application/octet-stream",
+                    session.size,
+                )
+                try:
+                    artifact = replace_artifact(
+                        revision, target, session.filename, staged_file
+                    )
+                finally:
+                    staged_file.close()
+                delete_upload_session(session)
+        except Exception as e:
+            logger.error(f"Upload session commit failed: {str(e)}")
+            return JsonResponse(
+                {"error": f"Upload failed: {str(e)}"}, status=500
+            )
+
+        logger.info(
+            f"Uploaded artifact: {session.filename} for"
+            f" {session.commit_hash} ({session.target_id}) via session"
+            f" {session_id}"
+        )
+        return artifact_response(artifact)
+
+
+class BlobPreflightView(UploadTokenView):
+    """
+    Lets CI skip uploading files the server already has. GET reports whether
+    a blob with the given SHA-256 (and optionally ?size=) is stored; POST
+    attaches it to a revision/target/filename without transferring it.
+    """
+
+    def get(self, request: HttpRequest, sha256: str) -> JsonResponse:
+        try:
+            size = int(request.GET["size"]) if "size" in request.GET else None
+        except ValueError as e:
+            return JsonResponse(
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
+            )
+
+        blob = get_existing_blob(sha256, size)
+        if blob is None:
+            return JsonResponse({"exists": False}, status=404)
+        return JsonResponse({
+            "exists": True,
+            "sha256": blob.sha256,
+            "size": blob.size,
+        })
+
+    def post(self, request: HttpRequest, sha256: str) -> JsonResponse:
+        try:
+            params = parse_revision_parameters(request.POST)
+            filename = request.POST["filename"]
+            size = int(request.POST["size"])
+        except (KeyError, ValueError) as e:
+            return JsonResponse(
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
+            )
+
+        if get_existing_blob(sha256, size) is None:
+            return JsonResponse({"exists": False}, status=404)
+
+        revision, target = create_revision_and_target(params)
+        with transaction.atomic():
+            # Re-check under the lock, the blob may have been released.
+            blob = get_existing_blob(sha256, size, lock=True)
+            if blob is None:
+                return JsonResponse({"exists": False}, status=404)
+            artifact = attach_blob(revision, target, filename, blob)
+
+        logger.info(
+            f"Attached existing blob {sha256[:16]} as {filename} for"
+            f" {params['commit_hash']} ({params['target_id']})"
+        )
+        return artifact_response(artifact)
+
+
+class BatchUploadView(UploadTokenView):
+    """
+    Uploads several files of one revision/target in one request: either as
+    multiple "file" parts and/or tar/zip "archive" parts of a multipart
+    POST, or as a raw tar (or zip) body of a PUT with the parameters in the
+    query string. All artifacts are created in one transaction.
+    """
+
+    @admission_controlled
+    def post(self, request: HttpRequest) -> JsonResponse:
+        upload_handler = StreamingArtifactUploadHandler(request)
+        request.upload_handlers = [upload_handler]
+
+        files = request.FILES.getlist("file")
+        archives = request.FILES.getlist("archive")
+        if upload_handler.file_too_large:
+            return file_too_large_response()
+        if not files and not archives:
+            return JsonResponse({"error": "No files provided"}, status=400)
+
+        # The streaming upload handler only ever produces staged files.
+        entries = [
+            BatchEntry(
+                filename=uploaded_file.name or "",
+                file=cast(StagedUploadedFile, uploaded_file),
+            )
+            for uploaded_file in files
+        ]
+        try:
+            params = parse_revision_parameters(request.POST)
+            for archive in archives:
+                entries.extend(
+                    stage_archive(cast(StagedUploadedFile, archive))
+                )
+        except (KeyError, ValueError) as e:
+            close_batch_entries(entries)
+            return JsonResponse(
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
+            )
+        return self.store_batch(params, entries)
+
+    @admission_controlled
+    def put(self, request: HttpRequest) -> JsonResponse:
+        if "CONTENT_LENGTH" not in request.META:
+            return JsonResponse(
+                {"error": "Content-Length is required"}, status=411
+            )
+
+        entries: list[BatchEntry] = []
+        try:
+            params = parse_revision_parameters(request.GET)
+            if request.content_type == "application/zip":
+                # Zip archives keep their index at the end, so they have to
+                # be staged first.
+                archive = stage_stream(
+                    request, int(request.META["CONTENT_LENGTH"]), "archive"
+                )
+                try:
+                    entries.extend(stage_archive(archive))
+                finally:
+                    archive.close()
+            else:
+                entries.extend(stage_tar_stream(request))
+        except (KeyError, ValueError) as e:
+            close_batch_entries(entries)
+            return JsonResponse(
+                {"error": f"Missing or invalid parameters: {str(e)}"},
+                status=400,
+            )
+        return self.store_batch(params, entries)
+
+    def store_batch(
+        self, params: dict[str, Any], entries: list[BatchEntry]
+    ) -> JsonResponse:
+        seen: set[str] = set()
+        for entry in entries:
+            if entry.error is None and entry.filename in seen:
+                entry.error = "Duplicate filename"
+            seen.add(entry.filename)
+
+        valid = [
+            entry
+            for entry in entries
+            if entry.error is None and entry.file is not None
+        ]
+        try:
+            if valid:
+                revision, target = create_revision_and_target(params)
+                artifacts = replace_artifacts(
+                    revision,
+                    target,
+                    [
+                        (entry.filename, entry.file)
+                        for entry in valid
+                        if entry.file is not None
+                    ],
+                )
+                for entry, artifact in zip(valid, artifacts, strict=True):
+                    entry.artifact = artifact
+        except Exception as e:
+            logger.error(f"Batch upload failed: {str(e)}")
+            return JsonResponse(
+                {"error": f"Upload failed: {str(e)}"}, status=500
+            )
+        finally:
+            close_batch_entries(entries)
+
+        logger.info(
+            f"Uploaded {len(valid)} artifact(s) for {params['commit_hash']}"
+            f" ({params['target_id']})"
+        )
+
+        return JsonResponse(
+            {
+                "success": bool(valid) and len(valid) == len(entries),
+                "artifacts": [entry.result() for entry in entries],
+            },
+            status=200 if valid else 400,
+        )
+
+
+def close_batch_entries(entries: list[BatchEntry]) -> None:
+    for entry in entries:
+        if entry.file is not None:
+            entry.file.close()
+
+
+def get_table_cursor(request: HttpRequest, name: str) -> Cursor | None:
+    try:
+        return decode_cursor(request.GET.get(name, ""))
+    except ValueError:
+        # Missing, stale or mangled; show the first page.
+        return None
+
+
+def can_manage_revisions(request: HttpRequest) -> bool:
+    return (
+        request.user.is_authenticated
+        and hasattr(request.user, "has_perm")
+        and request.user.has_perm("artifacts.manage_revisions")
+    )
+
+
+def has_session(request: HttpRequest) -> bool:
+    return settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def patch_edge_cache_headers(
+    request: HttpRequest, response: HttpResponseBase
+) -> None:
+    """
+    Let browsers and the CDN cache responses to requests without a session,
+    which are the same for everyone. Browsers revalidate them every time,
+    which is cheap; the CDN keeps them for ARTIFACTS_EDGE_CACHE_MAX_AGE
+    seconds. Responses for logged in users are private and not cached.
+    """
+    if has_session(request):
+        add_never_cache_headers(response)
+        return
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=0,
+        s_maxage=getattr(settings, "ARTIFACTS_EDGE_CACHE_MAX_AGE", 60),
+    )
+
+
+def conditional_response(
+    request: HttpRequest,
+    etag: str,
+    last_modified: datetime | None,
+    build: Callable[[], HttpResponseBase],
+) -> HttpResponseBase:
+    """
+    Answer conditional requests with 304, and only build the response if
+    the client doesn't have it yet.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response: HttpResponseBase | None = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    if response is None:
+        response = build()
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+def artifacts_table_view(request: HttpRequest) -> HttpResponseBase:
+    if has_session(request):
+        response = render_table_page(request)
+    else:
+        # Without a session there is no user to look up, and not touching
+        # the session keeps the response free of Vary: Cookie.
+        request.user = AnonymousUser()
+        etag, last_modified = get_table_validators(request)
+        response = conditional_response(
+            request, etag, last_modified, lambda: render_table_page(request)
+        )
+    patch_edge_cache_headers(request, response)
+    return response
+
+
+def render_table_page(request: HttpRequest) -> HttpResponseBase:
+    filter_form = RevisionFilterForm(request.GET or None)
+    can_manage = can_manage_revisions(request)
+
+    def render_table() -> str:
+        # Before reading the revisions, so that the page gets every change
+        # after them (see live.py).
+        last_event_id = get_last_event_id()
+        targets, matrix, page = get_artifacts_table_data(
+            revisions=filter_form.filter(get_visible_revisions()),
+            target_ids=filter_form.get_target_ids(),
+            after=get_table_cursor(request, "after"),
+            before=get_table_cursor(request, "before"),
+        )
+        return render_to_string(
+            "artifacts/table_body.html",
+            {
+                "targets": targets,
+                "matrix": matrix,
+                "page": page,
+                "can_manage": can_manage,
+                "last_event_id": last_event_id,
+            },
+            request=request,
+        )
 
     context = {
-        "targets": targets,
-        "matrix": matrix,
-        "can_manage": (
-            request.user.is_authenticated
-            and hasattr(request.user, "has_perm")
-            and request.user.has_perm("artifacts.manage_revisions")
+        "filter_form": filter_form,
+        "can_manage": can_manage,
+        "table": mark_safe(
+            get_cached_table(request, can_manage, render_table)
         ),
     }
+    if can_manage:
+        context["janitor_run"] = JanitorRun.objects.order_by("-pk").first()
 
     return render(request, "artifacts/table.html", context)
 
 
+@require_safe
+def live_view(request: HttpRequest) -> StreamingHttpResponse:
+    """
+    Server-sent events with the changed rows of the table (see live.py).
+    Follows the same query string as the table, plus ?column=<target id>
+    for each of its columns and ?since=<event id> it was rendered at.
+    """
+    try:
+        after: int | None = int(
+            request.headers.get("Last-Event-ID") or request.GET["since"]
+        )
+    except (KeyError, ValueError):
+        after = None
+    stream = LiveStream(request.GET, after, can_manage_revisions(request))
+    response = StreamingHttpResponse(
+        # See file_response() for why this depends on the handler.
+        aiter(stream) if isinstance(request, ASGIRequest) else iter(stream),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # Keep nginx from buffering the events.
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def manifest_response(
+    request: HttpRequest,
+    etag: str,
+    last_modified: datetime | None,
+    build: Callable[[], dict[str, Any]],
+) -> HttpResponseBase:
+    """
+    Answer conditional requests with 304, and only build the data if the
+    client doesn't have it yet.
+    """
+    response = conditional_response(
+        request,
+        etag,
+        last_modified,
+        lambda: JsonResponse(
+            build(), json_dumps_params={"separators": (",", ":")}
+        ),
+    )
+    patch_edge_cache_headers(request, response)
+    return response
+
+
+@require_safe
+def revisions_api_view(request: HttpRequest) -> HttpResponseBase:
+    try:
+        revision_fields, artifact_fields = parse_fields(
+            request.GET.get("fields")
+        )
+        limit = int(request.GET.get("limit", DEFAULT_PAGE_SIZE))
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        cursor = request.GET.get("cursor")
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JsonResponse(
+            {"error": f"Missing or invalid parameters: {str(e)}"}, status=400
+        )
+    filter_form = RevisionFilterForm(request.GET)
+    if not filter_form.is_valid():
+        return JsonResponse(
+            {"error": "Invalid filters", "fields": filter_form.errors},
+            status=400,
+        )
+
+    etag, last_modified = get_manifest_validators(request)
+    return manifest_response(
+        request,
+        etag,
+        last_modified,
+        lambda: build_revisions_manifest(
+            request,
+            filter_form.filter(get_visible_revisions()),
+            revision_fields,
+            artifact_fields,
+            limit,
+            after,
+        ),
+    )
+
+
+@require_safe
+def targets_api_view(request: HttpRequest) -> HttpResponseBase:
+    # Small enough to build every time; the ETag is the content digest.
+    data = build_targets_manifest()
+    digest = hashlib.sha256(json.dumps(data).encode()).hexdigest()
+    return manifest_response(request, f'"{digest[:32]}"', None, lambda: data)
+
+
 @permission_required("artifacts.manage_revisions")
 def bulk_manage_view(request: HttpRequest):
     if request.method != "POST":
@@ -202,16 +886,40 @@ def bulk_manage_view(request: HttpRequest):
                     revision_updates[revision_id] = {}
                 revision_updates[revision_id][field] = value == "on"
 
-    # Update revisions
-    count = 0
+    # Update revisions, with one query per combination of flags rather
+    # than per revision.
+    by_flags: dict[tuple[bool, bool, bool], list[int]] = {}
     for revision_id, updates in revision_updates.items():
+        flags = (
+            updates.get("hidden", False),
+            updates.get("deletion", False),
+            updates.get("pinned", False),
+        )
+        by_flags.setdefault(flags, []).append(revision_id)
+    count = len(revision_updates)
+    changed_ids: list[int] = []
+    for (hidden, deletion, pinned), revision_ids in by_flags.items():
         fields = {
-            "is_hidden": updates.get("hidden", False),
-            "is_scheduled_for_deletion": updates.get("deletion", False),
-            "is_pinned": updates.get("pinned", False),
+            "is_hidden": hidden,
+            "is_scheduled_for_deletion": deletion,
+            "is_pinned": pinned,
         }
-        Revision.objects.filter(id=revision_id).update(**fields)
-        count += 1
+        # Only touch rows that change, so updated_at stays meaningful.
+        changing = list(
+            Revision.objects.filter(
+                ~Q(**fields), id__in=revision_ids
+            ).values_list("id", flat=True)
+        )
+        if changing:
+            Revision.objects.filter(id__in=changing).update(
+                **fields, updated_at=timezone.now()
+            )
+            changed_ids.extend(changing)
+    # Pinning and scheduling for deletion change when the janitor deletes
+    # a revision.
+    if changed_ids:
+        Revision.objects.filter(id__in=changed_ids).update_expiry()
+        publish_revision_changes(changed_ids)
 
     messages.success(request, f"Updated {count} revision(s).")
     return redirect("artifacts:table")
@@ -222,8 +930,44 @@ def run_janitor_view(request: HttpRequest):
     if request.method != "POST":
         return redirect("artifacts:table")
 
-    # TODO: Implement actual janitor logic in Phase 5
-    messages.info(
-        request, "Janitor functionality will be implemented in Phase 5."
-    )
+    # A large purge would outlast the request, so the job worker does it.
+    if start_janitor_run(request.user.pk) is None:
+        messages.info(request, "The janitor is already running.")
+    else:
+        messages.success(request, "The janitor will run in the background.")
     return redirect("artifacts:table")
+
+
+def render_janitor_status(run: JanitorRun | None) -> str:
+    return render_to_string(
+        "artifacts/janitor_status.html", {"janitor_run": run}
+    )
+
+
+@require_safe
+@never_cache
+@permission_required("artifacts.manage_revisions", raise_exception=True)
+def janitor_status_view(request: HttpRequest) -> JsonResponse:
+    """
+    The latest janitor run, which the table polls while it is active.
+    """
+    run = JanitorRun.objects.order_by("-pk").first()
+    if run is None:
+        return JsonResponse({"run": None, "html": ""})
+    return JsonResponse({
+        "run": {
+            "id": run.pk,
+            "status": run.status,
+            "is_active": run.is_active,
+            "scanned": run.scanned,
+            "revisions_deleted": run.revisions_deleted,
+            "artifacts_deleted": run.artifacts_deleted,
+            "blobs_deleted": run.blobs_deleted,
+            "bytes_freed": run.bytes_freed,
+            "errors": run.errors,
+            "created_at": run.created_at,
+            "started_at": run.started_at,
+            "finished_at": run.finished_at,
+        },
+        "html": render_janitor_status(run),
+    })
@@ -1,6 +1,47 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import QuerySet
+from django.http import HttpRequest
+from django.utils import timezone
 
-from .models import User
+from .models import Job, User
 
 admin.site.register(User, UserAdmin)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "name",
+        "status",
+        "attempts",
+        "max_attempts",
+        "run_after",
+        "created_at",
+        "finished_at",
+    ]
+    list_filter = ["status", "name"]
+    search_fields = ["name", "last_error"]
+    readonly_fields = [
+        "attempts",
+        "locked_by",
+        "locked_until",
+        "last_error",
+        "created_at",
+        "started_at",
+        "finished_at",
+    ]
+    actions = ["retry_jobs"]
+
+    @admin.action(description="Retry selected jobs")
+    def retry_jobs(
+        self, request: HttpRequest, queryset: QuerySet[Job]
+    ) -> None:
+        count = queryset.exclude(status=Job.Status.RUNNING).update(
+            status=Job.Status.PENDING,
+            attempts=0,
+            run_after=timezone.now(),
+            finished_at=None,
+        )
+        self.message_user(request, f"Queued {count} job(s) for retry")
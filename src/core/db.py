@@ -0,0 +1,72 @@
+"""
+Metrics of database connection reuse.
+
+Connections are either kept open by each thread for CONN_MAX_AGE seconds or
+taken from psycopg 3's pool (see the database settings). In both cases,
+get_connection_stats() describes the connections of this process in the
+same terms: how many are open, how many are in use, how many requests are
+waiting for one, and how many have been created since the process started.
+"""
+
+import threading
+import weakref
+from typing import Any
+
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_lock = threading.Lock()
+# Connections created per database alias, and the (thread-local) wrappers
+# that created them.
+_created: dict[str, int] = {}
+_wrappers: "weakref.WeakSet[BaseDatabaseWrapper]" = weakref.WeakSet()
+
+
+@receiver(connection_created)
+def count_connection(
+    sender: Any, connection: BaseDatabaseWrapper, **kwargs: Any
+) -> None:
+    with _lock:
+        _created[connection.alias] = _created.get(connection.alias, 0) + 1
+        _wrappers.add(connection)
+
+
+def get_connection_stats() -> dict[str, dict[str, Any]]:
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is not None:
+            pool_stats = pool.get_stats()
+            size = pool_stats.get("pool_size", 0)
+            available = pool_stats.get("pool_available", 0)
+            stats[alias] = {
+                "mode": "pool",
+                "open": size,
+                "in_use": size - available,
+                "waiting": pool_stats.get("requests_waiting", 0),
+                "created": pool_stats.get("connections_num", 0),
+                "max_size": pool.max_size,
+            }
+            continue
+
+        # Without a pool, every open connection belongs to a thread, whether
+        # or not it is running a query right now.
+        with _lock:
+            open_connections = sum(
+                1
+                for wrapper in _wrappers
+                if wrapper.alias == alias and wrapper.connection is not None
+            )
+            created = _created.get(alias, 0)
+        stats[alias] = {
+            "mode": "persistent"
+            if connections[alias].settings_dict["CONN_MAX_AGE"] != 0
+            else "per-request",
+            "open": open_connections,
+            "in_use": open_connections,
+            "waiting": 0,
+            "created": created,
+        }
+    return stats
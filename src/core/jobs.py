@@ -0,0 +1,183 @@
+"""
+A small job queue on top of the database.
+
+Handlers are registered under a name with @register_job, and work is queued
+with enqueue_job(). Queueing inside a transaction is atomic with it: the job
+only becomes visible to workers once the transaction commits, and is gone
+if it rolls back. Jobs are run by `manage.py run_jobs`. Failed jobs are
+retried with exponential backoff up to max_attempts times. Jobs of a worker
+that died are picked up again once their lock times out.
+"""
+
+import logging
+import traceback
+from collections.abc import Callable
+from datetime import timedelta
+from typing import Any
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[..., None]
+
+_handlers: dict[str, JobHandler] = {}
+
+
+def register_job(name: str) -> Callable[[JobHandler], JobHandler]:
+    """
+    Register the decorated function as the handler for jobs of the given
+    name. The job payload is passed to it as keyword arguments.
+    """
+
+    def decorator(handler: JobHandler) -> JobHandler:
+        if name in _handlers and _handlers[name] is not handler:
+            raise ValueError(f"Job {name!r} is already registered")
+        _handlers[name] = handler
+        return handler
+
+    return decorator
+
+
+def get_job_handler(name: str) -> JobHandler | None:
+    return _handlers.get(name)
+
+
+def enqueue_job(
+    name: str, max_attempts: int | None = None, **payload: Any
+) -> Job:
+    if name not in _handlers:
+        raise ValueError(f"Unknown job {name!r}")
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=(
+            max_attempts
+            if max_attempts is not None
+            else getattr(settings, "JOBS_MAX_ATTEMPTS", 3)
+        ),
+    )
+
+
+def claim_jobs(worker_id: str, limit: int = 1) -> list[Job]:
+    """
+    Lock up to limit jobs that are due for this worker. Concurrent workers
+    skip each other's rows instead of waiting for them.
+    """
+    now = timezone.now()
+    lock_timeout = getattr(settings, "JOBS_LOCK_TIMEOUT", 3600)
+
+    with transaction.atomic():
+        jobs = list(
+            Job.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status=Job.Status.PENDING, run_after__lte=now)
+                | Q(status=Job.Status.RUNNING, locked_until__lt=now)
+            )
+            .order_by("run_after", "pk")[:limit]
+        )
+        if not jobs:
+            return []
+
+        locked_until = now + timedelta(seconds=lock_timeout)
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=Job.Status.RUNNING,
+            attempts=F("attempts") + 1,
+            locked_by=worker_id,
+            locked_until=locked_until,
+            started_at=now,
+        )
+        for job in jobs:
+            job.status = Job.Status.RUNNING
+            job.attempts += 1
+            job.locked_by = worker_id
+            job.locked_until = locked_until
+            job.started_at = now
+    return jobs
+
+
+def get_retry_delay(attempts: int) -> timedelta:
+    base_delay = getattr(settings, "JOBS_RETRY_DELAY", 30)
+    return timedelta(seconds=base_delay * 2 ** max(0, attempts - 1))
+
+
+def run_job(job: Job) -> bool:
+    """
+    Run a claimed job and record the outcome. Returns whether it succeeded.
+    """
+    # Only the worker that still holds the lock may record the outcome.
+    claimed = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    handler = get_job_handler(job.name)
+    if handler is None:
+        claimed.update(
+            status=Job.Status.FAILED,
+            last_error=f"No handler registered for {job.name!r}",
+            locked_until=None,
+            finished_at=timezone.now(),
+        )
+        logger.error(f"No handler registered for job {job}")
+        return False
+
+    try:
+        handler(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            claimed.update(
+                status=Job.Status.PENDING,
+                run_after=timezone.now() + get_retry_delay(job.attempts),
+                last_error=error,
+                locked_until=None,
+            )
+            logger.warning(f"Job {job} failed, will retry:\n{error}")
+        else:
+            claimed.update(
+                status=Job.Status.FAILED,
+                last_error=error,
+                locked_until=None,
+                finished_at=timezone.now(),
+            )
+            logger.error(f"Job {job} failed permanently:\n{error}")
+        return False
+
+    claimed.update(
+        status=Job.Status.SUCCEEDED,
+        locked_until=None,
+        finished_at=timezone.now(),
+    )
+    return True
+
+
+def run_pending_jobs(worker_id: str, limit: int | None = None) -> int:
+    """
+    Run due jobs one by one until there are none left (or limit have been
+    run). Returns the number of jobs run.
+    """
+    count = 0
+    while limit is None or count < limit:
+        jobs = claim_jobs(worker_id)
+        if not jobs:
+            break
+        run_job(jobs[0])
+        count += 1
+    return count
+
+
+def purge_finished_jobs() -> int:
+    """
+    Delete succeeded jobs older than JOBS_KEEP_FINISHED_DAYS. Failed jobs
+    are kept for inspection in the admin.
+    """
+    cutoff = timezone.now() - timedelta(
+        days=getattr(settings, "JOBS_KEEP_FINISHED_DAYS", 7)
+    )
+    deleted, _ = Job.objects.filter(
+        status=Job.Status.SUCCEEDED, finished_at__lt=cutoff
+    ).delete()
+    return deleted
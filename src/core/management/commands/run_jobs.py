@@ -0,0 +1,86 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import close_old_connections, connection
+
+from core.jobs import purge_finished_jobs, run_pending_jobs
+
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the job queue"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=getattr(settings, "JOBS_CONCURRENCY", 2),
+            help="Number of jobs to run in parallel",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=getattr(settings, "JOBS_POLL_INTERVAL", 1.0),
+            help="Seconds to wait between polls when the queue is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no more jobs are due instead of polling",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        concurrency = max(1, options["concurrency"])
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        stop = threading.Event()
+
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda *_: stop.set())
+
+        def work(index: int) -> int:
+            worker_id = f"{worker_name}:{index}"
+            count = 0
+            last_purge = time.monotonic()
+            while not stop.is_set():
+                ran = run_pending_jobs(worker_id, limit=100)
+                count += ran
+                if ran:
+                    continue
+                if options["once"]:
+                    break
+                if (
+                    index == 0
+                    and time.monotonic() > last_purge + PURGE_INTERVAL
+                ):
+                    purge_finished_jobs()
+                    last_purge = time.monotonic()
+                close_old_connections()
+                stop.wait(options["poll_interval"])
+            return count
+
+        def work_in_thread(index: int) -> int:
+            try:
+                return work(index)
+            finally:
+                connection.close()
+
+        self.stdout.write(
+            f"Running jobs as {worker_name} with {concurrency} thread(s)"
+        )
+        purge_finished_jobs()
+        if concurrency == 1:
+            total = work(0)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                total = sum(executor.map(work_in_thread, range(concurrency)))
+
+        self.stdout.write(self.style.SUCCESS(f"Ran {total} job(s)"))
@@ -0,0 +1,43 @@
+"""Tests for database connection metrics."""
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .db import get_connection_stats
+
+User = get_user_model()
+
+
+class ConnectionStatsTests(TestCase):
+    def test_new_connections_are_counted(self):
+        before = get_connection_stats()["default"]
+        self.assertIn(before["mode"], ("persistent", "per-request"))
+
+        wrapper = connections.create_connection("default")
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+
+        after = get_connection_stats()["default"]
+        self.assertEqual(after["created"], before["created"] + 1)
+        self.assertGreaterEqual(after["open"], 1)
+        self.assertEqual(after["waiting"], 0)
+
+    def test_status_requires_staff_or_token(self):
+        url = reverse("core:db_status")
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        with override_settings(MONITORING_TOKEN="secret"):
+            response = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("default", response.json()["databases"])
+            response = self.client.get(url, HTTP_AUTHORIZATION="Bearer no")
+            self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(
+            User.objects.create_user(username="staff", is_staff=True)
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
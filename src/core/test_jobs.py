@@ -0,0 +1,124 @@
+"""Tests for the background job queue."""
+
+import io
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.jobs import (
+    claim_jobs,
+    enqueue_job,
+    purge_finished_jobs,
+    register_job,
+    run_job,
+    run_pending_jobs,
+)
+from core.models import Job
+
+calls: list[dict] = []
+
+
+@register_job("core.tests.record")
+def record(**payload):
+    calls.append(payload)
+
+
+@register_job("core.tests.fail")
+def fail(**payload):
+    raise RuntimeError("job failed")
+
+
+class JobQueueTestCase(TestCase):
+    """Test cases for the job queue."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueued_job_runs_with_payload(self):
+        """Jobs are run once with their payload as keyword arguments."""
+        job = enqueue_job("core.tests.record", artifact_id=1)
+
+        self.assertEqual(run_pending_jobs("worker"), 1)
+        self.assertEqual(calls, [{"artifact_id": 1}])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(run_pending_jobs("worker"), 0)
+
+    def test_unknown_job_cannot_be_enqueued(self):
+        """Typos in job names fail at enqueue time, not in the worker."""
+        with self.assertRaises(ValueError):
+            enqueue_job("core.tests.missing")
+
+    def test_job_is_dropped_with_rolled_back_transaction(self):
+        """Jobs are only queued if the enqueuing transaction commits."""
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                enqueue_job("core.tests.record")
+                raise RuntimeError
+
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_RETRY_DELAY=10)
+    def test_failed_job_is_retried_with_backoff(self):
+        """Failures are retried later until max_attempts is reached."""
+        job = enqueue_job("core.tests.fail", max_attempts=2)
+
+        self.assertEqual(run_pending_jobs("worker"), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.PENDING)
+        self.assertIn("job failed", job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(run_pending_jobs("worker"), 0)
+
+        Job.objects.update(run_after=timezone.now())
+        self.assertEqual(run_pending_jobs("worker"), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_job_of_dead_worker_is_reclaimed(self):
+        """Running jobs whose lock timed out are picked up again."""
+        enqueue_job("core.tests.record")
+        (job,) = claim_jobs("dead-worker")
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        (reclaimed,) = claim_jobs("worker")
+        self.assertEqual(reclaimed.pk, job.pk)
+        self.assertEqual(reclaimed.attempts, 2)
+
+        # The dead worker can no longer record an outcome.
+        run_job(job)
+        reclaimed.refresh_from_db()
+        self.assertEqual(reclaimed.status, Job.Status.RUNNING)
+        self.assertEqual(calls, [{}])
+
+    def test_run_jobs_command(self):
+        """run_jobs --once drains the queue and exits."""
+        enqueue_job("core.tests.record", n=1)
+        enqueue_job("core.tests.record", n=2)
+
+        out = io.StringIO()
+        call_command("run_jobs", "--once", "--concurrency=1", stdout=out)
+        self.assertEqual(calls, [{"n": 1}, {"n": 2}])
+        self.assertIn("Ran 2 job(s)", out.getvalue())
+
+    @override_settings(JOBS_KEEP_FINISHED_DAYS=1)
+    def test_purge_keeps_failed_jobs(self):
+        """Only old succeeded jobs are purged."""
+        old = timezone.now() - timedelta(days=2)
+        Job.objects.create(
+            name="core.tests.record",
+            status=Job.Status.SUCCEEDED,
+            finished_at=old,
+        )
+        Job.objects.create(
+            name="core.tests.fail", status=Job.Status.FAILED, finished_at=old
+        )
+
+        self.assertEqual(purge_finished_jobs(), 1)
+        self.assertEqual(Job.objects.get().status, Job.Status.FAILED)
@@ -1,5 +1,12 @@
-from django.http import HttpRequest, HttpResponse
+import hmac
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+from .db import get_connection_stats
 
 
 def home(request: HttpRequest) -> HttpResponse:
@@ -8,3 +15,22 @@ def home(request: HttpRequest) -> HttpResponse:
         "is_authenticated": request.user.is_authenticated,
     }
     return render(request, "core/home.html", context)
+
+
+def has_monitoring_token(request: HttpRequest) -> bool:
+    token = settings.MONITORING_TOKEN
+    return bool(token) and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    )
+
+
+@require_safe
+@never_cache
+def db_status(request: HttpRequest) -> JsonResponse:
+    """
+    Database connection usage of the worker process that serves the
+    request. Every worker has its own connections.
+    """
+    if not (has_monitoring_token(request) or request.user.is_staff):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    return JsonResponse({"databases": get_connection_stats()})
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 from typing import Any
 
@@ -94,6 +95,53 @@ WSGI_APPLICATION = "lczero_dev_portal.wsgi.application"
 
 DATABASES = {"default": env.db()}
 
+# Connection reuse (see core/db.py). By default, each worker thread keeps
+# its connection open for DATABASE_CONN_MAX_AGE seconds and checks that it
+# still works before reusing it in a new request. DATABASE_POOL=True uses
+# psycopg 3's connection pool instead (pip install "psycopg[binary,pool]"),
+# which suits ASGI, where threads come and go. DATABASE_PGBOUNCER=True makes
+# either safe behind pgbouncer in transaction mode.
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = env.bool(
+    "DATABASE_CONN_HEALTH_CHECKS", True
+)
+if env.bool("DATABASE_POOL", False):
+    # Connections go back to the pool after each request instead.
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": env.int("DATABASE_POOL_MIN_SIZE", 2),
+        "max_size": env.int("DATABASE_POOL_MAX_SIZE", 10),
+        # How long a request waits for a connection before failing.
+        "timeout": env.float("DATABASE_POOL_TIMEOUT", 10.0),
+        "max_idle": env.float("DATABASE_POOL_MAX_IDLE", 600.0),
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = env.int("DATABASE_CONN_MAX_AGE", 60)
+if env.bool("DATABASE_PGBOUNCER", False):
+    # In transaction mode, pgbouncer may run each transaction on another
+    # server connection, so nothing may outlive a transaction: no
+    # server-side cursors (QuerySet.iterator() outside of transactions)
+    # and no prepared statements (psycopg 3 prepares frequent queries).
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+    # Django uses psycopg 3 when it is installed; psycopg2 doesn't prepare.
+    if find_spec("psycopg") is not None:
+        DATABASES["default"].setdefault("OPTIONS", {})["prepare_threshold"] = (
+            None
+        )
+
+# Bearer token for monitoring endpoints such as /status/db/, which staff
+# users can see without it. Unset disables token access.
+MONITORING_TOKEN = env.str("MONITORING_TOKEN", default="")
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Shared by all worker processes. The default database cache needs no extra
+# services (create its table with `manage.py createcachetable`); set
+# CACHE_URL to e.g. filecache:///var/tmp/django_cache or a redis:// URL to
+# use something else.
+
+CACHES = {"default": env.cache("CACHE_URL", default="dbcache://django_cache")}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -195,6 +243,77 @@ ARTIFACTS_PR_RETENTION_DAYS = env.int("ARTIFACTS_PR_RETENTION_DAYS", 7)
 ARTIFACTS_MAX_FILE_SIZE = env.int(
     "ARTIFACTS_MAX_FILE_SIZE", 1024 * 1024 * 1024
 )  # 1GB
+ARTIFACTS_UPLOAD_BUFFER_SIZE = env.int(
+    "ARTIFACTS_UPLOAD_BUFFER_SIZE", 4 * 1024 * 1024
+)
+ARTIFACTS_UPLOAD_SESSION_TTL_HOURS = env.int(
+    "ARTIFACTS_UPLOAD_SESSION_TTL_HOURS", 24
+)
+# Internal nginx location that the download view hands files to with
+# X-Accel-Redirect. Without it, Django serves the files itself.
+ARTIFACTS_X_ACCEL_REDIRECT_PREFIX = env.str(
+    "ARTIFACTS_X_ACCEL_REDIRECT_PREFIX", ""
+)
+# Download counts are buffered per process and written in batches.
+ARTIFACTS_DOWNLOAD_COUNT_FLUSH_SIZE = env.int(
+    "ARTIFACTS_DOWNLOAD_COUNT_FLUSH_SIZE", 100
+)
+ARTIFACTS_DOWNLOAD_COUNT_FLUSH_INTERVAL = env.int(
+    "ARTIFACTS_DOWNLOAD_COUNT_FLUSH_INTERVAL", 10
+)
+# Upload admission control, shared by all workers (0 = no limit). Off by
+# default, since uploaders have to retry on 429. To turn it on, set e.g.
+# ARTIFACTS_UPLOAD_MAX_CONCURRENT=4 (below the number of workers) and
+# ARTIFACTS_UPLOAD_MAX_INFLIGHT_BYTES=4294967296.
+ARTIFACTS_UPLOAD_MAX_CONCURRENT = env.int("ARTIFACTS_UPLOAD_MAX_CONCURRENT", 0)
+ARTIFACTS_UPLOAD_MAX_INFLIGHT_BYTES = env.int(
+    "ARTIFACTS_UPLOAD_MAX_INFLIGHT_BYTES", 0
+)
+ARTIFACTS_UPLOAD_MAX_CONCURRENT_PER_TOKEN = env.int(
+    "ARTIFACTS_UPLOAD_MAX_CONCURRENT_PER_TOKEN", 0
+)
+ARTIFACTS_UPLOAD_MAX_INFLIGHT_BYTES_PER_TOKEN = env.int(
+    "ARTIFACTS_UPLOAD_MAX_INFLIGHT_BYTES_PER_TOKEN", 0
+)
+ARTIFACTS_UPLOAD_RETRY_AFTER = env.int("ARTIFACTS_UPLOAD_RETRY_AFTER", 15)
+ARTIFACTS_UPLOAD_SLOT_TIMEOUT = env.int("ARTIFACTS_UPLOAD_SLOT_TIMEOUT", 3600)
+# Precompressed variants are only kept if original/compressed >= this.
+ARTIFACTS_PRECOMPRESS_MIN_RATIO = env.float(
+    "ARTIFACTS_PRECOMPRESS_MIN_RATIO", 1.1
+)
+# Serve uploads with the async views; enable when running under ASGI.
+ARTIFACTS_ASYNC_VIEWS = env.bool("ARTIFACTS_ASYNC_VIEWS", False)
+# Binary patches between builds, made with `zstd --patch-from` on demand and
+# cached up to this many bytes.
+ARTIFACTS_DELTA_CACHE_SIZE = env.int(
+    "ARTIFACTS_DELTA_CACHE_SIZE", 2 * 1024 * 1024 * 1024
+)
+ARTIFACTS_DELTA_LEVEL = env.int("ARTIFACTS_DELTA_LEVEL", 19)
+# How long the rendered artifacts table is cached (see table_cache.py). It
+# is invalidated on changes; this only bounds how stale download counts and
+# days until cleanup get. 0 disables the cache.
+ARTIFACTS_TABLE_CACHE_TIMEOUT = env.int("ARTIFACTS_TABLE_CACHE_TIMEOUT", 60)
+# How long the CDN may serve the table and the JSON API to visitors without
+# a session before revalidating.
+ARTIFACTS_EDGE_CACHE_MAX_AGE = env.int("ARTIFACTS_EDGE_CACHE_MAX_AGE", 60)
+# Live table updates (see live.py). Under ASGI, streams poll the change log
+# every POLL_INTERVAL seconds for up to STREAM_TIMEOUT seconds. Under WSGI,
+# browsers reconnect every RETRY seconds instead.
+ARTIFACTS_LIVE_POLL_INTERVAL = env.float("ARTIFACTS_LIVE_POLL_INTERVAL", 1.0)
+ARTIFACTS_LIVE_STREAM_TIMEOUT = env.int("ARTIFACTS_LIVE_STREAM_TIMEOUT", 60)
+ARTIFACTS_LIVE_RETRY = env.float("ARTIFACTS_LIVE_RETRY", 5.0)
+# The janitor (see janitor.py) deletes this many revisions per transaction
+# and unlinks their files with this many threads.
+ARTIFACTS_JANITOR_BATCH_SIZE = env.int("ARTIFACTS_JANITOR_BATCH_SIZE", 500)
+ARTIFACTS_JANITOR_PARALLELISM = env.int("ARTIFACTS_JANITOR_PARALLELISM", 8)
+
+# Background job queue (see core/jobs.py and `manage.py run_jobs`)
+JOBS_CONCURRENCY = env.int("JOBS_CONCURRENCY", 2)
+JOBS_POLL_INTERVAL = env.float("JOBS_POLL_INTERVAL", 1.0)
+JOBS_MAX_ATTEMPTS = env.int("JOBS_MAX_ATTEMPTS", 3)
+JOBS_RETRY_DELAY = env.int("JOBS_RETRY_DELAY", 30)  # doubles per attempt
+JOBS_LOCK_TIMEOUT = env.int("JOBS_LOCK_TIMEOUT", 3600)
+JOBS_KEEP_FINISHED_DAYS = env.int("JOBS_KEEP_FINISHED_DAYS", 7)
 
 # Logging configuration
 LOGGING: dict[str, Any] = {